@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   PyNAM -- Python Neural Associative Memory Simulator and Evaluator
+#   Copyright (C) 2015 Andreas Stöckel
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Capacity planning tool. Computes a table containing the optimal data
+parameters, the expected number of false positives and the expected
+information for ranges of memory sizes and writes it to a ".npz" file. The
+table can be loaded with pynam.entropy.load_optimal_parameter_table, after
+which DataParameters looks up automatically chosen parameters in the table.
+"""
+
+import argparse
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+import pynam.entropy
+
+def parse_range(s):
+    """
+    Parses a range given as "MIN:MAX[:STEP]" (MAX inclusive) or a single value.
+    """
+    parts = map(int, s.split(":"))
+    if len(parts) == 1:
+        return [parts[0]]
+    if len(parts) > 3 or parts[0] <= 0 or parts[1] < parts[0]:
+        raise argparse.ArgumentTypeError("Invalid range \"" + s + "\"")
+    step = parts[2] if len(parts) == 3 else 1
+    if step <= 0:
+        raise argparse.ArgumentTypeError("Invalid range \"" + s + "\"")
+    return range(parts[0], parts[1] + 1, step)
+
+def compute_chunk(args):
+    n_bits_in, n_bits_out, n_ones, square = args
+    return pynam.entropy.optimal_parameter_table(n_bits_in, n_bits_out,
+            n_ones=n_ones, square=square)
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Computes a table of optimal data parameters")
+    parser.add_argument("target", help="output file (.npz)")
+    parser.add_argument("--bits-in", type=parse_range, required=True,
+            help="input bit counts, either a value or MIN:MAX[:STEP]")
+    parser.add_argument("--bits-out", type=parse_range, default=None,
+            help="output bit counts, defaults to the input bit counts")
+    parser.add_argument("--square", action="store_true",
+            help="only include memories with as many input as output bits")
+    parser.add_argument("--ones", type=int, default=16,
+            help="maximum number of ones for which sample counts are "
+                 + "tabulated")
+    parser.add_argument("--processes", type=int, default=None,
+            help="number of worker processes, defaults to the number of CPUs")
+    args = parser.parse_args()
+    if args.bits_out is None:
+        args.bits_out = args.bits_in
+
+    # Distribute the input bit counts over the worker processes
+    processes = (multiprocessing.cpu_count() if args.processes is None
+            else args.processes)
+    n_chunks = max(1, min(len(args.bits_in), 4 * processes))
+    jobs = [(list(chunk), args.bits_out, args.ones, args.square)
+            for chunk in np.array_split(args.bits_in, n_chunks)
+            if len(chunk) > 0]
+
+    t = time.time()
+    if processes <= 1 or len(jobs) == 1:
+        tables = map(compute_chunk, jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        tables = pool.map(compute_chunk, jobs)
+        pool.close()
+        pool.join()
+    table = dict((key, np.concatenate([tbl[key] for tbl in tables]))
+            for key in tables[0])
+
+    pynam.entropy.save_optimal_parameter_table(args.target, table)
+    sys.stderr.write("Wrote " + str(len(table["keys"])) + " entries to \""
+            + args.target + "\" in " + str(round(time.time() - t, 2)) + "s\n")
+
+if __name__ == "__main__":
+    main()
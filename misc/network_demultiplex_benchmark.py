@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   PyNAM -- Python Neural Associative Memory Simulator and Evaluator
+#   Copyright (C) 2015 Andreas Stöckel
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the time needed to demultiplex the output of a network pool: flatten
+the input spikes, match the output spikes to samples and split the result
+into the individual time multiplexed analysis instances. By default a pool with
+10^7 output spikes is simulated.
+"""
+
+import time
+import numpy as np
+
+# Include the PyNAM folder
+import sys
+import os
+import __main__
+sys.path.append(os.path.join(os.path.dirname(__main__.__file__), ".."))
+
+from pynam.network import NetworkInstance
+
+n_neurons = 1000 # Number of output neurons in the pool
+n_samples = 10000 # Number of samples per neuron
+n_splits = 10 # Number of time multiplexed analysis instances
+time_window = 100.0 # Time between two samples
+if len(sys.argv) > 1:
+    n_samples = int(sys.argv[1])
+
+# Each input neuron spikes once at the beginning of each sample, each output
+# neuron once shortly afterwards
+t = np.arange(n_samples) * time_window
+input_times = [t.tolist() for _ in xrange(n_neurons)]
+input_indices = [range(n_samples) for _ in xrange(n_neurons)]
+output_times = [(t + 1.0 + np.random.uniform(0.0, 5.0, n_samples)).tolist()
+        for _ in xrange(n_neurons)]
+input_split = list(np.linspace(0, n_samples, n_splits + 1,
+        dtype=np.int64)[1:])
+print("Benchmarking " + str(n_neurons * n_samples) + " spikes")
+
+def measure(name, f):
+    t0 = time.time()
+    res = f()
+    print(name + ": " + str(round(time.time() - t0, 3)) + "s")
+    return res
+
+measure("flatten", lambda: NetworkInstance.flatten(input_times, input_indices))
+_, output_indices = measure("match", lambda: NetworkInstance.match_static(
+        input_times, input_indices, output_times))
+measure("split", lambda: NetworkInstance.split_all(output_times,
+        output_indices, input_split))
@@ -23,6 +23,66 @@ save BiNAM matrices.
 
 import numpy as np
 
+def pack(mat):
+    """
+    Converts a dense binary matrix with one sample per row into the packed row
+    representation used by the BinaryMatrix class: each row is stored as a
+    sequence of 64-bit integers, bit j of the row is stored in bit (j % 64) of
+    the (j // 64)-th integer. All entries that do not equal "0" are
+    interpreted as "1". The bits are accumulated directly in the packed
+    matrix, one bit position of all integers at a time, so no intermediate
+    array larger than the packed matrix is created.
+
+    :param mat: dense matrix (or single vector) that should be packed.
+    :return: a (N, ceil(n / 64)) numpy array of 64-bit unsigned integers.
+    """
+    mat = np.atleast_2d(np.asarray(mat))
+    N, n = mat.shape
+    w = BinaryMatrix.int_width
+    res = np.zeros((N, (n + w - 1) // w), dtype=BinaryMatrix.int_type)
+    for b in xrange(min(w, n)):
+        # Columns b, b + 64, b + 128, ... are stored in bit b
+        cols = mat[:, b::w] != 0
+        res[:, :cols.shape[1]] |= np.left_shift(
+                cols.astype(BinaryMatrix.int_type), BinaryMatrix.int_type(b))
+    return res
+
+def unpack(arr, n_cols):
+    """
+    Inverse of the "pack" function. Converts a packed matrix back into a dense
+    uint8 matrix with n_cols columns.
+
+    :param arr: packed matrix as returned by "pack".
+    :param n_cols: number of columns (bits) in the unpacked matrix.
+    """
+    arr = np.atleast_2d(np.asarray(arr, dtype=BinaryMatrix.int_type))
+    N = arr.shape[0]
+    w = BinaryMatrix.int_width
+    res = np.zeros((N, n_cols), dtype=np.uint8)
+    for b in xrange(min(w, n_cols)):
+        # Bit b of each integer holds the columns b, b + 64, b + 128, ...
+        n_words = (n_cols - b + w - 1) // w
+        res[:, b::w] = np.bitwise_and(np.right_shift(arr[:, :n_words],
+                BinaryMatrix.int_type(b)), BinaryMatrix.int_type(1))
+    return res
+
+# Number of set bits for each possible byte value
+_popcount_table_ = np.array([bin(i).count("1") for i in xrange(256)],
+        dtype=np.uint8)
+
+def popcount(arr):
+    """
+    Counts the number of set bits in each row of a packed matrix as returned by
+    "pack".
+
+    :param arr: packed matrix (or single packed vector).
+    :return: an int64 array containing the number of set bits per row.
+    """
+    arr = np.atleast_2d(np.asarray(arr, dtype=BinaryMatrix.int_type))
+    N = arr.shape[0]
+    counts = _popcount_table_[np.ascontiguousarray(arr).view(np.uint8)]
+    return np.sum(counts.reshape((N, -1)), axis=1, dtype=np.int64)
+
 class BinaryMatrix:
     """
     Uses a dense numpy array to represent a matrix with binary values. For
@@ -215,6 +275,19 @@ class BinaryMatrix:
                     idx = idx + 1
                 self.arr[i][j] = cell
 
+    def set_packed(self, arr, cols):
+        """
+        Loads the matrix content from a packed matrix as returned by the "pack"
+        function without converting it.
+
+        :param arr: packed matrix, one row per matrix row.
+        :param cols: number of columns (bits) stored in each row.
+        """
+        arr = np.atleast_2d(np.asarray(arr, dtype=self.int_type))
+        self.resize(arr.shape[0], cols)
+        assert(arr.shape[1] == self.n_cols_store)
+        self.arr = np.array(arr, dtype=self.int_type)
+
     def get(self, return_list=False):
         """
         Returns the matrix content as a numpy array or a list of lists
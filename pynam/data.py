@@ -22,18 +22,50 @@ Contains a "generate" function which generates a set of training vectors that
 can be used to train a BiNAM.
 """
 
+import binam
 import entropy
 import utils
 import math
+import multiprocessing
 import numpy as np
 
 #
 # Classes
 #
 
-class PermutationTrieNode:
+# Maximum value of a permutation counter
+PERMUTATION_MAX = 0x7FFFFFFF
+
+def _max_permutations(idx, remaining, ptotal):
+    """
+    Returns the initial permutation counters of a trie node with the given index
+    and remaining sequence length as uint32 array, where ptotal is the total
+    permutation count of the parent node.
+    """
+
+    # If the parent choices in the parent node is larger than the maximum
+    # sample count, we don't have to be that exact
+    vmax = PERMUTATION_MAX
+    lmax = 9.33
+
+    # Fetch "i choose (remaining - 1)" for all children from the shared
+    # binomial table
+    r = remaining - 1
+    perms = entropy.binom_table(idx, r)
+    if r > 0:
+        ns = np.arange(r + 1, idx)
+        if ptotal >= vmax:
+            # Check the lower bound nCr >= (n/r)^r
+            lmin_val = r * np.log(ns / float(r))
+            perms[ns[lmin_val > lmax]] = vmax
+        if r >= 100:
+            # For large r, values above exp(lmax) count as saturated
+            perms[ns[perms[ns] > math.exp(lmax)]] = vmax
+    return np.array(perms, dtype=np.uint32)
+
+class PermutationTrie:
     """
-    Class used internally by the "generate" method.
+    Permutation trie used internally by the "generate" method.
 
     The idea behind the permutation tree is the following: The tree stores
     sequences of bit indices that were set to one, the linear sequences are
@@ -47,79 +79,118 @@ class PermutationTrieNode:
     allows to prevent double permutations from being generated, as paths
     which have no permutations left, simply do not need to be persued any
     further.
+
+    Nodes are referred to by integer ids and stored in flat, preallocated numpy
+    arrays which grow by doubling. The permutation counters of all nodes live
+    in a single counter array, node i owns the slice starting at offs[i] of
+    length idx[i]. A parallel array stores the id of the corresponding child
+    node or -1 if the child has not been materialised yet. Nodes are only
+    created once they are fetched, the initial counters are recomputed from the
+    shared binomial table instead of being stored for each node, and leaf
+    nodes (no remaining bits) are never materialised at all.
     """
 
-    def __init__(self, idx, remaining, parent = None):
+    # Id of the root node
+    ROOT = 0
+
+    def __init__(self, n_bits, n_ones, capacity=256):
         """
-        Constructor of the PermutationTrieNode class.
-
-        :param idx: index of this node within the parent node. As this node can
-        only contain children with smaller indices, idx also corresponds to the
-        length of the child list.
-        :param remaining: remaining length of the sequence from this node on
-        (number of bits that still have to be set).
-        :param parent: parent node into which this node should be inserted/
-        from which it should be fetched. If parent is None a new root node is
-        generated.
+        Constructor of the PermutationTrie class, creates the root node.
+
+        :param n_bits: number of bits in each sequence (index of the root).
+        :param n_ones: length of each sequence.
+        :param capacity: initial number of nodes space is reserved for.
         """
+        self.n_nodes = 0
+        self.n_slots = 0
+        self.idx = np.zeros(capacity, dtype=np.int32)
+        self.remaining = np.zeros(capacity, dtype=np.int32)
+        self.offs = np.zeros(capacity, dtype=np.int64)
+        self.ptotal = np.zeros(capacity, dtype=np.int64)
+        self.total = np.zeros(capacity, dtype=np.int64)
+        self.counters = np.zeros(max(capacity, n_bits), dtype=np.uint32)
+        self.children = np.zeros(len(self.counters), dtype=np.int32)
+        self._create(n_bits, n_ones, PERMUTATION_MAX)
+
+    @staticmethod
+    def _grow(arr, size, fill=0):
+        res = np.empty(size, dtype=arr.dtype)
+        res[:len(arr)] = arr
+        res[len(arr):] = fill
+        return res
 
-        def ncr(n, r):
-            # Handle special cases
-            if (n < r) or (r < 0) or (n < 0):
-                return 0
-            if (n == r) or (r == 0):
-                return 1
-
-            # If the parent choices in the parent node is larger than the
-            # maximum sample count, we don't have to be that exact
-            vmax = 0x7FFFFFFF
-            lmax = 9.33
-            ptotal = vmax if parent is None else parent.total
-            if ptotal >= vmax:
-                # Check the lower bound nCr >= (n/r)^r
-                lmin_val = r * math.log(n / float(r))
-                if (lmin_val > lmax):
-                    return vmax
-
-            # Use the lnncrr function to compute ncr (faster for large r)
-            if r < 100:
-                return entropy.ncr(n, r)
-            res = entropy.lnncrr(n, r)
-            if res > lmax:
-                return vmax
-            return int(round(math.exp(res)))
-
-        self.idx = idx;
-        self.max_permutations = np.fromiter((ncr(i, remaining - 1)
-                for i in xrange(idx)), dtype=np.uint32, count=idx)
-        self.total = min(0x7FFFFFFF, np.sum(self.max_permutations))
-        self.permutations = self.max_permutations.copy()
-        self.children = {}
-        self.parent = parent
-        self.remaining = remaining
-
-    def fetch(self, idx):
+    def _create(self, idx, remaining, ptotal):
+        # Make sure there is space for the new node and its counters
+        if self.n_nodes >= len(self.idx):
+            size = 2 * len(self.idx)
+            self.idx = self._grow(self.idx, size)
+            self.remaining = self._grow(self.remaining, size)
+            self.offs = self._grow(self.offs, size)
+            self.ptotal = self._grow(self.ptotal, size)
+            self.total = self._grow(self.total, size)
+        if self.n_slots + idx > len(self.counters):
+            size = max(self.n_slots + idx, 2 * len(self.counters))
+            self.counters = self._grow(self.counters, size)
+            self.children = self._grow(self.children, size)
+
+        # Initialize the node
+        node = self.n_nodes
+        perms = _max_permutations(idx, remaining, ptotal)
+        self.idx[node] = idx
+        self.remaining[node] = remaining
+        self.offs[node] = self.n_slots
+        self.ptotal[node] = ptotal
+        self.total[node] = min(PERMUTATION_MAX, np.sum(perms))
+        self.counters[self.n_slots:(self.n_slots + idx)] = perms
+        self.children[self.n_slots:(self.n_slots + idx)] = -1
+        self.n_nodes = self.n_nodes + 1
+        self.n_slots = self.n_slots + idx
+        return node
+
+    def permutations(self, node):
         """
-        Fetches or creates the child node with the given index.
+        Returns a view on the permutation counters of the given node.
         """
-        if (not idx in self.children):
-            self.children[idx] = PermutationTrieNode(
-                    idx, self.remaining - 1, self)
-        return self.children[idx]
+        o = self.offs[node]
+        return self.counters[o:(o + self.idx[node])]
 
-    def decrement_permutation(self, idx):
+    def fetch(self, node, idx):
+        """
+        Fetches or creates the child node with the given index, returns its id.
+        Returns -1 for leaf nodes, which are not materialised.
+        """
+        if self.remaining[node] <= 1:
+            return -1
+        slot = self.offs[node] + idx
+        if self.children[slot] < 0:
+            self.children[slot] = self._create(idx, self.remaining[node] - 1,
+                    self.total[node])
+        return self.children[slot]
+
+    def decrement_permutation(self, node, idx):
         """
         Decrements the permutation counter for sequence continuing with "idx".
+        Returns False and resets the counters of the node if no permutations
+        are left.
         """
-        self.permutations[idx] = self.permutations[idx] - np.uint64(1)
-        if (np.max(self.permutations) == 0):
-            self.permutations = self.max_permutations.copy()
+        perms = self.permutations(node)
+        perms[idx] = perms[idx] - 1
+        if (np.max(perms) == 0):
+            perms[:] = _max_permutations(self.idx[node], self.remaining[node],
+                    self.ptotal[node])
             return False
         return True
 
+    def nbytes(self):
+        """
+        Returns the number of bytes used by the trie arrays.
+        """
+        return sum(a.nbytes for a in [self.idx, self.remaining, self.offs,
+                self.ptotal, self.total, self.counters, self.children])
+
 #
-# Internal helper methods used for setting/restoring the random number generator
-# state
+# Internal helper method used for checking the arguments and fetching the random
+# number generator
 #
 
 def _initialize_generate(n_bits, n_ones, n_samples, seed=None):
@@ -127,10 +198,95 @@ def _initialize_generate(n_bits, n_ones, n_samples, seed=None):
         raise Exception("Arguments must be non-negative!")
     if (n_ones > n_bits):
         raise Exception("n_ones must be smaller or equal to n_bits!")
-    return utils.initialize_seed(seed)
+    return utils.random_stream(seed)
+
+# Possible values of the "output" parameter of the generation functions
+OUTPUT_FORMATS = ["dense", "packed", "indices"]
 
-def _finalize_generate(old_random_state):
-    utils.finalize_seed(old_random_state)
+def _check_output(output):
+    if not output in OUTPUT_FORMATS:
+        raise Exception("Invalid output format \"" + str(output)
+                + "\", must be one of " + str(OUTPUT_FORMATS) + "!")
+
+def convert_output(mat, output="dense"):
+    """
+    Converts a dense data matrix as generated by the functions in this module
+    into the given output format.
+
+    :param mat: dense uint8 matrix containing one sample per row.
+    :param output: one of "dense" (the matrix is returned as is), "packed" (the
+    rows are packed into 64-bit integers, compatible with the "arr" member of
+    the BinaryMatrix class) or "indices" (a (N, n_ones) integer matrix
+    containing the sorted indices of the bits set to one in each sample).
+    """
+    _check_output(output)
+    if output == "packed":
+        return binam.pack(mat)
+    elif output == "indices":
+        N = mat.shape[0]
+        n_ones = int(np.sum(mat[0])) if N > 0 else 0
+        return np.array(np.nonzero(mat)[1].reshape((N, n_ones)),
+                dtype=np.int32)
+    return mat
+
+# Number of samples which are generated in dense form before they are converted
+# to the "packed" or "indices" output format
+GENERATE_CHUNK_SIZE = 4096
+
+class _OutputBuffer:
+    """
+    Receives the generated samples row by row and stores them in the requested
+    output format. For the "packed" and "indices" formats, the rows are written
+    to a dense buffer of GENERATE_CHUNK_SIZE rows, which is converted whenever
+    it is full, so the dense data matrix is never materialised.
+    """
+
+    def __init__(self, n_bits, n_ones, n_samples, output):
+        self.output = output
+        w = binam.BinaryMatrix.int_width
+        if output == "packed":
+            self.res = np.zeros((n_samples, (n_bits + w - 1) // w),
+                    dtype=binam.BinaryMatrix.int_type)
+        elif output == "indices":
+            self.res = np.zeros((n_samples, n_ones), dtype=np.int32)
+        else:
+            self.res = np.zeros((n_samples, n_bits), dtype=np.uint8)
+        if output == "dense":
+            self.buf = self.res
+        else:
+            self.buf = np.zeros((min(n_samples, GENERATE_CHUNK_SIZE), n_bits),
+                    dtype=np.uint8)
+        self.offs = 0
+
+    def _flush(self, n):
+        # Converts the buffered rows up to sample n
+        if self.buf is self.res:
+            return
+        k = n - self.offs
+        if k > 0:
+            self.res[self.offs:n] = convert_output(self.buf[:k], self.output)
+            self.buf[:k] = 0
+        self.offs = n
+
+    def row(self, i):
+        """
+        Returns the dense, writable row of sample i. Samples must be requested
+        in ascending order.
+        """
+        if self.buf is self.res:
+            return self.res[i]
+        if i - self.offs >= len(self.buf):
+            self._flush(i)
+        return self.buf[i - self.offs]
+
+    def result(self, n_samples):
+        """
+        Returns the first n_samples samples in the requested output format.
+        """
+        self._flush(n_samples)
+        if n_samples < len(self.res):
+            return np.array(self.res[:n_samples])
+        return self.res
 
 #
 # Public methods
@@ -140,7 +296,7 @@ def _finalize_generate(old_random_state):
 _generate_cache_ = {}
 
 def generate(n_bits, n_ones, n_samples, seed=None, weight_choices=True,
-        random=True, balance=True, abort_on_restart=False):
+        random=True, balance=True, abort_on_restart=False, output="dense"):
     """
     Generates a set of training vectors to be used in conjunction with the
     BiNAM. The returned data has the following properties:
@@ -161,123 +317,259 @@ def generate(n_bits, n_ones, n_samples, seed=None, weight_choices=True,
     :param n_samples: number of samples to generate.
     :param abort_on_restart: if True, aborts once duplicates have to be generated.
     A samller data matrix than requested will be returned in this case.
-    :param seed: If not "None", the random generator will be adjusted to use the
-    given seed. The generator will be reset after this function ends.
+    :param seed: If not "None", the samples are drawn from an independent random
+    stream derived from the given seed (see utils.random_stream), the global
+    random generator is not touched. May be an integer or a tuple of keys.
     :param weight_choices: If True (default), the correct weight is applied
     to the random choices, which is crucial to ensure the generated samples
     will be uncorrelated. Only has an effect if "random" is set to True.
     :param random: If False, a deterministic set of samples is generated.
     Default is True.
     :param balance: If False, does not perform balancing. Default is True.
+    :param output: format of the returned data, see "convert_output". Default
+    is "dense".
     :return: a numpy ndarray containing the samples as rows.
     """
+    _check_output(output)
 
     # Try to read the generated data from the cache if it is supposed to be
     # generated deterministically
     global _generate_cache_
     if (not seed is None) or (not random):
         key = (n_bits, n_ones, n_samples, abort_on_restart, weight_choices,
-                random, balance, seed)
+                random, balance, seed, output)
         if key in _generate_cache_:
             return np.copy(_generate_cache_[key])
-
-    old_random_state = _initialize_generate(n_bits, n_ones, n_samples, seed)
-    try:
-        res = np.zeros((n_samples, n_bits), dtype=np.uint8)
-        usage = np.zeros(n_bits, dtype=np.uint32)
-        root = PermutationTrieNode(n_bits, n_ones)
-        for i in xrange(n_samples):
-            node = root
-            abort = False
-            for j in xrange(n_ones):
-                # Only select those paths which still have permutations left
-                sel = node.permutations > 0
-
-                if balance:
-                    # From these select indices which balance the bit usage
-                    usage_s = usage[:(node.idx)]
-                    sel = np.logical_and(sel, usage_s == np.min(usage_s[sel]))
-
-                    # Select indices which allow balancing after this layer
-                    allowed = np.minimum(n_ones - j, np.cumsum(np.array(
-                            usage_s == np.min(usage_s), dtype=np.uint16)))
-                    best_sel = np.logical_and(sel, allowed == np.max(allowed))
-                    if np.any(best_sel):
-                        sel = best_sel
-
-                # Weight the entries with the possible permutations the
-                # corresponding path still can generate
-                if random:
-                    idcs = np.where(sel)[0]
-                    if weight_choices:
-                        ws = np.array(node.permutations[idcs], dtype=np.float64)
-                        idx = np.random.choice(idcs, 1, p=ws/np.sum(ws))[0]
-                    else:
-                        idx = np.random.choice(idcs, 1)[0]
-                else:
-                    idx = node.idx - 1
-                    while (not sel[idx]):
-                        idx = idx - 1
-
-                # Set the output bit, update the bit usage count
-                res[i, idx] = 1
-                usage[idx] = usage[idx] + 1
-
-                # Abort if there are no more permutations left
-                abort = (not node.decrement_permutation(idx) and node == root
-                        and abort_on_restart) or abort
-
-                # Descend into the tree
-                node = node.fetch(idx)
-            if abort:
-                res.resize((i + 1, n_bits))
-                return res
-        return res
-    finally:
-        _finalize_generate(old_random_state)
+        res = _generate(n_bits, n_ones, n_samples, seed, weight_choices,
+                random, balance, abort_on_restart, output)
 
         # Store the generated data in the cache
-        if (not seed is None) or (not random):
-            _generate_cache_[key] = np.copy(res)
+        _generate_cache_[key] = np.copy(res)
+        return res
+    return _generate(n_bits, n_ones, n_samples, seed, weight_choices, random,
+            balance, abort_on_restart, output)
 
-def generate_naive(n_bits, n_ones, n_samples, seed=None):
+def _generate(n_bits, n_ones, n_samples, seed, weight_choices, random, balance,
+        abort_on_restart, output):
+    """
+    Actual implementation of the "generate" function, see above.
+    """
+    rng = _initialize_generate(n_bits, n_ones, n_samples, seed)
+    res = _OutputBuffer(n_bits, n_ones, n_samples, output)
+    usage = np.zeros(n_bits, dtype=np.uint32)
+    trie = PermutationTrie(n_bits, n_ones)
+    root = PermutationTrie.ROOT
+    for i in xrange(n_samples):
+        row = res.row(i)
+        node = root
+        abort = False
+        for j in xrange(n_ones):
+            # Only select those paths which still have permutations left
+            perms = trie.permutations(node)
+            sel = perms > 0
+
+            if balance:
+                # From these select indices which balance the bit usage
+                usage_s = usage[:(trie.idx[node])]
+                sel = np.logical_and(sel, usage_s == np.min(usage_s[sel]))
+
+                # Select indices which allow balancing after this layer
+                allowed = np.minimum(n_ones - j, np.cumsum(np.array(
+                        usage_s == np.min(usage_s), dtype=np.uint16)))
+                best_sel = np.logical_and(sel, allowed == np.max(allowed))
+                if np.any(best_sel):
+                    sel = best_sel
+
+            # Weight the entries with the possible permutations the
+            # corresponding path still can generate
+            if random:
+                idcs = np.where(sel)[0]
+                if weight_choices:
+                    ws = np.array(perms[idcs], dtype=np.float64)
+                    idx = rng.choice(idcs, 1, p=ws/np.sum(ws))[0]
+                else:
+                    idx = rng.choice(idcs, 1)[0]
+            else:
+                idx = trie.idx[node] - 1
+                while (not sel[idx]):
+                    idx = idx - 1
+
+            # Set the output bit, update the bit usage count
+            row[idx] = 1
+            usage[idx] = usage[idx] + 1
+
+            # Abort if there are no more permutations left
+            abort = (not trie.decrement_permutation(node, idx)
+                    and node == root and abort_on_restart) or abort
+
+            # Descend into the tree
+            node = trie.fetch(node, idx)
+        if abort:
+            return res.result(i + 1)
+    return res.result(n_samples)
+
+def generate_naive(n_bits, n_ones, n_samples, seed=None, output="dense"):
     """
     Naive generation function which (in contrast to "generate") does ensure
     no duplicates are produced. Same parameters as above.
     """
-    old_random_state = _initialize_generate(n_bits, n_ones, n_samples, seed)
-    try:
-        usage = np.zeros(n_bits, dtype=np.uint32)
-        res = np.zeros((n_samples, n_bits), dtype=np.uint8)
-        for i in xrange(n_samples):
-            indices = []
-            for j in xrange(n_ones):
-                idx = np.random.choice(np.where(np.logical_and(
-                    usage == np.min(usage), res[i] == 0))[0], 1)[0]
-                usage[idx] = usage[idx] + 1
-                res[i, idx] = 1
-        return res
-    finally:
-        _finalize_generate(old_random_state)
-
-def generate_random(n_bits, n_ones, n_samples, seed=None):
+    _check_output(output)
+    rng = _initialize_generate(n_bits, n_ones, n_samples, seed)
+    usage = np.zeros(n_bits, dtype=np.uint32)
+    res = _OutputBuffer(n_bits, n_ones, n_samples, output)
+    for i in xrange(n_samples):
+        row = res.row(i)
+        for j in xrange(n_ones):
+            idx = rng.choice(np.where(np.logical_and(
+                usage == np.min(usage), row == 0))[0], 1)[0]
+            usage[idx] = usage[idx] + 1
+            row[idx] = 1
+    return res.result(n_samples)
+
+def generate_random(n_bits, n_ones, n_samples, seed=None, output="dense"):
     """
     Random generation function which does not ensure balanced distribution of
     bits. Same paramters as above. Uses the Robert Floyd sampling algorithm.
     """
-    old_random_state = _initialize_generate(n_bits, n_ones, n_samples, seed)
-    try:
-        res = np.zeros((n_samples, n_bits), dtype=np.uint8)
-        for i in xrange(n_samples):
-            for j in xrange(n_bits - n_ones, n_bits):
-                idx = np.random.random_integers(0, j)
-                if (res[i, idx] == 1):
-                    res[i, j] = 1
-                else:
-                    res[i, idx] = 1
-        return res
-    finally:
-        _finalize_generate(old_random_state)
+    _check_output(output)
+    rng = _initialize_generate(n_bits, n_ones, n_samples, seed)
+    res = _OutputBuffer(n_bits, n_ones, n_samples, output)
+    for i in xrange(n_samples):
+        row = res.row(i)
+        for j in xrange(n_bits - n_ones, n_bits):
+            idx = rng.randint(0, j + 1)
+            if (row[idx] == 1):
+                row[j] = 1
+            else:
+                row[idx] = 1
+    return res.result(n_samples)
+
+# Names of the data generation algorithms accepted by generate_by_algorithm
+ALGORITHMS = ["balanced", "random", "unique"]
+
+def generate_by_algorithm(algorithm, n_bits, n_ones, n_samples, seed=None,
+        output="dense"):
+    """
+    Generates data using the generation function corresponding to the given
+    algorithm name: "balanced" uses "generate", "random" uses
+    "generate_random" and "unique" uses "generate" without balancing. The
+    remaining parameters are passed to the generation function.
+    """
+    if algorithm == "balanced":
+        return generate(n_bits, n_ones, n_samples, seed, output=output)
+    elif algorithm == "random":
+        return generate_random(n_bits, n_ones, n_samples, seed, output=output)
+    elif algorithm == "unique":
+        return generate(n_bits, n_ones, n_samples, seed, balance=False,
+                output=output)
+    raise Exception("Invalid data generation algorithm \"" + str(algorithm)
+            + "\", must be one of " + str(ALGORITHMS) + "!")
+
+def _generate_job(job):
+    return generate_by_algorithm(*job)
+
+class GenerationExecutor:
+    """
+    Generates independent data matrices concurrently in a process pool. A job
+    is a tuple (algorithm, n_bits, n_ones, n_samples, seed) with the arguments
+    of generate_by_algorithm. As each job carries its own seed, the result is
+    identical to generating the matrices one after the other. Results of jobs
+    with a seed are memorised by job until they are evicted, so these jobs can
+    be prefetched for an entire sweep and later be fetched one by one. Jobs
+    without seed produce a
+    new random matrix each time they are requested and are always executed in
+    the current process. Other independent tasks, such as the construction
+    of networks, can be distributed onto the same worker processes using
+    "map_function".
+    """
+
+    def __init__(self, processes=None):
+        """
+        Constructor of the GenerationExecutor class.
+
+        :param processes: number of worker processes. If None, the number of
+        CPUs is used. If smaller or equal to one, all jobs are executed in the
+        current process.
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        self.pool = None
+        self.results = {}
+
+    @staticmethod
+    def _memorise(job):
+        # Only jobs with a seed produce the same matrix each time
+        return not job[4] is None
+
+    def prefetch(self, jobs):
+        """
+        Executes all given jobs with a seed which have not been executed yet.
+        """
+        pending = []
+        seen = set()
+        for job in jobs:
+            if (self._memorise(job) and (not job in self.results)
+                    and (not job in seen)):
+                pending.append(job)
+                seen.add(job)
+        if len(pending) == 0:
+            return
+        for job, mat in zip(pending, self.map_function(_generate_job, pending)):
+            self.results[job] = mat
+
+    def evict(self, jobs):
+        """
+        Discards the memorised results of the given jobs. They are executed
+        anew if they are requested again.
+        """
+        for job in jobs:
+            self.results.pop(job, None)
+
+    def map_function(self, fun, args):
+        """
+        Applies the given function to each of the arguments in the worker
+        processes and returns the results in the same order. The function must
+        be defined at the top level of a module and both the arguments and the
+        results must be picklable.
+        """
+        args = list(args)
+        if self.processes <= 1 or len(args) <= 1:
+            return map(fun, args)
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes)
+        return self.pool.map(fun, args)
+
+    def map(self, jobs):
+        """
+        Executes the given jobs and returns a list containing a copy of the
+        resulting matrices in the same order.
+        """
+        jobs = list(jobs)
+        self.prefetch(jobs)
+
+        # Jobs without seed are executed anew each time they are requested. They
+        # draw from the global random state of this process, as worker
+        # processes would all start with the same copy of it.
+        fresh = iter(map(_generate_job,
+                [job for job in jobs if not self._memorise(job)]))
+        res = [self.results[job] if self._memorise(job) else next(fresh)
+                for job in jobs]
+
+        # Matrices received from a worker process carry their own copy of the
+        # dtype, use the canonical instance so they pickle the same way as
+        # matrices generated in this process
+        return [mat.astype(mat.dtype.str) for mat in res]
+
+    def close(self):
+        """
+        Shuts down the worker processes and discards all memorised results.
+        """
+        if not self.pool is None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.results = {}
 
 #
 # Main program
@@ -21,8 +21,13 @@ Contains utility functions used to calculate the entropy/storage capacity of
 a BiNAM network.
 """
 
+import collections
+import multiprocessing
 import numpy as np
+import scipy.special
+import scipy.stats
 import math
+import binam
 
 def ncr(n, k):
     """
@@ -53,6 +58,84 @@ def lnncrr(x, y):
     """
     return (math.lgamma(x+1.0) - math.lgamma(y+1.0) - math.lgamma(x-y+1.0))
 
+#
+# Cached binomial coefficient tables
+#
+
+# Value at which the entries of the binomial table saturate
+BINOM_TABLE_MAX = 0x7FFFFFFF
+
+# Maximum number of entries the binomial table may grow to. Larger requests are
+# answered using the log-binomial table instead.
+BINOM_TABLE_CAP = 1 << 22
+
+# Pascal triangle containing "n choose r" in row n, column r, saturated at
+# BINOM_TABLE_MAX. Grown lazily by binom_table.
+_binom_table_ = np.ones((1, 1), dtype=np.int64)
+
+# Natural logarithm of k! for all k smaller than the length of the array. Grown
+# lazily by lnncr.
+_lnfact_table_ = np.zeros(1)
+
+def _grow_binom_table(n_rows, n_cols):
+    global _binom_table_
+    rows0, cols0 = _binom_table_.shape
+    if n_rows <= rows0 and n_cols <= cols0:
+        return _binom_table_
+
+    # Grow at least by a factor of two to amortise the cost of recomputation
+    n_rows = max(n_rows, rows0 if n_rows <= rows0 else 2 * rows0)
+    n_cols = max(n_cols, cols0 if n_cols <= cols0 else 2 * cols0)
+    table = np.zeros((n_rows, n_cols), dtype=np.int64)
+    table[:, 0] = 1
+    for n in xrange(1, n_rows):
+        table[n, 1:] = np.minimum(BINOM_TABLE_MAX,
+                table[n - 1, :-1] + table[n - 1, 1:])
+    _binom_table_ = table
+    return table
+
+def binom_table(n, r):
+    """
+    Returns an array containing the binomial coefficients "i choose r" for all
+    i in [0, n), saturated at BINOM_TABLE_MAX. The values are sliced from a
+    shared, lazily grown Pascal triangle. If the triangle would exceed
+    BINOM_TABLE_CAP entries, the values are calculated from the log-binomial
+    table instead (which is exact up to the saturation value).
+
+    :param n: number of coefficients that should be returned.
+    :param r: number of chosen elements. If negative, all coefficients are zero.
+    :return: a new int64 array of length n.
+    """
+    if r < 0 or n <= 0:
+        return np.zeros(max(0, n), dtype=np.int64)
+    rows, cols = _binom_table_.shape
+    if max(n, rows) * max(r + 1, cols) <= BINOM_TABLE_CAP:
+        return np.array(_grow_binom_table(n, r + 1)[:n, r])
+    ln = lnncr(np.arange(n), r)
+    res = np.full(n, BINOM_TABLE_MAX, dtype=np.int64)
+    sel = ln < math.log(BINOM_TABLE_MAX)
+    res[sel] = np.round(np.exp(ln[sel]))
+    return res
+
+def lnncr(n, r):
+    """
+    Returns the natural logarithm of the binomial coefficient for integer
+    arguments n and r, which may be numpy arrays. Uses a shared, lazily grown
+    table of log-factorials. Returns -inf for r > n or r < 0.
+    """
+    global _lnfact_table_
+    n = np.asarray(n, dtype=np.int64)
+    r = np.asarray(r, dtype=np.int64)
+    n_max = int(np.max(n)) if n.size > 0 else 0
+    if n_max >= len(_lnfact_table_):
+        size = max(n_max + 1, 2 * len(_lnfact_table_))
+        _lnfact_table_ = scipy.special.gammaln(np.arange(size) + 1.0)
+    valid = (r >= 0) & (r <= n)
+    nc = np.where(valid, n, 0)
+    rc = np.where(valid, r, 0)
+    res = (_lnfact_table_[nc] - _lnfact_table_[rc] - _lnfact_table_[nc - rc])
+    return np.where(valid, res, -np.inf)
+
 def expected_false_positives(n_samples, n_bits_out, n_ones_out, n_bits_in = 0,
         n_ones_in = 0):
     """
@@ -67,14 +150,26 @@ def expected_false_positives(n_samples, n_bits_out, n_ones_out, n_bits_in = 0,
     :param n_ones_in: number of bits set to one in each output vector.If
     smaller or equal to zero, the value will be copied from n_bits_in.
     """
-    if (n_bits_in <= 0):
-        n_bits_in = n_bits_out
-    if (n_ones_in <= 0):
-        n_ones_in = n_ones_out
-    N = n_samples
-    p = float(n_ones_in * n_ones_out) / float(n_bits_in * n_bits_out)
+    return float(expected_false_positives_array(n_samples, n_bits_out,
+            n_ones_out, n_bits_in, n_ones_in))
+
+def expected_false_positives_array(n_samples, n_bits_out, n_ones_out,
+        n_bits_in = 0, n_ones_in = 0):
+    """
+    Array version of expected_false_positives. All parameters may be numpy
+    arrays which are broadcast against each other, e.g. to evaluate an entire
+    range of sample counts at once.
+    """
+    N = np.asarray(n_samples, dtype=np.float64)
+    n_bits_out = np.asarray(n_bits_out, dtype=np.float64)
+    n_ones_out = np.asarray(n_ones_out, dtype=np.float64)
+    n_bits_in = np.asarray(n_bits_in, dtype=np.float64)
+    n_ones_in = np.asarray(n_ones_in, dtype=np.float64)
+    n_bits_in = np.where(n_bits_in <= 0, n_bits_out, n_bits_in)
+    n_ones_in = np.where(n_ones_in <= 0, n_ones_out, n_ones_in)
+    p = (n_ones_in * n_ones_out) / (n_bits_in * n_bits_out)
     return ((n_bits_out - n_ones_out) *
-            math.pow(1.0 - math.pow(1.0 - p, N), n_ones_in))
+            np.power(1.0 - np.power(1.0 - p, N), n_ones_in))
 
 def expected_entropy(n_samples, n_bits_out, n_ones_out, n_bits_in = 0,
         n_ones_in = 0):
@@ -82,8 +177,17 @@ def expected_entropy(n_samples, n_bits_out, n_ones_out, n_bits_in = 0,
     Calculates the expected entropy for data with the given parameters. See
     expected_false_positives for a description.
     """
-    return entropy_hetero_uniform(expected_false_positives(n_samples,
-        n_bits_out, n_ones_out, n_bits_in, n_ones_in), n_samples,
+    return float(expected_entropy_array(n_samples, n_bits_out, n_ones_out,
+            n_bits_in, n_ones_in))
+
+def expected_entropy_array(n_samples, n_bits_out, n_ones_out, n_bits_in = 0,
+        n_ones_in = 0):
+    """
+    Array version of expected_entropy. All parameters may be numpy arrays which
+    are broadcast against each other.
+    """
+    return entropy_hetero_uniform_array(expected_false_positives_array(
+        n_samples, n_bits_out, n_ones_out, n_bits_in, n_ones_in), n_samples,
         n_bits_out, n_ones_out)
 
 def entropy_hetero_uniform(err, n_samples, n_bits_out, n_ones_out):
@@ -96,10 +200,60 @@ def entropy_hetero_uniform(err, n_samples, n_bits_out, n_ones_out):
     :param n_bits_out: number of output bits.
     :param n_ones_out: number of ones in the output.
     """
-    v = 0
-    for i in xrange(n_ones_out):
-        v = v + math.log((n_bits_out - i) / (n_ones_out + err - i), 2.0)
-    return n_samples * v
+    return float(entropy_hetero_uniform_array(err, n_samples, n_bits_out,
+            n_ones_out))
+
+def entropy_hetero_uniform_array(err, n_samples, n_bits_out, n_ones_out):
+    """
+    Array version of entropy_hetero_uniform. All parameters may be numpy arrays
+    which are broadcast against each other.
+    """
+    n = np.asarray(n_bits_out, dtype=np.float64)
+    d = np.asarray(n_ones_out, dtype=np.float64)
+    err = np.asarray(err, dtype=np.float64)
+    v = (scipy.special.gammaln(n + 1.0) - scipy.special.gammaln(n - d + 1.0)
+            - scipy.special.gammaln(d + err + 1.0)
+            + scipy.special.gammaln(err + 1.0))
+    return np.asarray(n_samples, dtype=np.float64) * v / math.log(2.0)
+
+def lnncrr_array(x, y):
+    """
+    Vectorized version of lnncrr, x and y may be arbitrary (broadcastable)
+    numpy arrays.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    return (scipy.special.gammaln(x + 1.0) - scipy.special.gammaln(y + 1.0)
+            - scipy.special.gammaln(x - y + 1.0))
+
+def entropy_hetero_array(fn, fp, n_bits_out, n_ones_out):
+    """
+    Array version of entropy_hetero. Calculates the entropy from the number of
+    false negatives and false positives per sample.
+
+    :param fn: array containing the number of false negatives per sample. If
+    two-dimensional, each row corresponds to an individual analysis instance.
+    :param fp: array containing the number of false positives per sample, must
+    have the same shape as fn.
+    :param n_bits_out: length of the output vector. May be an array with one
+    entry per row if fn and fp are two-dimensional.
+    :param n_ones_out: number of ones in the output vector. May be an array
+    with one entry per row if fn and fp are two-dimensional.
+    :return: the entropy as float for one-dimensional input, or an array with
+    the entropy of each row for two-dimensional input.
+    """
+    N0 = np.asarray(fn, dtype=np.float64)
+    N1 = np.asarray(fp, dtype=np.float64)
+    n = np.asarray(n_bits_out, dtype=np.float64)
+    d = np.asarray(n_ones_out, dtype=np.float64)
+    if N0.ndim == 2:
+        n = n.reshape((-1, 1)) if n.ndim > 0 else n
+        d = d.reshape((-1, 1)) if d.ndim > 0 else d
+    e = (lnncrr_array(n, d)
+            - lnncrr_array(N1 + d - N0, d - N0)
+            - lnncrr_array(n - N1 - d + N0, N0))
+    res = np.sum(e, axis=-1) / math.log(2.0)
+    return float(res) if res.ndim == 0 else res
 
 def entropy_hetero(errs, n_bits_out, n_ones_out):
     """
@@ -110,42 +264,61 @@ def entropy_hetero(errs, n_bits_out, n_ones_out):
 
     :param errs: errs is either an array of dictionaries containing "fn" and
     "fp"entries, where "fn" corresponds to the number of false negatives and
-    "fp" to the number of false positives, or an array of numbers which
-    correspond to the number of false positives.
+    "fp" to the number of false positives, a dictionary containing "fn" and
+    "fp" arrays as returned by calculate_errs_array, or an array of numbers
+    which correspond to the number of false positives.
     :params n_bits_out: length of the output vector.
     :params n_ones_out: number of ones in the output vector.
     """
-    e = 0.0 # Entropy
-    n_samples = len(errs)
-    n = n_bits_out
-    d = n_ones_out
-    for t in xrange(n_samples):
-        entry = errs[t]
-        if isinstance(entry, dict):
-            N0 = entry['fn'];
-            N1 = entry['fp'];
-            e += (lnncrr(n, d)
-                    - lnncrr(N1 + d - N0, d - N0)
-                    - lnncrr(n - N1 - d + N0, N0)) / math.log(2.0)
-        else:
-            for i in xrange(n_ones_out):
-                e = e + math.log(float(n - i) / float(d + errs[t] - i), 2.0)
-    return e
+    if isinstance(errs, dict):
+        # Error counts as returned by calculate_errs_array
+        fn, fp = errs["fn"], errs["fp"]
+    else:
+        fn = [entry['fn'] if isinstance(entry, dict) else 0 for entry in errs]
+        fp = [entry['fp'] if isinstance(entry, dict) else entry
+                for entry in errs]
+    return float(np.sum(entropy_hetero_array(fn, fp, n_bits_out, n_ones_out)))
+
+def calculate_errs_array(mat_out, mat_out_expected, packed=False):
+    """
+    For each sample calculates the number of false negatives and false
+    positives. Output values larger than one are counted as one, real-valued
+    outputs result in real-valued error counts.
+
+    :param mat_out: actual output matrix with one sample per row.
+    :param mat_out_expected: expected (binary) output matrix.
+    :param packed: if True, both matrices are interpreted as packed binary
+    matrices as returned by binam.pack. BinaryMatrix instances are always
+    treated as packed.
+    :return: a tuple (fn, fp) of arrays containing the number of false
+    negatives and false positives for each sample.
+    """
+    if isinstance(mat_out, binam.BinaryMatrix):
+        mat_out, packed = mat_out.arr, True
+    if isinstance(mat_out_expected, binam.BinaryMatrix):
+        mat_out_expected, packed = mat_out_expected.arr, True
+    if packed:
+        mat_out = np.asarray(mat_out, dtype=binam.BinaryMatrix.int_type)
+        mat_out_expected = np.asarray(mat_out_expected,
+                dtype=binam.BinaryMatrix.int_type)
+        return (binam.popcount(mat_out_expected & ~mat_out),
+                binam.popcount(mat_out & ~mat_out_expected))
+
+    mat_out = np.minimum(1, np.atleast_2d(mat_out))
+    expected = np.atleast_2d(mat_out_expected) != 0
+    zero = np.zeros((), dtype=mat_out.dtype)
+    fn = np.sum(np.where(expected, 1 - mat_out, zero), axis=1)
+    fp = np.sum(np.where(expected, zero, mat_out), axis=1)
+    return fn, fp
 
 def calculate_errs(mat_out, mat_out_expected):
     """
     For each sample calculates the number of false negatives and false
-    positives.
-    """
-    N, n = mat_out.shape
-    res = [{'fn': 0, 'fp': 0} for _ in xrange(N)]
-    for k in xrange(N):
-        for j in xrange(n):
-            if mat_out_expected[k, j] == 0:
-                res[k]["fp"] = res[k]["fp"] + min(1, mat_out[k, j])
-            else:
-                res[k]["fn"] = res[k]["fn"] + 1 - min(1, mat_out[k, j])
-    return res
+    positives. Returns a list of dictionaries containing "fn" and "fp" entries,
+    see calculate_errs_array for the array version.
+    """
+    fn, fp = calculate_errs_array(mat_out, mat_out_expected)
+    return [{'fn': a, 'fp': b} for a, b in zip(fn.tolist(), fp.tolist())]
 
 def find_minimum_unimodal(f, a, b, tol=1):
     # Implementation of Golden section search
@@ -171,13 +344,55 @@ def optimal_sample_count(n_bits_in, n_bits_out, n_ones_in, n_ones_out):
     Finds the sample count with the -- theoretically -- maximum information
     for the given data parameters.
     """
-    I = 0.0
-    p = 1.0 - float(n_ones_in * n_ones_out) / float(n_bits_in * n_bits_out)
-    N_min = 0
-    N_max = int(math.ceil(math.log(0.1) / math.log(p)))
-    return int(find_minimum_unimodal(lambda N:
-        -expected_entropy(int(N), n_bits_out, n_ones_out,
-                n_bits_in, n_ones_in), N_min, N_max, tol=1))
+    return int(optimal_sample_count_array(n_bits_in, n_bits_out, n_ones_in,
+            n_ones_out))
+
+def optimal_sample_count_array(n_bits_in, n_bits_out, n_ones_in, n_ones_out):
+    """
+    Array version of optimal_sample_count. The parameters may be numpy arrays
+    which are broadcast against each other, the optimum for all points is
+    searched simultaneously. As the expected information is unimodal in the
+    number of samples, the optimum is the smallest N for which the information
+    of N + 1 samples is smaller than that of N samples. This N is found by
+    bisection, which yields the same result as optimal_sample_count_naive.
+
+    :return: an int64 array containing the optimal sample count for each point.
+    """
+    n_bits_in, n_bits_out, n_ones_in, n_ones_out = np.broadcast_arrays(
+            *[np.asarray(x, dtype=np.int64) for x in
+                [n_bits_in, n_bits_out, n_ones_in, n_ones_out]])
+    with np.errstate(all="ignore"):
+        return _optimal_sample_count_array(n_bits_in, n_bits_out, n_ones_in,
+                n_ones_out)
+
+def _optimal_sample_count_array(n_bits_in, n_bits_out, n_ones_in, n_ones_out):
+
+    def decreasing(N):
+        return (expected_entropy_array(N + 1, n_bits_out, n_ones_out,
+                    n_bits_in, n_ones_in)
+                < expected_entropy_array(N, n_bits_out, n_ones_out,
+                    n_bits_in, n_ones_in))
+
+    # Initial upper bound: number of samples at which 90% of the memory
+    # matrix is expected to be filled. Double until the information decreases.
+    p = (np.asarray(n_ones_in * n_ones_out, dtype=np.float64)
+            / (n_bits_in * n_bits_out))
+    hi = np.ceil(math.log(0.1) / np.log1p(-np.minimum(p, 0.5)))
+    hi = np.asarray(np.maximum(1, hi), dtype=np.int64)
+    for _ in xrange(40):
+        done = decreasing(hi)
+        if np.all(done):
+            break
+        hi = np.where(done, hi, 2 * hi)
+
+    # Bisect for the smallest N at which the information decreases
+    lo = np.zeros(hi.shape, dtype=np.int64)
+    while np.any(lo < hi):
+        mid = (lo + hi) // 2
+        done = decreasing(mid)
+        hi = np.where(done, mid, hi)
+        lo = np.where(done, lo, mid + 1)
+    return lo
 
 def optimal_sample_count_naive(n_bits_in, n_bits_out, n_ones_in, n_ones_out):
     I = 0
@@ -192,44 +407,476 @@ def optimal_sample_count_naive(n_bits_in, n_bits_out, n_ones_in, n_ones_out):
         N = N_next
 
 def optimal_parameters(n_bits=100, n_samples=-1, n_bits_in=-1, n_bits_out=-1):
-    n_min = 1
-    n_max = (n_bits // 2) + 1
     n_bits_in = n_bits if n_bits_in <= 0 else n_bits_in
     n_bits_out = n_bits if n_bits_out <= 0 else n_bits_out
-
-    arg = {
-        "I_max": 0,
-        "N_max": 0
+    n_ones, N = optimal_parameters_array(n_bits_in, n_bits_out, n_samples)
+    return {
+        "n_bits_in": n_bits_in,
+        "n_ones_in": int(n_ones),
+        "n_bits_out": n_bits_out,
+        "n_ones_out": int(n_ones),
+        "n_samples": int(N)
     }
 
-    def goal_fun(n_ones, arg):
-        n_ones = int(n_ones)
-        if (n_samples <= 0):
-            N = optimal_sample_count(n_bits, n_bits, n_ones, n_ones)
-        else:
-            N = n_samples
-        I = expected_entropy(N, n_bits, n_ones, n_bits, n_ones)
-        if I == 0: # Quirk to make sure the function is truely unimodal
-            I = -n_ones
-        if I > arg["I_max"]:
-            arg["I_max"] = I
-            arg["N_max"] = N
+def optimal_parameters_array(n_bits_in, n_bits_out, n_samples=-1):
+    """
+    Array version of optimal_parameters. Performs the golden section search
+    for the number of ones with the maximum expected information for all given
+    memory sizes simultaneously.
+
+    :param n_bits_in: number of input bits, may be an array.
+    :param n_bits_out: number of output bits, may be an array.
+    :param n_samples: number of samples, may be an array. The optimal number of
+    samples is chosen for entries smaller or equal to zero.
+    :return: a tuple (n_ones, n_samples) of int64 arrays containing the number
+    of ones (for both input and output) and the number of samples.
+    """
+    n_bits_in, n_bits_out, n_samples = np.broadcast_arrays(
+            *[np.asarray(x, dtype=np.int64) for x in
+                [n_bits_in, n_bits_out, n_samples]])
+    I_max = np.zeros(n_bits_in.shape)
+    N_max = np.zeros(n_bits_in.shape, dtype=np.int64)
+
+    def goal_fun(n_ones, sel):
+        n_ones = np.asarray(n_ones, dtype=np.int64)
+        N = np.where(n_samples[sel] <= 0, optimal_sample_count_array(
+                n_bits_in[sel], n_bits_out[sel], n_ones, n_ones),
+                n_samples[sel])
+        I = expected_entropy_array(N, n_bits_out[sel], n_ones, n_bits_in[sel],
+                n_ones)
+        I = np.where(I == 0, -n_ones, I) # Quirk to make the function unimodal
+        better = I > I_max[sel]
+        idx = np.where(sel)[0][better]
+        I_max[idx] = I[better]
+        N_max[idx] = N[better]
         return -I
 
-    n_ones = int(find_minimum_unimodal(lambda n: goal_fun(n, arg), n_min, n_max))
+    # Golden section search, see find_minimum_unimodal
+    gr = 0.5 * (math.sqrt(5)-1)
+    a = np.ones(n_bits_in.shape)
+    b = np.asarray(np.minimum(n_bits_in, n_bits_out) // 2 + 1,
+            dtype=np.float64)
+    c = b - gr * (b-a)
+    d = a + gr * (b-a)
+    shape = n_bits_in.shape
+    a, b, c, d, I_max, N_max = [x.reshape(-1) for x in [a, b, c, d, I_max,
+            N_max]]
+    n_bits_in, n_bits_out, n_samples = [x.reshape(-1) for x in
+            [n_bits_in, n_bits_out, n_samples]]
+    while True:
+        sel = np.abs(c - d) > 1
+        if not np.any(sel):
+            break
+        fc = goal_fun(c[sel], sel)
+        fd = goal_fun(d[sel], sel)
+        left = np.zeros(sel.shape, dtype=bool)
+        left[sel] = fc < fd
+        right = sel & ~left
+        b[left] = d[left]
+        d[left] = c[left]
+        c[left] = b[left] - gr * (b[left]-a[left])
+        a[right] = c[right]
+        c[right] = d[right]
+        d[right] = a[right] + gr * (b[right]-a[right])
+    n_ones = np.asarray((b + a) / 2, dtype=np.int64)
+    return n_ones.reshape(shape), N_max.reshape(shape)
 
+#
+# Memoised data parameters
+#
+
+# Maximum number of entries in the optimal data parameter memo
+OPTIMAL_PARAMETER_MEMO_SIZE = 4096
+
+# Least recently used memo of resolved data parameters, see
+# resolve_data_parameters
+_optimal_parameter_memo_ = collections.OrderedDict()
+
+# Precomputed resolved data parameters loaded with load_optimal_parameter_table.
+# Entries are never evicted.
+_optimal_parameter_table_ = {}
+
+def resolve_data_parameters(n_bits_in, n_bits_out, n_ones_in, n_ones_out,
+        n_samples):
+    """
+    Resolves the automatically chosen data parameters in the same way as the
+    DataParameters class does: if both n_ones_in and n_ones_out are smaller or
+    equal to zero, the number of ones and samples is chosen using
+    optimal_parameters. Otherwise, if n_samples is smaller or equal to zero,
+    the number of samples is chosen using optimal_sample_count. Results are
+    looked up in the table loaded by load_optimal_parameter_table, or in a
+    bounded memo of recently resolved parameters.
+
+    :return: a tuple (n_ones_in, n_ones_out, n_samples).
+    """
+    key = (int(n_bits_in), int(n_bits_out), int(n_ones_in), int(n_ones_out),
+            int(n_samples))
+    if key[4] > 0 and (key[2] > 0 or key[3] > 0):
+        return key[2:]
+    if key in _optimal_parameter_table_:
+        return _optimal_parameter_table_[key]
+    if key in _optimal_parameter_memo_:
+        res = _optimal_parameter_memo_.pop(key)
+        _optimal_parameter_memo_[key] = res
+        return res
+
+    n_bits_in, n_bits_out, n_ones_in, n_ones_out, n_samples = key
+    if (n_ones_in <= 0) and (n_ones_out <= 0):
+        params = optimal_parameters(n_samples=n_samples, n_bits_in=n_bits_in,
+                n_bits_out=n_bits_out)
+        n_samples = params["n_samples"]
+        n_ones_in = params["n_ones_in"]
+        n_ones_out = params["n_ones_out"]
+    if n_samples <= 0:
+        n_samples = optimal_sample_count(n_bits_in=n_bits_in,
+                n_bits_out=n_bits_out, n_ones_in=n_ones_in,
+                n_ones_out=n_ones_out)
+    res = (int(n_ones_in), int(n_ones_out), int(n_samples))
+
+    _optimal_parameter_memo_[key] = res
+    while len(_optimal_parameter_memo_) > OPTIMAL_PARAMETER_MEMO_SIZE:
+        _optimal_parameter_memo_.popitem(last=False)
+    return res
+
+def load_optimal_parameter_table(filename):
+    """
+    Loads a table of precomputed data parameters from a numpy ".npz" file and
+    uses it in resolve_data_parameters. The file must contain an (K, 5) integer
+    array "keys" with the (n_bits_in, n_bits_out, n_ones_in, n_ones_out,
+    n_samples) arguments of resolve_data_parameters and a (K, 3) integer array
+    "values" with the corresponding (n_ones_in, n_ones_out, n_samples) result.
+
+    :return: the number of loaded entries.
+    """
+    with np.load(filename) as f:
+        keys = f["keys"]
+        values = f["values"]
+    if (keys.ndim != 2 or keys.shape[1] != 5 or values.ndim != 2
+            or values.shape[1] != 3 or len(keys) != len(values)):
+        raise Exception("Invalid optimal parameter table \"" + str(filename)
+                + "\"!")
+    for key, value in zip(keys.tolist(), values.tolist()):
+        _optimal_parameter_table_[tuple(key)] = tuple(value)
+    return len(keys)
+
+def optimal_parameter_table(n_bits_in, n_bits_out, n_ones=16, square=False):
+    """
+    Computes a table of resolved data parameters (see resolve_data_parameters)
+    for all combinations of the given numbers of input and output bits. For
+    each memory size the table contains the optimal number of ones and
+    samples, as well as the optimal number of samples for each number of ones
+    (equal for input and output) up to the given maximum.
+
+    :param n_bits_in: list of input bit counts.
+    :param n_bits_out: list of output bit counts.
+    :param n_ones: maximum number of ones for which the optimal number of
+    samples is tabulated. Numbers of ones larger than half the memory size
+    (the range searched by optimal_parameters) are skipped.
+    :param square: if True, only memories with n_bits_in == n_bits_out are
+    included.
+    :return: a dictionary containing the "keys" and "values" arrays as read by
+    load_optimal_parameter_table, as well as the "expected_fp" and the
+    expected information "info" for each row.
+    """
+    bi, bo = np.meshgrid(np.asarray(n_bits_in, dtype=np.int64),
+            np.asarray(n_bits_out, dtype=np.int64), indexing="ij")
+    bi, bo = bi.reshape(-1), bo.reshape(-1)
+    if square:
+        bi, bo = bi[bi == bo], bo[bi == bo]
+
+    # Optimal number of ones and samples per memory size
+    d_opt, N_opt = optimal_parameters_array(bi, bo)
+
+    # Optimal number of samples for each number of ones and memory size
+    d = np.arange(1, n_ones + 1, dtype=np.int64)
+    bi_d, d = np.meshgrid(bi, d, indexing="ij")
+    bo_d, _ = np.meshgrid(bo, d[0], indexing="ij")
+    valid = d <= np.minimum(bi_d, bo_d) // 2 + 1
+    bi_d, bo_d, d = bi_d[valid], bo_d[valid], d[valid]
+    N_d = optimal_sample_count_array(bi_d, bo_d, d, d)
+
+    zeros = np.zeros(len(bi), dtype=np.int64)
+    keys = np.concatenate([
+        np.array([bi, bo, zeros, zeros, zeros - 1]).T,
+        np.array([bi_d, bo_d, d, d, -np.ones(len(d), dtype=np.int64)]).T])
+    values = np.concatenate([
+        np.array([d_opt, d_opt, N_opt]).T,
+        np.array([d, d, N_d]).T])
     return {
-        "n_bits_in": n_bits,
-        "n_ones_in": n_ones,
-        "n_bits_out": n_bits,
-        "n_ones_out": n_ones,
-        "n_samples": arg["N_max"]
+        "keys": keys,
+        "values": values,
+        "expected_fp": expected_false_positives_array(values[:, 2], keys[:, 1],
+                values[:, 1], keys[:, 0], values[:, 0]),
+        "info": expected_entropy_array(values[:, 2], keys[:, 1],
+                values[:, 1], keys[:, 0], values[:, 0])
     }
 
+def save_optimal_parameter_table(filename, table):
+    """
+    Writes a table as returned by optimal_parameter_table to a compressed numpy
+    ".npz" file which can be read by load_optimal_parameter_table.
+    """
+    np.savez_compressed(filename, **table)
+
+def clear_optimal_parameter_table():
+    """
+    Discards the loaded optimal parameter table and the memo.
+    """
+    _optimal_parameter_table_.clear()
+    _optimal_parameter_memo_.clear()
+
 def conventional_memory_entropy(n_bits_in, n_bits_out, n_ones_out):
     """
     Calculates storage capacity of a conventional MxN ROM holding data with the
     given specification.
     """
-    return n_bits_in * lnncrr(n_bits_out, n_ones_out) / math.log(2.0)
+    return n_bits_in * float(lnncr(n_bits_out, n_ones_out)) / math.log(2.0)
+
+#
+# Finite-size false positive distribution
+#
+
+# Maximum number of entries in the false positive distribution memo
+FALSE_POSITIVE_MEMO_SIZE = 256
+
+# Least recently used memo of false_positive_distribution results
+_false_positive_memo_ = collections.OrderedDict()
+
+def _row_cover_transition(n_bits_out, n_ones_out, n_bits_in, n_ones_in):
+    """
+    Returns the transition matrix of the number of input rows of a sample which
+    are set in an output column that is not part of the sample, when another
+    sample is trained. Entry (k, l) is the probability of l rows being set after
+    training if k rows were set before.
+    """
+    n, d, m, c = n_bits_out, n_ones_out, n_bits_in, n_ones_in
+    q = float(d) / float(n)
+    T = np.zeros((c + 1, c + 1))
+    for k in xrange(c + 1):
+        # The input of the other sample sets j of the u = c - k missing rows
+        # with hypergeometric probability
+        u = c - k
+        j = np.arange(u + 1)
+        T[k, k + j] = q * np.exp(lnncr(u, j) + lnncr(m - u, c - j)
+                - lnncr(m, c))
+        T[k, k] = T[k, k] + (1.0 - q)
+    return T
+
+def column_fill_probability(n_samples, n_bits_out, n_ones_out, n_bits_in = 0,
+        n_ones_in = 0):
+    """
+    Calculates the probability with which a single output column that is not
+    part of a trained sample is recalled as one (a false positive) for that
+    sample. Other than expected_false_positives, which uses the mean-field
+    approximation, this is exact for samples drawn independently at random. The
+    number of the c input rows of the sample which are set in the column forms
+    a Markov chain over the N - 1 other samples: each of them activates the
+    column with probability d / n and then sets a hypergeometrically
+    distributed number of the missing rows. The probability is the chance of
+    reaching all c rows, calculated as a power of the transition matrix. As all
+    its entries are non-negative, the result does not suffer from cancellation.
+    All parameters may be numpy arrays which are broadcast against each other.
+
+    See expected_false_positives for a description of the parameters.
+    """
+    N = np.asarray(n_samples, dtype=np.int64)
+    n = np.asarray(n_bits_out, dtype=np.int64)
+    d = np.asarray(n_ones_out, dtype=np.int64)
+    m = np.asarray(n_bits_in, dtype=np.int64)
+    c = np.asarray(n_ones_in, dtype=np.int64)
+    m = np.where(m <= 0, n, m)
+    c = np.where(c <= 0, d, c)
+    N, n, d, m, c = np.broadcast_arrays(N, n, d, m, c)
+    if np.any(d > n) or np.any(c > m) or np.any(d < 0):
+        raise Exception("The number of ones must not exceed the number of bits")
+
+    # Calculate the powers of the transition matrix once per parameter set
+    p = np.zeros(N.shape)
+    transitions = {}
+    for idx in np.ndindex(*N.shape):
+        key = (int(n[idx]), int(d[idx]), int(m[idx]), int(c[idx]))
+        if not key in transitions:
+            transitions[key] = _row_cover_transition(*key)
+        T = transitions[key]
+        p[idx] = np.linalg.matrix_power(T, max(0, int(N[idx]) - 1))[0, -1]
+    if np.any(p < 0.0) or np.any(p > 1.0 + 1e-9):
+        raise Exception("Column fill probability out of range")
+    return np.minimum(p, 1.0)
+
+def false_positive_distribution(n_samples, n_bits_out, n_ones_out,
+        n_bits_in = 0, n_ones_in = 0):
+    """
+    Approximates the distribution of the number of false positives per sample
+    and the expected information for samples drawn independently at random.
+    Each of the n - d columns not set in the output of a sample is a false
+    positive with the exact probability given by column_fill_probability. The
+    columns are approximated as independent, resulting in a binomial
+    distribution. Actually, the columns are correlated, as they share the
+    inputs of the other samples, so only the mean of the distribution is exact.
+    Results are memoised.
+
+    :param n_samples: number of trained samples, may be a list.
+    :return: a tuple (pmf, info). If n_samples is a list, pmf is an array of
+    shape (len(n_samples), n_bits_out - n_ones_out + 1) containing the
+    probability of k false positives in column k and info contains the
+    expected information for each sample count. Otherwise, pmf is a vector and
+    info a float.
+    """
+    scalar = np.isscalar(n_samples)
+    N = np.atleast_1d(np.asarray(n_samples, dtype=np.int64))
+    key = (tuple(N.tolist()), int(n_bits_out), int(n_ones_out),
+            int(n_bits_in), int(n_ones_in))
+    if key in _false_positive_memo_:
+        pmf, info = _false_positive_memo_.pop(key)
+        _false_positive_memo_[key] = (pmf, info)
+    else:
+        p = column_fill_probability(N, n_bits_out, n_ones_out, n_bits_in,
+                n_ones_in)[:, None]
+        n_cols = n_bits_out - n_ones_out
+        k = np.arange(n_cols + 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ln_pmf = (lnncr(n_cols, k) + k * np.log(p)
+                    + (n_cols - k) * np.log1p(-p))
+        pmf = np.exp(ln_pmf)
+        pmf[:, 0] = np.where(p[:, 0] == 0.0, 1.0, pmf[:, 0])
+        pmf[:, -1] = np.where(p[:, 0] == 1.0, 1.0, pmf[:, -1])
+        pmf = np.nan_to_num(pmf)
+
+        # Information per sample for k false positives and no false negatives
+        info_k = entropy_hetero_uniform_array(k, 1, n_bits_out, n_ones_out)
+        info = N * np.dot(pmf, info_k)
+
+        _false_positive_memo_[key] = (pmf, info)
+        while len(_false_positive_memo_) > FALSE_POSITIVE_MEMO_SIZE:
+            _false_positive_memo_.popitem(last=False)
+    if scalar:
+        return np.copy(pmf[0]), float(info[0])
+    return np.copy(pmf), np.copy(info)
+
+#
+# Monte-Carlo estimation
+#
+
+def _monte_carlo_batch(args):
+    """
+    Executes the Monte-Carlo trials with the given indices. Each trial
+    generates data, trains a BiNAM on the first N samples for each of the
+    sample counts, recalls the trained samples and calculates the information
+    and mean number of false positives. Returns an array of shape
+    (len(trials), 2, len(n_samples)).
+    """
+    # Imported here, as the data module itself depends on this module
+    import data
+
+    params, n_samples, seed, trials = args
+    algorithm, n_bits_in, n_bits_out, n_ones_in, n_ones_out = params
+    N_max = max(n_samples)
+    res = np.zeros((len(trials), 2, len(n_samples)))
+    for i, trial in enumerate(trials):
+        mat_in = np.asarray(data.generate_by_algorithm(algorithm, n_bits_in,
+                n_ones_in, N_max, (seed, "mc", trial, "in")), dtype=np.int32)
+        mat_out = np.asarray(data.generate_by_algorithm(algorithm, n_bits_out,
+                n_ones_out, N_max, (seed, "mc", trial, "out")), dtype=np.int32)
+        for j, N in enumerate(n_samples):
+            X = mat_in[:N]
+            W = np.asarray(np.dot(X.T, mat_out[:N]) > 0, dtype=np.int32)
+            recall = np.dot(X, W) >= np.sum(X, axis=1)[:, None]
+            fn, fp = calculate_errs_array(np.asarray(recall, dtype=np.int32),
+                    mat_out[:N])
+            res[i, 0, j] = entropy_hetero_array(fn, fp, n_bits_out,
+                    n_ones_out)
+            res[i, 1, j] = np.mean(fp) if N > 0 else 0.0
+    return res
+
+def monte_carlo_entropy(n_bits_in, n_bits_out, n_ones_in, n_ones_out,
+        n_samples, algorithm="balanced", seed=None, min_trials=64,
+        max_trials=1024, rel_tol=0.01, confidence=0.95, batch_size=8,
+        round_size=64, processes=None):
+    """
+    Estimates the information stored in a BiNAM and the mean number of false
+    positives per sample by repeatedly generating data, training and recalling
+    a BiNAM. Trials are executed in batches in a process pool. Each trial draws
+    its data from independent random streams derived from the seed and the
+    trial index, so the result does not depend on the number of processes.
+    Trials are executed in rounds of round_size trials, after each round the
+    estimation stops if the confidence interval of the information is tight
+    enough.
+
+    :param n_bits_in: number of input bits.
+    :param n_bits_out: number of output bits.
+    :param n_ones_in: number of ones in each input sample.
+    :param n_ones_out: number of ones in each output sample.
+    :param n_samples: number of trained samples, or a list of sample counts.
+    In the latter case the first N samples of the same data are used for each
+    sample count N.
+    :param algorithm: data generation algorithm, see data.generate_by_algorithm.
+    :param seed: seed from which the random streams are derived. If None, a
+    random seed is drawn.
+    :param min_trials: minimum number of trials.
+    :param max_trials: maximum number of trials.
+    :param rel_tol: the estimation stops once the half-width of the confidence
+    interval is smaller than rel_tol times the mean information for all sample
+    counts.
+    :param confidence: confidence level of the returned intervals.
+    :param batch_size: number of trials executed per process pool task.
+    :param round_size: number of trials executed between two checks of the
+    stopping criterion.
+    :param processes: number of worker processes. If None, the number of CPUs
+    is used. If smaller or equal to one, all trials are executed in the current
+    process.
+    :return: a dictionary containing the "n_samples" and the number of executed
+    "trials", as well as the "mean", "std" and confidence interval bounds
+    "ci_low" and "ci_high" of the information ("info_*") and of the number of
+    false positives ("fp_*"). Values are arrays with one entry per sample count
+    if n_samples is a list, scalars otherwise.
+    """
+    scalar = np.isscalar(n_samples)
+    n_samples = [int(N) for N in np.atleast_1d(n_samples)]
+    if seed is None:
+        seed = np.random.randint(1 << 30)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    params = (algorithm, n_bits_in, n_bits_out, n_ones_in, n_ones_out)
+    z = scipy.stats.norm.ppf(0.5 + 0.5 * confidence)
 
+    pool = None
+    results = []
+    n_trials = 0
+    try:
+        while n_trials < max_trials:
+            # Split the next round of trials into batches
+            n_round = min(max_trials, max(min_trials, n_trials + round_size)) \
+                    - n_trials
+            jobs = [(params, n_samples, seed,
+                     range(i, min(i + batch_size, n_trials + n_round)))
+                    for i in xrange(n_trials, n_trials + n_round, batch_size)]
+            if processes <= 1 or len(jobs) == 1:
+                results.extend(map(_monte_carlo_batch, jobs))
+            else:
+                if pool is None:
+                    pool = multiprocessing.Pool(processes)
+                results.extend(pool.map(_monte_carlo_batch, jobs))
+            n_trials = n_trials + n_round
+
+            # Check whether the confidence interval is tight enough
+            info = np.concatenate(results)[:, 0]
+            half_width = z * np.std(info, axis=0, ddof=1) / math.sqrt(n_trials)
+            if np.all(half_width <= rel_tol * np.abs(np.mean(info, axis=0))):
+                break
+    finally:
+        if not pool is None:
+            pool.close()
+            pool.join()
+
+    res = {"n_samples": n_samples[0] if scalar else np.array(n_samples),
+            "trials": n_trials}
+    values = np.concatenate(results)
+    for i, name in enumerate(["info", "fp"]):
+        mean = np.mean(values[:, i], axis=0)
+        std = np.std(values[:, i], axis=0, ddof=1) if n_trials > 1 \
+                else np.zeros(len(n_samples))
+        half_width = z * std / math.sqrt(n_trials)
+        for key, value in [("mean", mean), ("std", std),
+                ("ci_low", mean - half_width), ("ci_high", mean + half_width)]:
+            res[name + "_" + key] = float(value[0]) if scalar else value
+    return res
@@ -22,17 +22,41 @@ descriptor and producing the multiplexed network pools.
 """
 
 import json
+import pickle
 import re
-import random
 import numpy as np
+import data
+import entropy
 import utils
 
+from packing import PoolPlanner, shared_key
 from network import (DataParameters, TopologyParameters, InputParameters,
         OutputParameters, NetworkBuilder, NetworkPool)
 
 class ExperimentException(Exception):
     pass
 
+def _build_network(job):
+    # Builds a single network, executed in the worker processes of the
+    # GenerationExecutor. The network is returned in pickled form, so it goes
+    # through the same serialisation whether or not it is built in another
+    # process and the resulting pools are byte-identical for any number of
+    # processes.
+    builder, kwargs = job
+    return pickle.dumps(builder.build(**kwargs), pickle.HIGHEST_PROTOCOL)
+
+def _resource_usage(job):
+    # Determines the resources required by the networks of all sweep points
+    # sharing the same data without building them, executed in the worker
+    # processes of the GenerationExecutor. The data matrices are generated in
+    # the worker and discarded afterwards, the trained BiNAM is returned along
+    # with the resource usage so the networks can be built without training it
+    # again.
+    data_params, seed, topology_params_list = job
+    builder = NetworkBuilder(data_params=data_params, seed=seed)
+    return builder.train_binam(), [builder.resource_usage(topology_params)
+            for topology_params in topology_params_list]
+
 class Experiment(dict):
     """
     Class representing an entire collection of experiments and all network
@@ -56,6 +80,9 @@ class Experiment(dict):
         utils.init_key(self, data, "output", output_params)
         utils.init_key(self, data, "experiments", experiments)
 
+        # Keep the requested data parameters, the automatically chosen ones are
+        # resolved anew if a parameter table is passed to build
+        self._data_request = dict(self["data"])
         self["data"] = DataParameters(self["data"])
         self["topology"] = TopologyParameters(self["topology"])
         self["input"] = InputParameters(self["input"])
@@ -144,31 +171,61 @@ class Experiment(dict):
 
         return input_params, topology_params
 
-    @staticmethod
-    def _check_shared_parameters_equal(shared_parameters, ps1, ps2):
-        for p in shared_parameters:
-            if (p in ps1) and (p in ps2) and (ps1[p] != ps2[p]):
-                return False
-        return True
-
-    def build(self, simulator_info, simulator="", seed=None):
+    def build(self, simulator_info, simulator="", seed=None, processes=1,
+              parameter_table=None):
         """
         Builds all NetworkPool instances required to conduct the specified
         experiments.
 
         :param simulator_info: Information about the used simulator as returned
         from PyNNLess.get_simulator_info() -- contains the maximum number of
-        neurons and the supported software concurrency.
+        neurons and the supported software concurrency. The optional keys
+        "max_synapse_count", "max_source_count" and "max_fan_in" limit the
+        number of synapses and spike sources per pool and the number of
+        synapses per neuron.
         :param seed: seed to be used to spawn the seeds for the data generation.
+        All random numbers are drawn from independent streams derived from this
+        seed and the (experiment, repetition, network) indices, so the result
+        does not depend on the order in which networks are constructed.
+        :param processes: number of processes used to generate the data
+        matrices of distinct sweep points and to construct the networks of a
+        pool concurrently. Defaults to one, in which case no worker processes
+        are started. If None, the number of CPUs is used. The result is the
+        same for any number of processes.
+        :param parameter_table: optional ".npz" file containing a table of
+        optimal data parameters as written by capacity_table.py. It is loaded
+        with entropy.load_optimal_parameter_table and the automatically chosen
+        data parameters of the experiment are resolved anew using the table.
         """
+        return list(self.build_iter(simulator_info, simulator, seed,
+                                    processes, parameter_table))
+
+    def build_iter(self, simulator_info, simulator="", seed=None,
+                   processes=1, parameter_table=None):
+        """
+        Generator version of "build": yields the same NetworkPool instances in
+        the same order, but each pool as soon as all of its networks have been
+        built. The pools are built one after the other: only the pool under
+        construction and the data matrices its networks require are held in
+        memory, along with a small descriptor (sweep point, resource usage) of
+        each network of the current experiment and the BiNAM trained with each
+        of its distinct data matrices. The data matrices are discarded
+        after the last pool requiring them is complete. For this, they are
+        generated twice -- once to plan the pools and once to build them. See
+        "build" for the parameters.
+        """
+
+        # Load the table of optimal data parameters and resolve the
+        # automatically chosen data parameters again
+        if not parameter_table is None:
+            entropy.load_optimal_parameter_table(parameter_table)
+            self["data"] = DataParameters(self._data_request)
+            print("Network data parameters: " + str(self["data"]))
 
         # Spawn more random seeds
-        old_state = utils.initialize_seed(seed)
-        try:
-            data_seed = np.random.randint(1 << 30)
-            build_seed = np.random.randint(1 << 30)
-        finally:
-            utils.finalize_seed(old_state)
+        rng = utils.random_stream(seed, "experiment")
+        data_seed = rng.randint(1 << 30)
+        build_seed = rng.randint(1 << 30)
 
         # Add a dummy experiment if there are no experiments specified
         if len(self["experiments"]) == 0:
@@ -177,8 +234,66 @@ class Experiment(dict):
         # "Count sources" flag
         cs = simulator_info["sources_are_neurons"]
 
+        executor = data.GenerationExecutor(processes)
+        try:
+            for pool in self._build_iter(simulator_info, simulator, cs,
+                                         data_seed, build_seed, executor):
+                yield pool
+        finally:
+            executor.close()
+
+    # Optional simulator limits beside "max_neuron_count", the corresponding
+    # resource usage keys and their descriptions. Limits not reported by the
+    # simulator are infinite.
+    RESOURCE_LIMITS = [
+        ("max_synapse_count", "synapses", "synapses"),
+        ("max_source_count", "sources", "spike sources"),
+        ("max_fan_in", "fan_in", "synapses per neuron")
+    ]
+
+    @staticmethod
+    def _capacity(simulator_info):
+        # Capacity vector of a pool: number of neurons, synapses and sources
+        return [simulator_info["max_neuron_count"],
+                simulator_info.get("max_synapse_count", float("inf")),
+                simulator_info.get("max_source_count", float("inf"))]
+
+    @staticmethod
+    def _resource_vector(usage, count_sources):
+        # Usage vector of a network matching the capacity vector of a pool
+        neurons = usage["neurons"]
+        if count_sources:
+            neurons = neurons + usage["sources"]
+        return [neurons, usage["synapses"], usage["sources"]]
+
+    def _check_resources(self, name, simulator_info, usage):
+        # Networks exceeding the maximum neuron count still get a pool of
+        # their own, while no pool can hold a network exceeding the synapse,
+        # source or fan-in limits of the simulator
+        for limit_key, usage_key, desc in self.RESOURCE_LIMITS:
+            limit = simulator_info.get(limit_key, float("inf"))
+            if usage[usage_key] > limit:
+                raise ExperimentException("A network of experiment \"" + name
+                        + "\" requires " + str(usage[usage_key]) + " " + desc
+                        + ", but the simulator only supports " + str(limit)
+                        + " (\"" + limit_key + "\")")
+
+    @staticmethod
+    def _report_plan(name, planner, sizes, plan):
+        # Print the number of pools and their predicted mean utilisation
+        utilisation = planner.utilisation(sizes, plan)
+        if len(utilisation) == 0:
+            return
+        msg = ("Experiment \"" + name + "\": " + str(len(sizes))
+                + " networks in " + str(len(utilisation)) + " pools")
+        if not np.all(np.isinf(planner.capacity)):
+            msg = msg + (", predicted utilisation %.1f%%"
+                    % (100.0 * np.mean(utilisation)))
+        print(msg)
+
+    def _build_iter(self, simulator_info, simulator, cs, data_seed,
+            build_seed, executor):
         # Create all NetworkPool instances
-        pools = []
         for i, experiment in enumerate(self["experiments"]):
             # Gather the input and topology parameters for this experiment
             input_params_list, topology_params_list = \
@@ -189,13 +304,11 @@ class Experiment(dict):
             if experiment["name"] == "":
                 experiment["name"] = "experiment_" + str(i)
 
-            # Generate new pools for this experiment
-            min_pool = len(pools)
-            pidx = simulator_info["concurrency"]
-
-            # Assemble a name for this repetition
-            pools = pools + [NetworkPool(name=experiment["name"] + "." + str(c))
-                    for c in xrange(simulator_info["concurrency"])]
+            # Data generation jobs of each sweep point, sweep points with the
+            # same data parameters share the same jobs
+            data_jobs = [tuple(NetworkBuilder.data_jobs(
+                            topology_params["data"], data_seed))
+                    for topology_params in topology_params_list]
 
             # Metadata to store along with the networks
             meta_data = {
@@ -209,74 +322,118 @@ class Experiment(dict):
             }
 
             # Repeat the experiment as many times as specified in the "repeat"
-            # parameter
-            local_build_seed = build_seed
-            net_idx = 0
+            # parameter, each repetition visits the topology parameters in a
+            # random permutation
+            networks = []
             for j in xrange(experiment["repeat"]):
-                # Create a random permutation of the topology parameters list
-                perm = range(0, len(topology_params_list))
-                random.shuffle(perm)
-                for k in xrange(len(topology_params_list)):
-                    # Print the current network number
-                    net_idx = net_idx + 1
-                    if (net_idx % 100 == 0):
-                        n_nets = len(topology_params_list) * experiment["repeat"]
-                        print("Generating network " + str(net_idx) + "/" +
-                            str(n_nets))
-
+                perm = utils.random_stream(build_seed, i, j,
+                        "permutation").permutation(len(topology_params_list))
+                networks.extend((j, k) for k in perm)
+
+            # Determine the resources required by the network of each sweep
+            # point -- they do not depend on the repetition -- concurrently in
+            # the worker processes, once per distinct data, and make sure each
+            # network can be executed at all
+            groups = {}
+            group_jobs = []
+            for k, jobs in enumerate(data_jobs):
+                if not jobs in groups:
+                    groups[jobs] = []
+                    group_jobs.append(jobs)
+                groups[jobs].append(k)
+            res = executor.map_function(_resource_usage, [
+                    (topology_params_list[groups[jobs][0]]["data"], data_seed,
+                     [topology_params_list[k]["topology"]
+                            for k in groups[jobs]])
+                    for jobs in group_jobs])
+            usage = [None] * len(topology_params_list)
+            mems = {}
+            for jobs, (mem, group_usage) in zip(group_jobs, res):
+                mems[jobs] = mem
+                for k, u in zip(groups[jobs], group_usage):
+                    usage[k] = u
+            for u in usage:
+                self._check_resources(experiment["name"], simulator_info, u)
+
+            # Plan the distribution of the networks onto as few pools as
+            # possible without exceeding any of the simulator limits. The plan
+            # is made before any network is built. If uniform parameters are
+            # required (Spikey), only networks with the same shared parameters
+            # share a pool.
+            sizes = [self._resource_vector(usage[k], cs) for _, k in networks]
+            keys = [shared_key(topology_params_list[k]["topology"]["params"],
+                        simulator_info["shared_parameters"])
+                    for _, k in networks]
+            planner = PoolPlanner(self._capacity(simulator_info),
+                    simulator_info["concurrency"])
+            plan = planner.plan(sizes, keys)
+            self._report_plan(experiment["name"], planner, sizes, plan)
+
+            # Index of the last pool requiring each data generation job and
+            # each trained BiNAM
+            last_use = {}
+            for c, pool_networks in enumerate(plan):
+                for net_idx in pool_networks:
+                    jobs = data_jobs[networks[net_idx][1]]
+                    last_use[jobs] = c
+                    for job in jobs:
+                        last_use[job] = c
+
+            # Build the networks pool by pool. The data of a pool is generated
+            # concurrently and discarded once no later pool requires it, just
+            # as the BiNAMs trained while planning. The
+            # networks of a pool are constructed concurrently in the worker
+            # processes, each from its own seed, and added to the pool in the
+            # planned order. Each pool is sealed and yielded as soon as it is
+            # complete.
+            net_count = 0
+            for c, pool_networks in enumerate(plan):
+                pool_data_jobs = [job for net_idx in pool_networks
+                        for job in data_jobs[networks[net_idx][1]]]
+                executor.prefetch(pool_data_jobs)
+                jobs = []
+                for net_idx in pool_networks:
                     # Create a build instance coupled with the topology
-                    # parameters
-                    topology_params = topology_params_list[perm[k]]
+                    # parameters. The input and topology parameters vary
+                    # between trials, but reproducibly.
+                    j, k = networks[net_idx]
+                    topology_params = topology_params_list[k]
                     builder = NetworkBuilder(
                             data_params=topology_params["data"],
-                            seed=data_seed)
-
-                    # Build a network instance and add it to the network pool
-                    net = builder.build(
-                            topology_params=topology_params["topology"],
-                            input_params=input_params_list,
-                            meta_data=meta_data,
-                            seed=local_build_seed)
-
-                    # Search for a pool to which the network should be added.
-                    # Use the pool with the fewest neurons which still has
-                    # space for this experiment.
-                    target_pool_idx = -1
-                    for l in xrange(min_pool, len(pools)):
-                        if ((target_pool_idx == -1 or pools[l].neuron_count(cs)
-                                < pools[target_pool_idx].neuron_count(cs)) and
-                                 pools[l].neuron_count(cs)
-                                    + net.neuron_count(cs)
-                                    <= simulator_info["max_neuron_count"]):
-                            # If uniform parameter are required (Spikey), check
-                            # whether the target network parameters are the same
-                            # as the current network parameters
-                            if pools[l].neuron_count(cs) > 0:
-                                if self._check_shared_parameters_equal(
-                                        simulator_info["shared_parameters"],
-                                        pools[l]["topology_params"][0]["params"],
-                                        topology_params["topology"]["params"]):
-                                    target_pool_idx = l
-                            else:
-                                target_pool_idx = l
-
-                    # No free pool has been found, add a new one
-                    if target_pool_idx == -1:
-                        pool_name = experiment["name"] + "." + str(pidx)
-                        pools.append(NetworkPool(name=pool_name))
-                        pidx = pidx + 1
-                        target_pool_idx = len(pools) - 1
-
-                    # Add the network to the pool
-                    pools[target_pool_idx].add_network(net)
-
-                    # Advance the build_seed -- the input and topology
-                    # parameters should still vary between trials,
-                    # but reproducibly
-                    local_build_seed = local_build_seed * 2
-
-        # Return non-empty pool instances
-        return filter(lambda x: x.neuron_count(cs) > 0, pools)
+                            seed=data_seed, executor=executor,
+                            mem=mems[data_jobs[k]])
+                    jobs.append((builder, {
+                        "topology_params": topology_params["topology"],
+                        "input_params": input_params_list,
+                        "meta_data": meta_data,
+                        "seed": (build_seed, i, j, k)}))
+
+                pool = NetworkPool(name=experiment["name"] + "." + str(c))
+                res = executor.map_function(_build_network, jobs)
+                for (_, kwargs), net in zip(jobs, res):
+                    # Print the current network number
+                    net_count = net_count + 1
+                    if (net_count % 100 == 0):
+                        print("Generating network " + str(net_count) + "/" +
+                            str(len(networks)))
+
+                    # The unpickled network contains copies of the parameter
+                    # objects shared between networks, restore the originals
+                    net = pickle.loads(net)
+                    net["topology_params"] = kwargs["topology_params"]
+                    net["input_params"] = kwargs["input_params"]
+                    net["meta_data"] = kwargs["meta_data"]
+                    pool.add_network(net)
+                executor.evict(job for job in pool_data_jobs
+                        if last_use[job] == c)
+                for net_idx in pool_networks:
+                    jobs = data_jobs[networks[net_idx][1]]
+                    if last_use[jobs] == c:
+                        mems.pop(jobs, None)
+
+                # Flatten the pool, only emit non-empty pool instances
+                if pool.neuron_count(cs) > 0:
+                    yield pool.finalize()
 
 class ExperimentDescriptor(dict):
 
@@ -319,39 +476,66 @@ class ExperimentDescriptor(dict):
         return self.get_sweeps(["data.", "topology."])
 
     @staticmethod
-    def build_combinatorial_sweep_vectors(sweeps):
+    def _sweep_dimensions(sweeps):
+        # Returns the keys and values of all non-empty sweeps, the number of
+        # parameter combinations and the number of combinations after which
+        # the value of each sweep changes (the first sweep changes fastest)
+        keys = [key for key in sweeps.keys() if len(sweeps[key]) > 0]
+        values = [np.asarray(sweeps[key], dtype=np.float64) for key in keys]
+        lens = [len(v) for v in values]
+        strides = np.cumprod([1] + lens[:-1], dtype=np.int64)
+        count = int(np.prod(lens, dtype=np.int64)) if len(keys) > 0 else 0
+        return keys, values, strides, count
+
+    @staticmethod
+    def count_combinatorial_sweep_vectors(sweeps):
         """
-        Given a dictionary containing the sweep, creates a matrix containing row
-        vectors for every parameter combination.
+        Returns the number of row vectors built by
+        build_combinatorial_sweep_vectors for the given sweeps.
         """
-        keys = sweeps.keys()
-
-        # Make sure we have no zero-length sweeps
-        for i, key in enumerate(keys):
-            if (len(sweeps[key]) == 0):
-                del keys[i]
-
-        ndims = len(keys)
-        dims = [0] * ndims
-        dim_lens = [len(sweeps[key]) for key in keys]
-        count = 0 if ndims == 0 else reduce(lambda x, y: x * y, dim_lens)
-        vecs = np.zeros((count, ndims))
-        for i in xrange(count):
-            # Copy the current values described by the index vector dims into
-            # the result matrix
-            for j in xrange(ndims):
-                vecs[i, j] = sweeps[keys[j]][dims[j]]
-
-            # Increment the index vector with overflow between dimensions
-            for j in xrange(ndims):
-                dims[j] = dims[j] + 1
-                if (dims[j] == dim_lens[j]):
-                    dims[j] = 0
-                else:
-                    break
+        return ExperimentDescriptor._sweep_dimensions(sweeps)[3]
 
+    @staticmethod
+    def build_combinatorial_sweep_vectors(sweeps, start=0, stop=None):
+        """
+        Given a dictionary containing the sweep, creates a matrix containing row
+        vectors for every parameter combination. The value of the first sweep
+        changes fastest. Sweeps without values are ignored.
+
+        :param start: index of the first row vector to build.
+        :param stop: index after the last row vector to build. If None, all
+        remaining row vectors are built.
+        :return: a tuple containing the keys of the sweeps corresponding to the
+        matrix columns and the matrix itself.
+        """
+        keys, values, strides, count = \
+                ExperimentDescriptor._sweep_dimensions(sweeps)
+        stop = count if stop is None else min(stop, count)
+        idcs = np.arange(start, max(start, stop), dtype=np.int64)
+
+        # Calculate the index into each sweep from the row index
+        vecs = np.zeros((len(idcs), len(keys)))
+        for j in xrange(len(keys)):
+            vecs[:, j] = values[j][(idcs // strides[j]) % len(values[j])]
         return keys, vecs
 
+    @staticmethod
+    def iter_combinatorial_sweep_vectors(sweeps, start=0, stop=None,
+            chunk_size=4096):
+        """
+        Lazily yields the row vectors of build_combinatorial_sweep_vectors with
+        the indices from start to stop, so huge parameter grids can be
+        processed or sharded without building the entire matrix. At most
+        chunk_size rows are held in memory at a time.
+        """
+        count = ExperimentDescriptor.count_combinatorial_sweep_vectors(sweeps)
+        stop = count if stop is None else min(stop, count)
+        for i in xrange(start, stop, chunk_size):
+            _, vecs = ExperimentDescriptor.build_combinatorial_sweep_vectors(
+                    sweeps, i, min(i + chunk_size, stop))
+            for vec in vecs:
+                yield vec
+
 class ExperimentSweep(dict):
     """
     Represents a parameter range with minimum and maximum value and the number
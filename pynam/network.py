@@ -25,11 +25,103 @@ import binam
 import entropy
 import data
 import utils
+from spikes import SpikeTable
 import bisect
 import itertools
 import numpy as np
 import pynnless as pynl
 
+# Record type of the structured arrays storing the connections of a network:
+# source population and neuron, target population and neuron, weight and delay
+CONNECTION_DTYPE = np.dtype([
+    ("pre_population", np.int32),
+    ("pre_neuron", np.int32),
+    ("post_population", np.int32),
+    ("post_neuron", np.int32),
+    ("weight", np.float64),
+    ("delay", np.float64)
+])
+
+def connections_to_array(connections):
+    """
+    Converts a list of PyNNLess connection tuples
+    ((pre_population, pre_neuron), (post_population, post_neuron), weight,
+    delay) to a structured array with the CONNECTION_DTYPE record type. Arrays
+    are returned unchanged.
+    """
+    if isinstance(connections, np.ndarray):
+        return connections
+    res = np.zeros(len(connections), dtype=CONNECTION_DTYPE)
+    for i, c in enumerate(connections):
+        res[i] = (c[0][0], c[0][1], c[1][0], c[1][1], c[2], c[3])
+    return res
+
+def connections_to_list(connections):
+    """
+    Converts a structured connection array to the list of connection tuples
+    expected by PyNNLess. Lists are returned unchanged.
+    """
+    if not isinstance(connections, np.ndarray):
+        return connections
+    return zip(zip(connections["pre_population"].tolist(),
+                   connections["pre_neuron"].tolist()),
+               zip(connections["post_population"].tolist(),
+                   connections["post_neuron"].tolist()),
+               connections["weight"].tolist(),
+               connections["delay"].tolist())
+
+def expand_parameters(params):
+    """
+    Converts a columnar parameter table as returned by
+    TopologyParameters.draw_population into the list of per-neuron parameter
+    dictionaries expected by PyNNLess and clamps each of them. Other parameter
+    descriptions are returned unchanged.
+    """
+    if (not isinstance(params, dict) or
+            not any(isinstance(v, np.ndarray) for v in params.values())):
+        return params
+    keys = params.keys()
+    return [pynl.PyNNLess.clamp_parameters(dict(zip(keys, row)))
+            for row in zip(*[np.asarray(params[key]).tolist()
+                             for key in keys])]
+
+def expand_projection(projection):
+    """
+    Expands a projection descriptor to a structured connection array. A
+    projection descriptor is a dictionary describing the connections between
+    two populations in terms of a (packed) binary mask: each set bit (i, j)
+    connects all "multiplicity" copies of neuron i in the "pre" population to
+    all copies of neuron j in the "post" population with weight "w". If
+    "sigma_w" is larger than zero, the weights are drawn from a normal
+    distribution using a random generator seeded with "seed".
+    """
+    s = projection["multiplicity"]
+    i, j = np.nonzero(binam.unpack(projection["mask"], projection["n_cols"]))
+    k = np.tile(np.repeat(np.arange(s), s), len(i))
+    l = np.tile(np.arange(s), len(i) * s)
+    res = np.zeros(len(i) * s * s, dtype=CONNECTION_DTYPE)
+    res["pre_population"] = projection["pre"]
+    res["pre_neuron"] = np.repeat(i, s * s) * s + k
+    res["post_population"] = projection["post"]
+    res["post_neuron"] = np.repeat(j, s * s) * s + l
+    res["delay"] = projection["delay"]
+    if projection["sigma_w"] > 0.0:
+        rng = np.random.RandomState(projection["seed"])
+        res["weight"] = np.maximum(0.0, rng.normal(projection["w"],
+                projection["sigma_w"], len(res)))
+    else:
+        res["weight"] = projection["w"]
+    return res
+
+def expand_connections(network):
+    """
+    Returns a structured array containing the explicit connections of the
+    given network followed by the expanded connections of all its projection
+    descriptors.
+    """
+    return np.concatenate([connections_to_array(network["connections"])]
+            + map(expand_projection, network.get("projections", [])))
+
 
 class DataParameters(dict):
     """
@@ -73,22 +165,15 @@ class DataParameters(dict):
                             + "\", must be one of {\"random\", \"balanced\", \"unique\"}!")
 
         # If n_ones_in and n_ones_out is not given, automatically calculate
-        # n_ones_in, n_ones_out and n_samples
-        if (self["n_ones_in"] <= 0) and (self["n_ones_out"] <= 0):
-            params = entropy.optimal_parameters(n_samples=self["n_samples"],
-                                                n_bits_in=self["n_bits_in"],
-                                                n_bits_out=self["n_bits_out"])
-            self["n_samples"] = params["n_samples"]
-            self["n_ones_in"] = params["n_ones_in"]
-            self["n_ones_out"] = params["n_ones_out"]
-
-        # Automatically choose the optimal number of samples
-        if self["n_samples"] <= 0:
-            self["n_samples"] = entropy.optimal_sample_count(
-                n_bits_out=self["n_bits_out"],
+        # n_ones_in, n_ones_out and n_samples. Automatically choose the optimal
+        # number of samples if it is not given. The values are memoised.
+        self["n_ones_in"], self["n_ones_out"], self["n_samples"] = \
+            entropy.resolve_data_parameters(
                 n_bits_in=self["n_bits_in"],
+                n_bits_out=self["n_bits_out"],
+                n_ones_in=self["n_ones_in"],
                 n_ones_out=self["n_ones_out"],
-                n_ones_in=self["n_ones_in"])
+                n_samples=self["n_samples"])
 
 
 class InputParameters(dict):
@@ -121,7 +206,7 @@ class InputParameters(dict):
         utils.init_key(self, data, "p0", p0)
         utils.init_key(self, data, "p1", p1)
 
-    def build_spike_train(self, value=1, offs=0.0):
+    def build_spike_train(self, value=1, offs=0.0, rng=None):
         """
         Builds a spike train representing the given binary value according to
         the parameters stored in the InputParameters dictionary.
@@ -130,12 +215,15 @@ class InputParameters(dict):
         train. If zero, spikes are only generated according to the probability
         p1.
         :param offs: total time offset.
+        :param rng: random number generator to draw from. If None, the global
+        numpy random number generator is used.
         """
+        rng = np.random if rng is None else rng
         res = []
 
         # Draw the actual spike offset
         if (self["sigma_t_offs"] > 0):
-            offs = np.random.normal(offs, self["sigma_t_offs"])
+            offs = rng.normal(offs, self["sigma_t_offs"])
 
         # Calculate the time of each spike
         if value == 1:
@@ -144,14 +232,49 @@ class InputParameters(dict):
             p = 1.0 - self["p1"]
 
         for i in xrange(self["burst_size"]):
-            if (np.random.uniform() >= p):
+            if (rng.uniform() >= p):
                 jitter = 0
                 if (self["sigma_t"] > 0):
-                    jitter = np.random.normal(0, self["sigma_t"])
+                    jitter = rng.normal(0, self["sigma_t"])
                 res.append(offs + i * self["isi"] + jitter)
         res.sort()
         return res
 
+    def build_spike_trains(self, values, offs=0.0, rng=None):
+        """
+        Batched version of build_spike_train: builds a spike train for each of
+        the given binary values at once. Returns an array with the shape of
+        values plus an additional axis of length "burst_size" containing the
+        sorted spike times of each spike train. Omitted spikes are set to
+        infinity and thus placed at the end of each spike train.
+
+        :param values: array of binary values that should be represented.
+        :param offs: time offset of each spike train, must be broadcastable to
+        the shape of values.
+        :param rng: random number generator to draw from. If None, the global
+        numpy random number generator is used.
+        """
+        rng = np.random if rng is None else rng
+        values = np.asarray(values)
+        shape = values.shape
+        B = self["burst_size"]
+
+        # Draw the actual spike offsets
+        offs = np.broadcast_to(np.asarray(offs, dtype=np.float64), shape)
+        if (self["sigma_t_offs"] > 0):
+            offs = rng.normal(offs, self["sigma_t_offs"])
+
+        # Calculate the time of each spike
+        times = offs[..., None] + np.arange(B) * self["isi"]
+        if (self["sigma_t"] > 0):
+            times = times + rng.normal(0, self["sigma_t"], shape + (B,))
+
+        # Omit spikes from a "one" with probability p0, introduce spikes for a
+        # "zero" with probability p1
+        p = np.where(values == 1, self["p0"], 1.0 - self["p1"])
+        times[rng.uniform(size=shape + (B,)) < p[..., None]] = np.inf
+        return np.sort(times, axis=-1)
+
 
 class OutputParameters(dict):
     """
@@ -225,26 +348,78 @@ class TopologyParameters(dict):
                                                    self["neuron_type"]),
             self["params"])
 
-    def draw(self):
+    def draw(self, rng=None):
         """
+        :param rng: random number generator to draw from. If None, the global
+        numpy random number generator is used.
         :return: Gives out the actual values for a random outcome off all
         parameters which appear in "param_noise" with given standard deviation
         """
+        rng = np.random if rng is None else rng
         res = dict(self["params"])
         for key in res.keys():
             if key in self["param_noise"] and self["param_noise"][key] > 0:
-                res["key"] = np.random.normal(res["key"],
-                                              self["param_noise"][key])
+                res[key] = rng.normal(res[key], self["param_noise"][key])
         return pynl.PyNNLess.clamp_parameters(res)
 
-    def draw_weight(self):
+    def has_param_noise(self):
+        """
+        Returns True if any of the neuron parameters has a positive standard
+        deviation in "param_noise".
+        """
+        return any(self["param_noise"].get(key, 0) > 0
+                   for key in self["params"])
+
+    def draw_population(self, count, rng=None):
+        """
+        Population-level version of draw: samples all parameters of count
+        neurons at once.
+
+        :param count: number of neurons in the population.
+        :param rng: random number generator to draw from. If None, the global
+        numpy random number generator is used.
+        :return: a columnar parameter table -- a dictionary containing an array
+        with count values for each parameter. The values are not clamped yet,
+        PyNNLess.clamp_parameters is applied to each neuron when the table is
+        expanded by expand_parameters.
+        """
+        rng = np.random if rng is None else rng
+        res = {}
+        for key in sorted(self["params"].keys()):
+            value = self["params"][key]
+            sigma = self["param_noise"].get(key, 0)
+            if sigma > 0:
+                col = rng.normal(value, sigma, count)
+            else:
+                col = np.full(count, value, dtype=np.float64)
+            res[key] = col
+        return res
+
+    def draw_weight(self, rng=None):
         """
+        :param rng: random number generator to draw from. If None, the global
+        numpy random number generator is used.
         :return: If the weights have no jitter,return w, else return random
         value with standard deviation sigma_w
         """
         if self["sigma_w"] <= 0.0:
             return self["w"]
-        return max(0.0, np.random.normal(self["w"], self["sigma_w"]))
+        rng = np.random if rng is None else rng
+        return max(0.0, rng.normal(self["w"], self["sigma_w"]))
+
+    def draw_weights(self, count, rng=None):
+        """
+        Vectorised version of draw_weight, returns an array containing count
+        weights.
+
+        :param count: number of weights to draw.
+        :param rng: random number generator to draw from. If None, the global
+        numpy random number generator is used.
+        """
+        if self["sigma_w"] <= 0.0:
+            return np.full(count, self["w"], dtype=np.float64)
+        rng = np.random if rng is None else rng
+        return np.maximum(0.0, rng.normal(self["w"], self["sigma_w"], count))
 
 
 class NetworkBuilder:
@@ -257,6 +432,9 @@ class NetworkBuilder:
     # Data parameters
     data_params = None
 
+    # BiNAM trained with the input and output data, see train_binam
+    mem = None
+
     @staticmethod
     def _n_ones(mat):
         m, n = mat.shape
@@ -266,7 +444,34 @@ class NetworkBuilder:
         else:
             return 0
 
-    def __init__(self, mat_in=None, mat_out=None, data_params=None, seed=None):
+    @staticmethod
+    def data_jobs(data_params, seed=None):
+        """
+        Returns the GenerationExecutor jobs producing the input and output
+        matrices for the given data parameters and seed.
+        """
+        dp = DataParameters(data_params)
+        return [
+            (dp["algorithm"], dp["n_bits_in"], dp["n_ones_in"],
+             dp["n_samples"], None if seed is None else (seed, "data_in")),
+            (dp["algorithm"], dp["n_bits_out"], dp["n_ones_out"],
+             dp["n_samples"], None if seed is None else (seed, "data_out"))]
+
+    @staticmethod
+    def neuron_count_static(data_params, topology_params={},
+                            count_sources=False):
+        """
+        Returns the number of neurons of the network built for the given data
+        and topology parameters without building it.
+        """
+        dp = DataParameters(data_params)
+        s = int(TopologyParameters(topology_params)["multiplicity"])
+        if count_sources:
+            return (dp["n_bits_in"] + dp["n_bits_out"]) * s
+        return dp["n_bits_out"] * s
+
+    def __init__(self, mat_in=None, mat_out=None, data_params=None, seed=None,
+                 executor=None, mem=None):
         """
         Constructor of the NetworkBuilder class -- the NetworkBuilder collects
         information about a network (storage matrix, noise parameters and input
@@ -274,6 +479,15 @@ class NetworkBuilder:
 
         :param mat_in: Nxm matrix containing the input data
         :param mat_out: Nxn matrix containing the output data
+        :param data_params: data parameters used to generate the input and
+        output matrices if none are given.
+        :param seed: seed (or tuple of stream keys) used for the generation of
+        the input and output data, see utils.random_stream.
+        :param executor: optional data.GenerationExecutor instance used to
+        generate the input and output matrices concurrently. The result is the
+        same as without executor.
+        :param mem: optional BiNAM already trained with the input and output
+        data, as returned by train_binam. Trained on first use if None.
         """
 
         # Make sure that either data parameters are given or an input
@@ -283,29 +497,14 @@ class NetworkBuilder:
 
         if mat_in is None:
             # Use the supplied data parameters -- generate the data matrices
+            # with the given seed
             self.data_params = DataParameters(data_params)
-
-            # Select the data generation function
-            if self.data_params["algorithm"] == "balanced":
-                gen_fun = data.generate
-            elif self.data_params["algorithm"] == "random":
-                gen_fun = data.generate_random
-            elif self.data_params["algorithm"] == "unique":
-                gen_fun = (lambda n_bits, n_ones, n_samples, seed:
-                           data.generate(n_bits, n_ones, n_samples, seed,
-                                         balance=False))
-
-            # Generate the data with the given seed
-            self.mat_in = gen_fun(
-                n_bits=self.data_params["n_bits_in"],
-                n_ones=self.data_params["n_ones_in"],
-                n_samples=self.data_params["n_samples"],
-                seed=(None if seed is None else (seed + 5)))
-            self.mat_out = gen_fun(
-                n_bits=self.data_params["n_bits_out"],
-                n_ones=self.data_params["n_ones_out"],
-                n_samples=self.data_params["n_samples"],
-                seed=(None if seed is None else (seed + 6) * 2))
+            jobs = self.data_jobs(self.data_params, seed)
+            if executor is None:
+                self.mat_in, self.mat_out = map(
+                    lambda job: data.generate_by_algorithm(*job), jobs)
+            else:
+                self.mat_in, self.mat_out = executor.map(jobs)
 
         else:
             # If a matrices are given, derive the data parameters from those
@@ -320,20 +519,76 @@ class NetworkBuilder:
                 n_ones_out=self._n_ones(mat_out),
                 n_samples=mat_in.shape[0])
 
-    def build_topology(self, seed=None, topology_params={}):
+        self.mem = mem
+
+    @staticmethod
+    def _packed(mat, n_bits, n_samples):
+        # Returns the first n_samples rows of a data matrix in packed form
+        if isinstance(mat, binam.BinaryMatrix):
+            return mat.arr[:n_samples]
+        return binam.pack(np.asarray(mat)[:n_samples].reshape((-1, n_bits)))
+
+    def train_binam(self):
+        """
+        Returns a BiNAM trained with all samples of the input and output data.
+        Instead of training the samples one after the other, each row of the
+        storage matrix is calculated in a single step: row i is the bitwise or
+        of the packed output samples whose input sample has bit i set. The
+        BiNAM is only trained once, later calls return the same instance.
+        """
+        if not self.mem is None:
+            return self.mem
+        m = self.data_params["n_bits_in"]
+        n = self.data_params["n_bits_out"]
+        N = self.data_params["n_samples"]
+        if isinstance(self.mat_in, binam.BinaryMatrix):
+            mat_in = self.mat_in.get()[:N]
+        else:
+            mat_in = np.asarray(self.mat_in)[:N].reshape((-1, m))
+        mat_out = self._packed(self.mat_out, n, N)
+        arr = np.zeros((m, mat_out.shape[1]), dtype=binam.BinaryMatrix.int_type)
+        for i in xrange(m):
+            arr[i] = np.bitwise_or.reduce(mat_out[mat_in[:, i] != 0], axis=0)
+        self.mem = binam.BiNAM()
+        self.mem.set_packed(arr, n)
+        return self.mem
+
+    def resource_usage(self, topology_params={}):
+        """
+        Returns the resources required by the network built for the given
+        topology parameters without building it. The result is a dictionary
+        containing the number of output neurons ("neurons"), input spike
+        sources ("sources") and synapses ("synapses"), as well as the maximum
+        number of synapses targeting a single neuron ("fan_in").
+
+        """
+        s = int(TopologyParameters(topology_params)["multiplicity"])
+        mem = self.train_binam()
+        fan_in = np.sum(binam.unpack(mem.arr, mem.n_out()), axis=0)
+        return {
+            "neurons": self.data_params["n_bits_out"] * s,
+            "sources": self.data_params["n_bits_in"] * s,
+            "synapses": int(np.sum(binam.popcount(mem.arr))) * s * s,
+            "fan_in": int(np.max(fan_in)) * s if len(fan_in) > 0 else 0
+        }
+
+    def build_topology(self, seed=None, topology_params={}, rng=None):
         """
         Builds a network for a BiNAM that has been trained up to the k'th sample
+
+        :param seed: seed from which the random stream for the neuron parameter
+        and weight noise is derived. Ignored if rng is given.
+        :param rng: random number generator that should be used.
         """
+        if rng is None:
+            rng = utils.random_stream(seed, "topology")
 
         # Fetch the data parameters for convenient access
-        N = self.data_params["n_samples"]
         m = self.data_params["n_bits_in"]
         n = self.data_params["n_bits_out"]
 
-        # Train the BiNAM
-        mem = binam.BiNAM(m, n)
-        for k in xrange(0, N):
-            mem.train(self.mat_in[k], self.mat_out[k])
+        # Fetch the trained BiNAM
+        mem = self.train_binam()
 
         # Build input and output neurons
         t = TopologyParameters(topology_params)
@@ -345,44 +600,44 @@ class NetworkBuilder:
         net.add_population(count=population_input_size, _type=pynl.TYPE_SOURCE,
                            params=population_input_params)
 
+        # Draw a columnar parameter table for the output neurons
         population_output_size = n * s
-        population_output_params = list(t.draw()
-                                        for _ in xrange(population_output_size))
+        population_output_params = t.draw_population(population_output_size,
+                                                     rng)
         net.add_population(count=population_output_size, _type=t["neuron_type"],
                            params=population_output_params,
                            record=pynl.SIG_SPIKES)
 
-        def in_coord(i, k=1):
-            return (0, i * s + k)
-
-        def out_coord(j, k=1):
-            return (1, j * s + k)
-
-        # Add all connections
-        for i in xrange(m):
-            for j in xrange(n):
-                if mem[i, j] != 0:
-                    net.add_connections([
-                                            (in_coord(i, k), out_coord(j, l),
-                                             t.draw_weight(), 0.0)
-                                            for k in xrange(s) for l in
-                                            xrange(s)])
+        # Describe the connections by the trained BiNAM -- each set bit (i, j)
+        # connects all s copies of input neuron i to all s copies of output
+        # neuron j. The synapses are only expanded when the network is handed
+        # to the simulator.
+        net["connections"] = np.zeros(0, dtype=CONNECTION_DTYPE)
+        net["projections"] = [{
+            "pre": 0,
+            "post": 1,
+            "mask": mem.arr.copy(),
+            "n_cols": n,
+            "multiplicity": s,
+            "w": t["w"],
+            "sigma_w": t["sigma_w"],
+            "delay": 0.0,
+            "seed": rng.randint(1 << 31) if t["sigma_w"] > 0.0 else None
+        }]
         return net
 
     @staticmethod
-    def build_spike_trains(mat, time_offs=0, topology_params={},
-                           input_params={}, input_params_delay=10):
+    def build_spike_table(mat, time_offs=0, topology_params={},
+                          input_params={}, input_params_delay=10, rng=None):
         """
-        Builds a list of spike trains as encoded in the given matrix, consisting
-        of one sample per row.
+        Builds a SpikeTable containing the spike trains encoded in the given
+        matrix, consisting of one sample per row. All spike trains of an input
+        parameter set are synthesised at once. Random numbers are drawn from
+        rng, or the global numpy random number generator if rng is None.
+        Returns the SpikeTable and the sample indices at which new input
+        parameter sets start.
         """
 
-        def rmin(xs):
-            """
-            Robust min function, returns Inf if xs is empty.
-            """
-            return np.inf if len(xs) == 0 else min(xs)
-
         # Fetch the data parameters for convenient access
         N = mat.shape[0]
         m = mat.shape[1]
@@ -400,44 +655,60 @@ class NetworkBuilder:
         # Fetch the multiplicity s from the topology parameters
         s = TopologyParameters(topology_params)["multiplicity"]
 
-        # Resulting times and indices
-        input_times = [[] for _ in xrange(s * m)]
-        input_indices = [[] for _ in xrange(s * m)]
-
-        # Handle all input parameter sets
+        # Synthesise the spike trains for each input parameter set on the
+        # (neuron, sample, burst) grid, where neuron i * s + j is the j-th copy
+        # of the i-th input bit
+        times = []
+        samples = []
         t = 0
         sIdx = 0
-        min_t = np.inf
         for ip in input_params:
             # Convert the parameters into a normalized InputParameters instance
             p = InputParameters(ip)
-
-            # Calculate the maximum number of spikes, create two two-dimensional
-            # matrix which contain the spike times and the sample indics
-            for l in xrange(N):
-                for i in xrange(m):
-                    for j in xrange(s):
-                        train = p.build_spike_train(value=X[l, i], offs=t)
-                        idx = i * s + j
-                        input_times[idx] = input_times[idx] + train
-                        input_indices[idx] = (input_indices[idx] +
-                                              [sIdx] * len(train))
-                sIdx = sIdx + 1
-                t = t + p["time_window"]
-            t = t + p["time_window"] * input_params_delay
-
-        # Offset the first spike time to time_offs
-        min_t = min(map(rmin, input_times))
-        input_times = map(lambda ts: map(lambda t: t - min_t + time_offs, ts),
-                          input_times)
+            B = p["burst_size"]
+
+            values = np.repeat(X.T, s, axis=0)
+            offs = t + np.arange(N) * p["time_window"]
+            times.append(p.build_spike_trains(values, offs, rng).reshape(
+                (s * m, N * B)))
+            samples.append(np.repeat(np.arange(sIdx, sIdx + N,
+                                               dtype=np.int32), B))
+            sIdx = sIdx + N
+            t = t + p["time_window"] * (N + input_params_delay)
+        times = np.concatenate(times, axis=1)
+        samples = np.broadcast_to(np.concatenate(samples), times.shape)
+
+        # Remove omitted spikes, offset the first spike time to time_offs
+        valid = np.isfinite(times)
+        times = times[valid]
+        if len(times) > 0:
+            times = times - np.min(times) + time_offs
+        table = SpikeTable(times=times,
+                           neurons=np.nonzero(valid)[0],
+                           samples=samples[valid],
+                           n_neurons=s * m)
 
         # Store the sample indices at which new input parameter sets start
         input_split = range(N, N * (len(input_params) + 1), N)
 
+        return table, input_split
+
+    @staticmethod
+    def build_spike_trains(mat, time_offs=0, topology_params={},
+                           input_params={}, input_params_delay=10, rng=None):
+        """
+        Builds a list of spike trains as encoded in the given matrix, consisting
+        of one sample per row. Returns a list with spike times for each neuron,
+        a similar list containing the sample index for each spike time and the
+        sample indices at which new input parameter sets start.
+        """
+        table, input_split = NetworkBuilder.build_spike_table(mat, time_offs,
+                topology_params, input_params, input_params_delay, rng)
+        input_times, input_indices = table.to_ragged()
         return input_times, input_indices, input_split
 
     def build_input(self, time_offs=0, topology_params={},
-                    input_params={}, input_params_delay=10):
+                    input_params={}, input_params_delay=10, rng=None):
         """
         Builds the input spike trains for the network with the given input
         parameter sets. Returns a list with spike times for each neuron as first
@@ -447,7 +718,7 @@ class NetworkBuilder:
         """
         return self.build_spike_trains(self.mat_in, time_offs,
                                        topology_params, input_params,
-                                       input_params_delay)
+                                       input_params_delay, rng)
 
     def inject_input(self, topology, times):
         """
@@ -461,28 +732,24 @@ class NetworkBuilder:
               meta_data={}, seed=None):
         """
         Builds a network with the given topology and input data that is ready
-        to be handed of to PyNNLess.
+        to be handed of to PyNNLess. The topology and the input spike trains
+        are drawn from independent random streams derived from the given seed
+        (which may be an integer or a tuple of keys).
         """
 
-        old_state = utils.initialize_seed(seed, 1)
-        try:
-            topology = self.build_topology(topology_params=topology_params)
-        finally:
-            utils.finalize_seed(old_state)
+        topology = self.build_topology(topology_params=topology_params,
+                                       rng=utils.random_stream(seed,
+                                                               "topology"))
 
-        old_state = utils.initialize_seed(seed, 2)
-        try:
-            input_times, input_indices, input_split = self.build_input(
-                time_offs=time_offs,
-                topology_params=topology_params,
-                input_params=input_params)
-        finally:
-            utils.finalize_seed(old_state)
+        input_spikes, input_split = self.build_spike_table(self.mat_in,
+            time_offs=time_offs,
+            topology_params=topology_params,
+            input_params=input_params,
+            rng=utils.random_stream(seed, "input"))
 
         return NetworkInstance(
-            self.inject_input(topology, input_times),
-            input_times=input_times,
-            input_indices=input_indices,
+            self.inject_input(topology, input_spikes.to_ragged()[0]),
+            input_spikes=input_spikes,
             input_split=input_split,
             input_params=input_params,
             data_params=self.data_params,
@@ -492,23 +759,73 @@ class NetworkBuilder:
             mat_out=self.mat_out)
 
 
+# Legacy keys under which the spike tables used to be stored as lists of lists,
+# mapped onto the corresponding table and column
+_LEGACY_SPIKE_KEYS = {
+    "input_times": ("input_spikes", 0),
+    "input_indices": ("input_spikes", 1),
+    "output_times": ("output_spikes", 0),
+    "output_indices": ("output_spikes", 1)
+}
+
+def _init_spikes(obj, data, key, table, times, indices):
+    """
+    Initializes the SpikeTable stored under the given key ("input_spikes" or
+    "output_spikes") either from the table in data, the legacy lists of lists
+    in data, the given table or the given legacy lists.
+    """
+    prefix = key[:-len("_spikes")]
+    if key in data and not data[key] is None:
+        obj[key] = data[key]
+    elif not table is None:
+        obj[key] = table
+    else:
+        if (prefix + "_times") in data:
+            times = data[prefix + "_times"]
+            indices = data.get(prefix + "_indices", None)
+        obj[key] = SpikeTable.from_ragged(times, indices)
+
+def _missing_spike_key(obj, key):
+    """
+    Implements the __missing__ method of the classes storing spike tables:
+    provides the legacy keys as a list of lists view of the tables and
+    converts objects which still store the legacy keys (e.g. after unpickling)
+    on first access.
+    """
+    if key in _LEGACY_SPIKE_KEYS:
+        table_key, column = _LEGACY_SPIKE_KEYS[key]
+        return obj[table_key].to_ragged()[column]
+    if key in ["input_spikes", "output_spikes"]:
+        prefix = key[:-len("_spikes")]
+        if (prefix + "_times") in obj:
+            obj[key] = SpikeTable.from_ragged(obj[prefix + "_times"],
+                    obj.get(prefix + "_indices", None))
+            return obj[key]
+    raise KeyError(key)
+
+
 class NetworkInstance(dict):
     """
-    Concrete instance of a BiNAM network that can be passed to the PyNNLess run
-    method. A NetworkInstance can contain a time multiplex of simulations
-    (with different input parameters). It provides a build_analysis method which
-    splits the time multiplexed results into individual NetworkAnalysis objects.
+    Concrete instance of a BiNAM network. A NetworkInstance can contain a time
+    multiplex of simulations (with different input parameters). It provides a
+    build_analysis method which splits the time multiplexed results into
+    individual NetworkAnalysis objects.
+
+    The connections of the BiNAM are stored as lazily expanded projection
+    descriptors in "projections", so the instance itself must not be passed to
+    the PyNNLess run method -- pass the result of to_pynnless instead.
     """
 
     def __init__(self, data={}, populations=[], connections=[],
                  input_times=[], input_indices=[], input_split=[],
                  input_params={},
                  data_params={}, topology_params={}, meta_data={}, mat_in=[],
-                 mat_out=[]):
+                 mat_out=[], input_spikes=None, projections=[]):
         utils.init_key(self, data, "populations", populations)
         utils.init_key(self, data, "connections", connections)
-        utils.init_key(self, data, "input_times", input_times)
-        utils.init_key(self, data, "input_indices", input_indices)
+        utils.init_key(self, data, "projections", projections)
+        _init_spikes(self, data, "input_spikes", input_spikes, input_times,
+                     input_indices)
         utils.init_key(self, data, "input_split", input_split)
         utils.init_key(self, data, "input_params", input_params)
         utils.init_key(self, data, "data_params", data_params)
@@ -524,6 +841,31 @@ class NetworkInstance(dict):
         self["data_params"] = DataParameters(self["data_params"])
         self["topology_params"] = TopologyParameters(self["topology_params"])
 
+    def __missing__(self, key):
+        return _missing_spike_key(self, key)
+
+    @staticmethod
+    def to_pynnless_static(network):
+        """
+        Returns a copy of the given network which can be handed to PyNNLess,
+        with columnar parameter tables and projection descriptors expanded and
+        all connections converted to a list of connection tuples.
+        """
+        res = dict(network)
+        res["populations"] = [
+            dict(p, params=expand_parameters(p["params"])) if "params" in p
+            else p for p in network["populations"]]
+        res["connections"] = connections_to_list(expand_connections(network))
+        res.pop("projections", None)
+        return res
+
+    def to_pynnless(self):
+        """
+        Returns a copy of the network which can be handed to the PyNNLess run
+        method, see to_pynnless_static.
+        """
+        return NetworkInstance.to_pynnless_static(self)
+
     @staticmethod
     def flatten(times, indices, sort_by_sample=False):
         """
@@ -531,34 +873,26 @@ class NetworkInstance(dict):
         one-dimensional arrays containing the spike time, sample indices and
         neuron indices.
         """
+        return SpikeTable.from_ragged(times, indices).flatten(sort_by_sample)
 
-        # Calculate the total count of spikes
-        count = reduce(lambda x, y: x + y, map(len, times))
+    @staticmethod
+    def match_table(input_spikes, output_spikes):
+        """
+        Calculates the sample index for each output spike. Returns a copy of
+        the output_spikes SpikeTable with the sample indices set.
+        """
 
-        # Initialize the flat arrays containing the times, indices and neuron
-        # indices
-        tF = np.zeros(count)
-        kF = np.zeros(count, dtype=np.int32)
-        nF = np.zeros(count, dtype=np.int32)
+        # Flatten and sort the input times and input indices for efficient search
+        tIn, kIn, _ = input_spikes.flatten()
 
-        # Iterate over all neurons and all spike times
-        c = 0
-        for i in xrange(len(times)):
-            for j in xrange(len(times[i])):
-                tF[c] = times[i][j]
-                kF[c] = indices[i][j]
-                nF[c] = i
-                c = c + 1
-
-        # Sort the arrays by spike time or sample
-        if sort_by_sample:
-            I = np.lexsort((kF, tF))
-        else:
-            I = np.argsort(tF)
-        tF = tF[I]
-        kF = kF[I]
-        nF = nF[I]
-        return tF, kF, nF
+        # Each output spike belongs to the sample of the input spike preceding
+        # it. Spikes before the first input spike are assigned to the first
+        # sample.
+        if len(tIn) > 0:
+            idx = np.maximum(0, np.searchsorted(tIn, output_spikes.times,
+                                                side="left") - 1)
+            return output_spikes.with_samples(kIn[idx])
+        return output_spikes.with_samples(np.zeros(len(output_spikes)))
 
     @staticmethod
     def match_static(input_times, input_indices, output_times):
@@ -567,25 +901,10 @@ class NetworkInstance(dict):
         calculates the sample index for each output spike.
         """
 
-        # Flatten and sort the input times and input indices for efficient search
-        tIn, kIn, _ = NetworkInstance.flatten(input_times, input_indices)
-
-        # Build the output times
-        output_count = len(output_times)
-
-        # Build the output indices
-        output_indices = [[] for _ in xrange(output_count)]
-        for i in xrange(output_count):
-            output_indices[i] = [0 for _ in xrange(len(output_times[i]))]
-            for j in xrange(len(output_times[i])):
-                t = output_times[i][j]
-                idx = bisect.bisect_left(tIn, t)
-                if idx > 0:
-                    idx = idx - 1
-                if idx < len(tIn):
-                    output_indices[i][j] = kIn[idx]
-
-        return output_times, output_indices
+        output_spikes = NetworkInstance.match_table(
+            SpikeTable.from_ragged(input_times, input_indices),
+            SpikeTable.from_ragged(output_times))
+        return output_times, output_spikes.to_ragged()[1]
 
     def match(self, output):
         """
@@ -593,8 +912,10 @@ class NetworkInstance(dict):
         calculates the sample index for each output spike.
         """
 
-        return self.match_static(self["input_times"], self["input_indices"],
-                                 output[1]["spikes"])
+        output_spikes = self.match_table(self["input_spikes"],
+                                         SpikeTable.from_ragged(
+                                             output[1]["spikes"]))
+        return output[1]["spikes"], output_spikes.to_ragged()[1]
 
     @staticmethod
     def split(times, indices, k0, k1):
@@ -602,59 +923,55 @@ class NetworkInstance(dict):
         Gives back all times and their indices whose index lies between
         k0 and k1
         """
-        times_part = [[] for _ in xrange(len(times))]
-        indices_part = [[] for _ in xrange(len(indices))]
-        for i in xrange(len(times)):
-            for j in xrange(len(times[i])):
-                if indices[i][j] >= k0 and indices[i][j] < k1:
-                    times_part[i].append(times[i][j])
-                    indices_part[i].append(indices[i][j] - k0)
-        return times_part, indices_part
+        return NetworkInstance.split_all(times, indices, [k1], k0)[0]
+
+    @staticmethod
+    def split_all(times, indices, bounds, k0=0):
+        """
+        Splits the given times and indices into multiple parts in a single
+        pass. Part i contains all times and indices whose index lies between
+        bounds[i - 1] (or k0 for the first part) and bounds[i], the indices are
+        relative to the lower bound.
+        """
+        return [part.to_ragged() for part in SpikeTable.from_ragged(
+            times, indices).split_samples(bounds, k0)]
 
     @staticmethod
-    def build_analysis_static(input_times, input_indices, output, input_params,
+    def build_analysis_static(input_spikes, output, input_params,
                               data_params, topology_params, meta_data, mat_in,
                               mat_out,
                               input_split=[]):
         """
         Analysis of the given data: returns a NetworkAnalysis dictionary
         """
-        # Fetch the output times and output indices
-        output_times, output_indices = NetworkInstance.match_static(input_times,
-                                                                    input_indices,
-                                                                    output[1][
-                                                                        "spikes"])
+        # Assign the output spikes to the samples
+        output_spikes = NetworkInstance.match_table(input_spikes,
+                                                    SpikeTable.from_ragged(
+                                                        output[1]["spikes"]))
 
         # Only assume a single split if no input_split descriptor is given
         if (len(input_split) == 0):
-            input_split = [max(map(max, input_indices)) + 1]
+            input_split = [int(np.max(input_spikes.samples)) + 1]
 
         # Split input and output spikes according to the input_split map, create
         # a NetworkAnalysis instance for each split
         res = []
-        k0 = 0
-        for i, k in enumerate(input_split):
-            input_times_part, input_indices_part = NetworkInstance.split(
-                input_times, input_indices, k0, k)
-            output_times_part, output_indices_part = NetworkInstance.split(
-                output_times, output_indices, k0, k)
+        input_parts = input_spikes.split_samples(input_split)
+        output_parts = output_spikes.split_samples(input_split)
+        for i in xrange(len(input_split)):
             res.append(NetworkAnalysis(
-                input_times=input_times_part,
-                input_indices=input_indices_part,
-                output_times=output_times_part,
-                output_indices=output_indices_part,
+                input_spikes=input_parts[i],
+                output_spikes=output_parts[i],
                 input_params=input_params[i],
                 data_params=data_params,
                 topology_params=topology_params,
                 meta_data=meta_data,
                 mat_in=mat_in,
                 mat_out=mat_out))
-            k0 = k
         return res
 
     def build_analysis(self, output):
-        return self.build_analysis_static(self["input_times"],
-                                          self["input_indices"], output,
+        return self.build_analysis_static(self["input_spikes"], output,
                                           self["input_params"],
                                           self["data_params"],
                                           self["topology_params"],
@@ -681,6 +998,25 @@ class NetworkInstance(dict):
         return NetworkInstance.neuron_count_static(self["populations"],
                                                    count_sources)
 
+    @staticmethod
+    def synapse_count_static(connections, projections=[]):
+        """
+        Returns the number of synapses described by the given connections and
+        projection descriptors without expanding the projections.
+        """
+        res = len(connections)
+        for p in projections:
+            res = res + (int(np.sum(binam.popcount(p["mask"])))
+                         * p["multiplicity"] ** 2)
+        return res
+
+    def synapse_count(self):
+        """
+        Returns the number of synapses in the network
+        """
+        return NetworkInstance.synapse_count_static(self["connections"],
+                                                    self.get("projections", []))
+
 
 class NetworkPool(dict):
     """
@@ -688,19 +1024,31 @@ class NetworkPool(dict):
     allows to add an arbitrary count of NetworkInstance objects and provides
     a "build_analysis" method which splits the network output into individual
     NetworkAnalysis object for each time/spatial multiplex.
+
+    The connections and input spikes of added networks are kept as pending
+    segments and only flattened by "finalize", which happens automatically
+    when either of them is read through one of the dictionary methods (item
+    access, get, pop, items, values, copy and their iterator and view variants)
+    or the pool is pickled. Note that dict(pool) and dict.update(pool) copy the
+    underlying dictionary without calling any of these methods, so finalize
+    must be called before.
     """
 
+    # Keys which are assembled from the pending segments by finalize
+    SEGMENTED_KEYS = ["connections", "input_spikes"]
+
     def __init__(self, data={}, name="", populations=[], connections=[],
                  input_times=[], input_indices=[], input_split=[],
                  spatial_split=[],
                  input_params=[], data_params=[], topology_params=[],
                  meta_data=[],
-                 mat_in=[], mat_out=[]):
+                 mat_in=[], mat_out=[], input_spikes=None, projections=[]):
         utils.init_key(self, data, "name", name)
         utils.init_key(self, data, "populations", populations)
         utils.init_key(self, data, "connections", connections)
-        utils.init_key(self, data, "input_times", input_times)
-        utils.init_key(self, data, "input_indices", input_indices)
+        utils.init_key(self, data, "projections", projections)
+        _init_spikes(self, data, "input_spikes", input_spikes, input_times,
+                     input_indices)
         utils.init_key(self, data, "input_split", input_split)
         utils.init_key(self, data, "spatial_split", spatial_split)
         utils.init_key(self, data, "input_params", input_params)
@@ -721,23 +1069,97 @@ class NetworkPool(dict):
             self["mat_out"] = [self["mat_out"]]
             self["spatial_split"].append({
                 "population": len(self["populations"]),
-                "input": len(self["input_times"])
+                "input": self["input_spikes"].n_neurons
             });
 
+        # Segments added by add_network which have not been flattened yet
+        self._pending = []
+
+        # Neuron, source and synapse counters, initialized on first access
+        self._counters = None
+
+    def __missing__(self, key):
+        return _missing_spike_key(self, key)
+
+    def _finalize_pending(self):
+        if getattr(self, "_pending", None):
+            self.finalize()
+
+    def __getitem__(self, key):
+        if key in self.SEGMENTED_KEYS:
+            self._finalize_pending()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self.SEGMENTED_KEYS:
+            self._finalize_pending()
+        return dict.get(self, key, default)
+
+    def pop(self, key, *args):
+        if key in self.SEGMENTED_KEYS:
+            self._finalize_pending()
+        return dict.pop(self, key, *args)
+
+    def items(self):
+        self._finalize_pending()
+        return dict.items(self)
+
+    def iteritems(self):
+        self._finalize_pending()
+        return dict.iteritems(self)
+
+    def viewitems(self):
+        self._finalize_pending()
+        return dict.viewitems(self)
+
+    def values(self):
+        self._finalize_pending()
+        return dict.values(self)
+
+    def itervalues(self):
+        self._finalize_pending()
+        return dict.itervalues(self)
+
+    def viewvalues(self):
+        self._finalize_pending()
+        return dict.viewvalues(self)
+
+    def copy(self):
+        self._finalize_pending()
+        return dict.copy(self)
+
     def add_network(self, network):
         """
-        Adds a new NetworkInstance to the execution pool.
+        Adds a new NetworkInstance to the execution pool. The connections and
+        input spikes of the network are stored as a pending segment, so adding
+        a network takes time proportional to its number of populations.
         """
 
-        # Old population and connection count
-        nP0 = len(self["populations"])
-        nC0 = len(self["connections"])
+        # Update the neuron, source and synapse counters
+        counters = self._get_counters()
+        neurons = network.neuron_count()
+        counters["neurons"] += neurons
+        counters["sources"] += network.neuron_count(True) - neurons
+        counters["synapses"] += network.synapse_count()
 
-        # Append the network to the pool network
-        self["populations"] = self["populations"] + network["populations"]
-        self["connections"] = self["connections"] + network["connections"]
-        self["input_times"] = self["input_times"] + network["input_times"]
-        self["input_indices"] = self["input_indices"] + network["input_indices"]
+        # Old population and input neuron count
+        nP0 = len(self["populations"])
+        if len(self["spatial_split"]) > 0:
+            nI0 = self["spatial_split"][-1]["input"]
+        else:
+            nI0 = self["input_spikes"].n_neurons
+
+        # Append the network to the pool network, adapt the population indices
+        # of the newly added projections. Connections and input spikes are
+        # appended as segment along with the population offset.
+        if not hasattr(self, "_pending"):
+            self._pending = []
+        self._pending.append((nP0, network["connections"],
+                              network["input_spikes"]))
+        self.setdefault("projections", []).extend(
+            dict(p, pre=p["pre"] + nP0, post=p["post"] + nP0)
+            for p in network.get("projections", []))
+        self["populations"].extend(network["populations"])
         self["input_split"].append(network["input_split"])
         self["input_params"].append(network["input_params"])
         self["data_params"].append(network["data_params"])
@@ -749,16 +1171,9 @@ class NetworkPool(dict):
         # Add a "spatial_split" -- this allows to dissect the network into its
         # original parts after the result is available
         nP1 = len(self["populations"])
-        nC1 = len(self["connections"])
-        nI1 = len(self["input_times"])
+        nI1 = nI0 + network["input_spikes"].n_neurons
         self["spatial_split"].append({"population": nP1, "input": nI1});
 
-        # Adapt the connection population indices of the newly added connections
-        for i in xrange(nC0, nC1):
-            c = self["connections"][i]
-            self["connections"][i] = ((c[0][0] + nP0, c[0][1]),
-                                      (c[1][0] + nP0, c[1][1]), c[2], c[3])
-
     def add_networks(self, networks):
         """
         Adds a list of NetworkInstance instances to the execution pool.
@@ -766,6 +1181,37 @@ class NetworkPool(dict):
         for network in networks:
             self.add_network(network)
 
+    def finalize(self):
+        """
+        Flattens the pending segments added by add_network into the
+        "connections" and "input_spikes" of the pool. The population indices of
+        all pending connections are shifted in a single vectorised step.
+        """
+        pending = getattr(self, "_pending", [])
+        self._pending = []
+        if len(pending) == 0:
+            return self
+
+        connections = [connections_to_array(c) for _, c, _ in pending]
+        offsets = np.repeat([offs for offs, _, _ in pending],
+                            map(len, connections))
+        connections = np.concatenate(connections)
+        connections["pre_population"] += offsets
+        connections["post_population"] += offsets
+        self["connections"] = np.concatenate(
+            (connections_to_array(self["connections"]), connections))
+        self["input_spikes"] = SpikeTable.concatenate(
+            [self["input_spikes"]] + [spikes for _, _, spikes in pending])
+        return self
+
+    def to_pynnless(self):
+        """
+        Returns a copy of the pool which can be handed to PyNNLess, see
+        NetworkInstance.to_pynnless_static.
+        """
+        self.finalize()
+        return NetworkInstance.to_pynnless_static(self)
+
     def build_analysis(self, output):
         """
         Performs spatial and temporal demultiplexing of the conducted
@@ -776,12 +1222,10 @@ class NetworkPool(dict):
         res = []
         last_split = {"population": 0, "input": 0}
         for i, split in enumerate(self["spatial_split"]):
-            # Split the input times and the input indices at the positions
-            # stored in the split descriptor
-            input_times = self["input_times"][
-                          last_split["input"]:split["input"]]
-            input_indices = self["input_indices"][
-                            last_split["input"]:split["input"]]
+            # Split the input spikes at the positions stored in the split
+            # descriptor
+            input_spikes = self["input_spikes"].neuron_range(
+                last_split["input"], split["input"])
 
             # Split the output for the stored population range
             output_part = output[last_split["population"]:split["population"]]
@@ -804,8 +1248,7 @@ class NetworkPool(dict):
             # Let the NetworkInstance class build the analysis instances. This
             # class is responsible for performing the temporal demultiplexing.
             res = res + NetworkInstance.build_analysis_static(
-                input_times=input_times,
-                input_indices=input_indices,
+                input_spikes=input_spikes,
                 output=output_part,
                 input_params=input_params,
                 data_params=data_params,
@@ -817,12 +1260,34 @@ class NetworkPool(dict):
             last_split = split
         return res
 
+    def _get_counters(self):
+        counters = getattr(self, "_counters", None)
+        if counters is None:
+            neurons = NetworkInstance.neuron_count_static(self["populations"])
+            counters = self._counters = {
+                "neurons": neurons,
+                "sources": NetworkInstance.neuron_count_static(
+                    self["populations"], True) - neurons,
+                "synapses": NetworkInstance.synapse_count_static(
+                    self["connections"], self.get("projections", []))
+            }
+        return counters
+
     def neuron_count(self, count_sources=False):
         """
-        Returns the current number of neurons in the network
+        Returns the current number of neurons in the network. The count is
+        updated incrementally by add_network.
         """
-        return NetworkInstance.neuron_count_static(self["populations"],
-                                                   count_sources)
+        counters = self._get_counters()
+        if count_sources:
+            return counters["neurons"] + counters["sources"]
+        return counters["neurons"]
+
+    def synapse_count(self):
+        """
+        Returns the current number of synapses in the network.
+        """
+        return self._get_counters()["synapses"]
 
 
 class NetworkAnalysis(dict):
@@ -834,11 +1299,12 @@ class NetworkAnalysis(dict):
     def __init__(self, data={}, input_times=[], input_indices=[],
                  output_times=[], output_indices=[], input_params={},
                  data_params={},
-                 topology_params={}, meta_data={}, mat_in=[], mat_out=[]):
-        utils.init_key(self, data, "input_times", input_times)
-        utils.init_key(self, data, "input_indices", input_indices)
-        utils.init_key(self, data, "output_times", output_times)
-        utils.init_key(self, data, "output_indices", output_indices)
+                 topology_params={}, meta_data={}, mat_in=[], mat_out=[],
+                 input_spikes=None, output_spikes=None):
+        _init_spikes(self, data, "input_spikes", input_spikes, input_times,
+                     input_indices)
+        _init_spikes(self, data, "output_spikes", output_spikes, output_times,
+                     output_indices)
         utils.init_key(self, data, "input_params", input_params)
         utils.init_key(self, data, "data_params", data_params)
         utils.init_key(self, data, "topology_params", topology_params)
@@ -850,6 +1316,9 @@ class NetworkAnalysis(dict):
         self["data_params"] = DataParameters(self["data_params"])
         self["topology_params"] = TopologyParameters(self["topology_params"])
 
+    def __missing__(self, key):
+        return _missing_spike_key(self, key)
+
     def calculate_latencies(self):
         """
         Calculates the latency of each sample for both an input and output spike
@@ -858,12 +1327,8 @@ class NetworkAnalysis(dict):
         """
 
         # Flatten the input and output times and indices
-        tIn, kIn, _ = NetworkInstance.flatten(self["input_times"],
-                                              self["input_indices"],
-                                              sort_by_sample=True)
-        tOut, kOut, _ = NetworkInstance.flatten(self["output_times"],
-                                                self["output_indices"],
-                                                sort_by_sample=True)
+        tIn, kIn, _ = self["input_spikes"].flatten(sort_by_sample=True)
+        tOut, kOut, _ = self["output_spikes"].flatten(sort_by_sample=True)
 
         # Fetch the number of samples
         N = self["data_params"]["n_samples"]
@@ -889,9 +1354,7 @@ class NetworkAnalysis(dict):
         """
 
         # Flatten the output spike sample indices and neuron indices
-        _, kOut, nOut = NetworkInstance.flatten(self["output_times"],
-                                                self["output_indices"],
-                                                sort_by_sample=True)
+        _, kOut, nOut = self["output_spikes"].flatten(sort_by_sample=True)
 
         # Fetch the neuron multiplicity
         s = self["topology_params"]["multiplicity"]
@@ -935,7 +1398,8 @@ class NetworkAnalysis(dict):
         mat_out_ref = mem.evaluate_matrix(self["mat_in"])
 
         N, n = mat_out_ref.shape
-        errs_ref = entropy.calculate_errs(mat_out_ref, self["mat_out"])
+        fn, fp = entropy.calculate_errs_array(mat_out_ref, self["mat_out"])
+        errs_ref = {"fn": fn, "fp": fp}
         I_ref = entropy.entropy_hetero(errs_ref, n,
                                        self["data_params"]["n_ones_out"])
         return I_ref, mat_out_ref, errs_ref
@@ -948,6 +1412,7 @@ class NetworkAnalysis(dict):
         """
         mat_out_res = self.calculate_output_matrix(output_params)
         N, n = mat_out_res.shape
-        errs = entropy.calculate_errs(mat_out_res, self["mat_out"])
+        fn, fp = entropy.calculate_errs_array(mat_out_res, self["mat_out"])
+        errs = {"fn": fn, "fp": fp}
         I = entropy.entropy_hetero(errs, n, self["data_params"]["n_ones_out"])
         return I, mat_out_res, errs
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   PyNAM -- Python Neural Associative Memory Simulator and Evaluator
+#   Copyright (C) 2015 Andreas Stöckel
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Contains the PoolPlanner class, which distributes the networks of an
+experiment onto NetworkPool instances.
+"""
+
+import heapq
+import numpy as np
+
+def shared_key(params, shared_parameters):
+    """
+    Returns a hashable key identifying the values of the shared parameters in
+    the given neuron parameter dictionary.
+    """
+    return tuple(params.get(p) for p in shared_parameters)
+
+class PoolPlanner:
+    """
+    Plans the distribution of networks whose resource usage is known in advance
+    onto as few pools as possible. The usage of each network and the capacity
+    of a pool are vectors, e.g. containing the number of neurons, synapses and
+    spike sources. The networks are placed in order of decreasing dominant
+    share -- the largest fraction of any capacity they use (best-fit-
+    decreasing): each network goes to a reserved pool as long as one of them is
+    unused, otherwise to the fullest pool with the same shared parameters which
+    still has space for it in every dimension. A new pool is only opened if no
+    such pool exists.
+
+    The pools of each set of shared parameters are kept in two heaps ordered by
+    their headroom -- the smallest fraction of any capacity left. As the shares
+    decrease, pools move from the "waiting" heap to the "ready" heap once their
+    headroom covers the share of the next network. Every ready pool has space
+    for the network, the fullest one is on top. With a single limited capacity
+    no other pool has space, so placing a network takes O(log P) time for P
+    pools. With several limited capacities, the waiting pools are additionally
+    checked at once.
+    """
+
+    def __init__(self, capacity, pool_count=0):
+        """
+        Constructor of the PoolPlanner class.
+
+        :param capacity: maximum usage of a pool -- either a single number
+        (e.g. the maximum neuron count) or a vector. Dimensions without limit
+        are set to infinity.
+        :param pool_count: number of pools reserved in advance, e.g. to make
+        use of the simulator concurrency. Each of them receives one of the
+        largest networks before any pool is filled up.
+        """
+        self.capacity = np.atleast_1d(np.asarray(capacity, dtype=np.float64))
+        self.pool_count = pool_count
+
+    def _usage(self, sizes):
+        # Converts the given sizes to a matrix with one row per network
+        return np.asarray(sizes, dtype=np.float64).reshape(
+                (len(sizes), len(self.capacity)))
+
+    def _shares(self, usage):
+        # Dominant share of the given usage matrix rows
+        if usage.shape[0] == 0:
+            return np.zeros(0)
+        return np.max(usage / self.capacity, axis=1)
+
+    def _headroom(self, load):
+        # Smallest fraction of any limited capacity left in a pool with the
+        # given load
+        finite = np.isfinite(self.capacity)
+        if not np.any(finite):
+            return np.inf
+        return float(np.min((self.capacity[finite] - load[finite])
+                / self.capacity[finite]))
+
+    def _pop_fitting(self, waiting, candidates, headroom, loads, usage):
+        # Removes the fullest of the given waiting pools with space for the
+        # given usage from the waiting heap and returns its index, or None if
+        # there is no such pool. Ties are resolved by index.
+        fits = candidates[np.all(loads[candidates] + usage <= self.capacity,
+                axis=1)]
+        if len(fits) == 0:
+            return None
+        idx = int(fits[np.argmin(headroom[fits])])
+        waiting.remove((-headroom[idx], idx))
+        heapq.heapify(waiting)
+        return idx
+
+    def plan(self, sizes, keys=None):
+        """
+        Assigns the networks with the given sizes to pools and returns a list
+        containing the ascending network indices of each pool. Reserved pools
+        which did not receive a network are returned as empty lists.
+
+        :param sizes: usage of each network, either a list of numbers or a list
+        of vectors with the same dimension as the capacity.
+        :param keys: hashable key for each network identifying the values of
+        its shared parameters. Only networks with equal keys are placed in the
+        same pool. If None, all networks may share a pool.
+        """
+        if keys is None:
+            keys = [None] * len(sizes)
+        usage = self._usage(sizes)
+        shares = self._shares(usage)
+
+        # Sort the networks by decreasing share, ties are resolved by index
+        order = sorted(xrange(len(sizes)), key=lambda i: (-shares[i], i))
+
+        # The headroom decides whether a network fits unless more than one
+        # capacity is limited
+        exact = np.sum(np.isfinite(self.capacity)) <= 1
+
+        # Each group consists of its number, a min-heap of (headroom, index)
+        # tuples of the ready pools and a max-heap of (-headroom, index) tuples
+        # of the waiting pools. A pool is removed from its heap before it is
+        # modified and pushed to the waiting heap afterwards. waiting_group
+        # contains the group number of each waiting pool and -1 for all others.
+        n_max = self.pool_count + len(sizes)
+        pools = [[] for _ in xrange(self.pool_count)]
+        loads = np.zeros((n_max, len(self.capacity)))
+        headroom = np.zeros(n_max)
+        waiting_group = np.full(n_max, -1, dtype=np.int64)
+        groups = {}
+        n_reserved_used = 0
+        for i in order:
+            if np.any(usage[i] > self.capacity):
+                # Oversized networks get a pool of their own
+                loads[len(pools)] = usage[i]
+                pools.append([i])
+                continue
+
+            if not keys[i] in groups:
+                groups[keys[i]] = (len(groups), [], [])
+            group, ready, waiting = groups[keys[i]]
+            if n_reserved_used < self.pool_count:
+                # Use the next unused reserved pool
+                idx = n_reserved_used
+                n_reserved_used = n_reserved_used + 1
+            else:
+                # Move the pools whose headroom covers the share of the network
+                # to the ready heap
+                while len(waiting) > 0 and -waiting[0][0] >= shares[i]:
+                    h, idx = heapq.heappop(waiting)
+                    heapq.heappush(ready, (-h, idx))
+                    waiting_group[idx] = -1
+
+                # Use the fullest pool with enough space left, ties are
+                # resolved by index. Waiting pools are fuller than all ready
+                # ones, but can only have space if several capacities are
+                # limited.
+                idx = None
+                if not exact and len(waiting) > 0:
+                    idx = self._pop_fitting(waiting,
+                            np.flatnonzero(waiting_group == group), headroom,
+                            loads, usage[i])
+                if idx is None and len(ready) > 0:
+                    idx = heapq.heappop(ready)[1]
+                if idx is None:
+                    # Open a new pool
+                    idx = len(pools)
+                    pools.append([])
+            loads[idx] = loads[idx] + usage[i]
+            pools[idx].append(i)
+            headroom[idx] = self._headroom(loads[idx])
+            heapq.heappush(waiting, (-headroom[idx], idx))
+            waiting_group[idx] = group
+
+        for pool in pools:
+            pool.sort()
+        return pools
+
+    def utilisation(self, sizes, pools):
+        """
+        Returns the predicted dominant share of the capacity used by each
+        non-empty pool of the given plan.
+        """
+        usage = self._usage(sizes)
+        return self._shares(np.array([np.sum(usage[pool], axis=0)
+                for pool in pools if len(pool) > 0]).reshape(
+                        (-1, len(self.capacity)))).tolist()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   PyNAM -- Python Neural Associative Memory Simulator and Evaluator
+#   Copyright (C) 2015 Andreas Stöckel
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Contains the SpikeTable class, a columnar representation of the spikes of a
+set of neurons along with the sample each spike belongs to.
+"""
+
+import numpy as np
+
+class SpikeTable:
+    """
+    Stores spikes in three columns: the spike times (float64), the sample index
+    of each spike (int32) and -- implicitly -- the neuron index. Spikes are
+    ordered by neuron, the spikes of neuron i are stored in the range
+    offsets[i]:offsets[i + 1] of the columns (CSR layout). Within a neuron the
+    original order of the spikes is preserved.
+    """
+
+    def __init__(self, times=[], neurons=[], samples=None, n_neurons=None):
+        """
+        Constructor of the SpikeTable class.
+
+        :param times: spike times.
+        :param neurons: neuron index of each spike.
+        :param samples: sample index of each spike. Set to zero if None.
+        :param n_neurons: total number of neurons. If None, the largest neuron
+        index plus one is used.
+        """
+        times = np.asarray(times, dtype=np.float64).reshape(-1)
+        neurons = np.asarray(neurons, dtype=np.int32).reshape(-1)
+        if samples is None:
+            samples = np.zeros(len(times), dtype=np.int32)
+        samples = np.asarray(samples, dtype=np.int32).reshape(-1)
+        if len(times) != len(neurons) or len(times) != len(samples):
+            raise Exception("Spike time, neuron and sample columns must have "
+                    + "the same length!")
+        if n_neurons is None:
+            n_neurons = int(np.max(neurons)) + 1 if len(neurons) > 0 else 0
+
+        # Stable sort by neuron index if necessary
+        if np.any(neurons[1:] < neurons[:-1]):
+            I = np.argsort(neurons, kind="mergesort")
+            times, neurons, samples = times[I], neurons[I], samples[I]
+
+        self.times = times
+        self.samples = samples
+        self.offsets = np.searchsorted(neurons,
+                np.arange(n_neurons + 1)).astype(np.int64)
+        if self.offsets[0] != 0 or self.offsets[-1] != len(times):
+            raise Exception("Neuron index out of range!")
+
+    @staticmethod
+    def _from_columns(times, samples, offsets):
+        res = SpikeTable()
+        res.times = times
+        res.samples = samples
+        res.offsets = offsets
+        return res
+
+    @staticmethod
+    def from_ragged(times, samples=None):
+        """
+        Creates a SpikeTable from a list containing a list of spike times for
+        each neuron and an optional corresponding list of sample indices.
+        """
+        counts = np.array(map(len, times), dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        if offsets[-1] == 0:
+            return SpikeTable._from_columns(np.zeros(0),
+                    np.zeros(0, dtype=np.int32), offsets)
+        ts = np.concatenate([np.asarray(t, dtype=np.float64) for t in times])
+        if samples is None:
+            ks = np.zeros(len(ts), dtype=np.int32)
+        else:
+            ks = np.concatenate([np.asarray(k, dtype=np.int32)
+                    for k in samples])
+        return SpikeTable._from_columns(ts, ks, offsets)
+
+    def to_ragged(self):
+        """
+        Returns a tuple (times, samples) of lists which contain a list of spike
+        times and sample indices for each neuron.
+        """
+        counts = self.counts()
+        times = self.times
+        samples = self.samples
+        if len(counts) > 0:
+            split = np.cumsum(counts)[:-1]
+            times = np.split(times, split)
+            samples = np.split(samples, split)
+        return ([t.tolist() for t in times],
+                [k.tolist() for k in samples])
+
+    @property
+    def n_neurons(self):
+        return len(self.offsets) - 1
+
+    @property
+    def neurons(self):
+        """
+        Neuron index of each spike.
+        """
+        return np.repeat(np.arange(self.n_neurons, dtype=np.int32),
+                self.counts())
+
+    def counts(self):
+        """
+        Returns the number of spikes of each neuron.
+        """
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        """
+        Returns the total number of spikes.
+        """
+        return len(self.times)
+
+    def neuron(self, i):
+        """
+        Returns the spike times and sample indices of the i-th neuron.
+        """
+        i0, i1 = self.offsets[i], self.offsets[i + 1]
+        return self.times[i0:i1], self.samples[i0:i1]
+
+    def neuron_range(self, n0, n1):
+        """
+        Returns a SpikeTable containing the neurons with index n0 to n1
+        (exclusive), renumbered to start at zero. The columns of the returned
+        table are views of the columns of this table.
+        """
+        n0 = max(0, min(n0, self.n_neurons))
+        n1 = max(n0, min(n1, self.n_neurons))
+        i0, i1 = self.offsets[n0], self.offsets[n1]
+        return SpikeTable._from_columns(self.times[i0:i1],
+                self.samples[i0:i1], self.offsets[n0:n1 + 1] - i0)
+
+    def sample_range(self, k0, k1, relative=True):
+        """
+        Returns a SpikeTable with the same neurons, containing all spikes with
+        a sample index between k0 and k1 (exclusive). If relative is True, the
+        sample indices are made relative to k0.
+        """
+        return self.split_samples([k1], k0, relative)[0]
+
+    def split_samples(self, bounds, k0=0, relative=True):
+        """
+        Splits the table into multiple tables in a single pass. The i-th table
+        contains all spikes with a sample index between bounds[i - 1] (or k0
+        for the first table) and bounds[i]. If relative is True, the sample
+        indices are made relative to the lower bound.
+        """
+        lower = np.concatenate(([k0], bounds)).astype(np.int64)
+        part = np.searchsorted(lower, self.samples, side="right") - 1
+        valid = (part >= 0) & (part < len(bounds))
+        part = part[valid]
+        neurons = self.neurons[valid]
+        times = self.times[valid]
+        samples = self.samples[valid]
+        if relative:
+            samples = np.asarray(samples - lower[part], dtype=np.int32)
+
+        # Sort by part and neuron, keeping the original order of the spikes
+        # within each neuron
+        n = self.n_neurons
+        key = part * n + neurons
+        I = np.argsort(key, kind="mergesort")
+        times, samples = times[I], samples[I]
+        counts = np.bincount(key, minlength=len(bounds) * n).reshape(
+                (len(bounds), n))
+        offs = np.concatenate(([0], np.cumsum(counts)))
+        return [SpikeTable._from_columns(times[offs[i * n]:offs[(i + 1) * n]],
+                samples[offs[i * n]:offs[(i + 1) * n]],
+                offs[i * n:(i + 1) * n + 1] - offs[i * n])
+                for i in xrange(len(bounds))]
+
+    def flatten(self, sort_by_sample=False):
+        """
+        Returns three one-dimensional arrays containing the spike times, sample
+        indices and neuron indices, sorted by spike time. If sort_by_sample is
+        True, spikes with the same time are additionally sorted by sample.
+        """
+        if sort_by_sample:
+            I = np.lexsort((self.samples, self.times))
+        else:
+            I = np.argsort(self.times)
+        return self.times[I], self.samples[I], self.neurons[I]
+
+    def with_samples(self, samples):
+        """
+        Returns a copy of the table with the given sample index column.
+        """
+        samples = np.asarray(samples, dtype=np.int32).reshape(-1)
+        if len(samples) != len(self.times):
+            raise Exception("Sample column must have one entry per spike!")
+        return SpikeTable._from_columns(self.times, samples, self.offsets)
+
+    @staticmethod
+    def concatenate(tables):
+        """
+        Concatenates the neurons of the given tables into a single table. The
+        neurons of the i-th table follow those of the (i - 1)-th table.
+        """
+        tables = list(tables)
+        if len(tables) == 0:
+            return SpikeTable()
+        offsets = [tables[0].offsets]
+        total = tables[0].offsets[-1]
+        for table in tables[1:]:
+            offsets.append(table.offsets[1:] + total)
+            total = total + table.offsets[-1]
+        return SpikeTable._from_columns(
+                np.concatenate([table.times for table in tables]),
+                np.concatenate([table.samples for table in tables]),
+                np.concatenate(offsets))
+
+    def __eq__(self, other):
+        return (isinstance(other, SpikeTable)
+                and np.array_equal(self.offsets, other.offsets)
+                and np.array_equal(self.times, other.times)
+                and np.array_equal(self.samples, other.samples))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
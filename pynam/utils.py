@@ -23,6 +23,7 @@ Contains various utility methods used in various places of the program.
 
 import re
 import json
+import hashlib
 import numpy as np
 import scipy.io as scio
 
@@ -47,6 +48,38 @@ def finalize_seed(old_state):
     if (old_state != None):
         np.random.set_state(old_state)
 
+def derive_seed(seed, *keys):
+    """
+    Derives a reproducible seed for numpy.random.RandomState from a base seed
+    and a sequence of keys, such as the experiment index, the repetition and
+    the purpose of the random numbers ("data_in", "topology", ...). The keys
+    are hashed, so streams derived from different keys are independent of each
+    other and of the order in which they are created.
+
+    :param seed: integer base seed. May also be a tuple, in which case the first
+    element is used as base seed and the remaining elements are prepended to
+    the given keys.
+    :param keys: arbitrary integers or strings identifying the stream.
+    :return: a vector of 32-bit integers that can be passed to RandomState.
+    """
+    if isinstance(seed, tuple):
+        keys = tuple(seed[1:]) + keys
+        seed = seed[0]
+    key = "/".join(map(str, (int(seed),) + tuple(keys)))
+    return np.frombuffer(hashlib.sha256(key).digest(), dtype=np.uint32).copy()
+
+def random_stream(seed, *keys):
+    """
+    Returns a random number generator for the stream identified by the given
+    seed and keys (see derive_seed). In contrast to initialize_seed the global
+    numpy random state is not touched, so streams can safely be used
+    concurrently. If seed is None, the global numpy random module is returned,
+    which provides the same interface as a RandomState instance.
+    """
+    if seed is None:
+        return np.random
+    return np.random.RandomState(derive_seed(seed, *keys))
+
 # Regular expression for comments
 # See http://www.lifl.fr/~damien.riquet/parse-a-json-file-with-comments.html
 JSON_COMMENT_RE = re.compile(
@@ -108,6 +108,15 @@ each execution. These files are much smaller than the intermediate files
 generated by "exec". All results can then be joined using the "analyse-join"
 mode.
 
+The automatically chosen data parameters (number of ones and samples) can be
+looked up in a table precomputed by "capacity_table.py" instead of being
+calculated when the networks are created. To this end, add the option
+
+    --parameter-table <FILE>
+
+to any of the "process", "process-keep" or "create" modes, where `FILE` is the
+".npz" file written by "capacity_table.py".
+
 """)
     print("<SIMULATOR> may be one of the following, these simulators have been")
     print("auto-detected on your system:")
@@ -118,44 +127,44 @@ def short_help():
     print("Type\n\t./run.py --help\nto get usage information.")
     sys.exit(1)
 
-def parse_parameters():
+def parse_mode(argv):
     # Error case: Need at least one argument
-    if len(sys.argv) == 1:
+    if len(argv) == 1:
         print("Error: At least one argument is required")
         short_help()
 
     # Make sure the first argument does not start with "--"
-    if len(sys.argv) >= 2 and sys.argv[1].startswith("--"):
-        if (sys.argv[1] == '-h' or sys.argv[1] == '--help'):
+    if len(argv) >= 2 and argv[1].startswith("--"):
+        if (argv[1] == '-h' or argv[1] == '--help'):
             help()
         print("Error: Invalid arguments")
         short_help()
 
     # Special case -- only one argument is given -- print help if the first
     # argument is "-h" or "--help"
-    if len(sys.argv) == 2:
+    if len(argv) == 2:
         return {
             "mode": "process",
-            "simulator": sys.argv[1],
+            "simulator": argv[1],
             "experiment": "experiment.json"
         }
 
 
     # Special case two: Three parameters are given and the third parameter does
     # not start with "--"
-    if len(sys.argv) == 3 and not sys.argv[2].startswith("--"):
+    if len(argv) == 3 and not argv[2].startswith("--"):
         return {
             "mode": "process",
-            "simulator": sys.argv[1],
-            "experiment": sys.argv[2]
+            "simulator": argv[1],
+            "experiment": argv[2]
         }
 
     # We need at least three parameters and the second parameter needs to be
     # in ["process", "create", "exec", "analyse"]
-    if len(sys.argv) < 3 or not sys.argv[2].startswith("--"):
+    if len(argv) < 3 or not argv[2].startswith("--"):
         print("Error: Invalid arguments")
         short_help()
-    mode = sys.argv[2][2:]
+    mode = argv[2][2:]
     modes = ["process", "process-keep", "create", "exec", "analyse",
                 "analyse-exec", "analyse-join"]
     if not mode in modes:
@@ -164,47 +173,72 @@ def parse_parameters():
         short_help()
 
     # Require at least one argument
-    if len(sys.argv) < 4:
+    if len(argv) < 4:
         print("Error: At least one argument is required for mode \"" + mode  +
                 "\"")
         short_help()
 
     # Parse the "process" mode
     if mode == "process" or mode == "process-keep" or mode == "create":
-        if len(sys.argv) != 4:
+        if len(argv) != 4:
             print("Error: Mode \"" + mode + "\" requires exactly one argument")
             short_help()
         else:
             return {
                 "mode": mode,
-                "simulator": sys.argv[1],
-                "experiment": sys.argv[3]
+                "simulator": argv[1],
+                "experiment": argv[3]
             }
 
     # Parse the "create" and "exec" modes
     if mode == "exec" or mode == "analyse-exec":
         return {
             "mode": mode,
-            "simulator": sys.argv[1],
-            "files": sys.argv[3:]
+            "simulator": argv[1],
+            "files": argv[3:]
         }
 
     # Parse the "analyse" mode
     if mode == "analyse" or mode == "analyse-join":
         return {
             "mode": mode,
-            "target": sys.argv[1],
-            "files": sys.argv[3:]
+            "target": argv[1],
+            "files": argv[3:]
         }
 
     # Something went wrong, print the usage help
     short_help()
 
+def parse_parameters():
+    # Remove the optional "--parameter-table <FILE>" option from the arguments
+    argv = list(sys.argv)
+    parameter_table = None
+    if "--parameter-table" in argv[1:]:
+        i = argv.index("--parameter-table", 1)
+        if i + 1 >= len(argv):
+            print("Error: Option \"--parameter-table\" requires a file name")
+            short_help()
+        parameter_table = argv[i + 1]
+        del argv[i:i + 2]
+
+    # Parse the remaining arguments, the parameter table is only used when
+    # creating networks
+    params = parse_mode(argv)
+    if not parameter_table is None:
+        if not "experiment" in params:
+            print("Error: Option \"--parameter-table\" is only supported in "
+                    + "modes which create networks")
+            short_help()
+        params["parameter_table"] = parameter_table
+    return params
+
 def validate_parameters(params):
     # Make sure the specified input files exist
     files = []
     if "experiment" in params:
         files.append(params["experiment"])
+    if "parameter_table" in params:
+        files.append(params["parameter_table"])
     if "files" in params:
         files = files + params["files"]
     for fn in files:
@@ -223,10 +257,13 @@ def read_object(filename):
     with gzip.open(filename, 'rb') as f:
         return pickle.load(f)
 
-def create_networks(experiment_file, simulator, path="", analyse=False):
+def create_networks(experiment_file, simulator, path="", analyse=False,
+        parameter_table=None):
     """
     Create the network descriptions and write them to disc. Returns the names
-    of the created files, separated by experiment
+    of the created files, separated by experiment. If parameter_table is given,
+    the automatically chosen data parameters are looked up in this table of
+    optimal data parameters written by capacity_table.py.
     """
 
     # Read the experiment
@@ -235,17 +272,19 @@ def create_networks(experiment_file, simulator, path="", analyse=False):
     if experiment_name.find('.') > -1:
         experiment_name = experiment_name[0:experiment_name.find('.')]
 
-    # Build the experiment descriptors
-    seed = 1437243
-    logger.info("Generating networks...")
-    pools = experiment.build(pynl.PyNNLess.get_simulator_info_static(simulator),
-            simulator=simulator, seed=seed)
-
     # Create the target directories
     if path != "" and not os.path.isdir(path):
         os.makedirs(path)
 
-    # Store the descriptors in the given path
+    # Build the experiment descriptors in as many worker processes as there are
+    # CPUs and store each of them in the given path as soon as it is complete
+    seed = 1437243
+    logger.info("Generating networks...")
+    pools = experiment.build_iter(
+            pynl.PyNNLess.get_simulator_info_static(simulator),
+            simulator=simulator, seed=seed,
+            processes=multiprocessing.cpu_count(),
+            parameter_table=parameter_table)
     input_files = []
     output_files = []
     for i, pool in enumerate(pools):
@@ -326,7 +365,7 @@ def execute_networks(input_files, simulator, analyse=False):
 
     logger.info("Run simulation...")
     sim = pynl.PyNNLessIsolated(simulator, setup)
-    output = sim.run(input_network)
+    output = sim.run(input_network.to_pynnless())
     times = sim.get_time_info()
     logger.info("Simulation took " + str(times["sim"]) + "s ("
             + str(times["total"]) + "s total)")
@@ -417,9 +456,9 @@ def analyse_output(output, result=None):
         I, mat, errs = analysis.calculate_storage_capactiy(
                 output_params=params["output"])
         I_ref, mat_ref, errs_ref = analysis.calculate_max_storage_capacity()
-        fp = sum(map(lambda x: x["fp"], errs))
-        fp_ref = sum(map(lambda x: x["fp"], errs_ref))
-        fn = sum(map(lambda x: x["fn"], errs))
+        fp = np.sum(errs["fp"])
+        fp_ref = np.sum(errs_ref["fp"])
+        fn = np.sum(errs["fn"])
         latencies = analysis.calculate_latencies()
         latencies_valid = latencies[latencies != np.inf]
         latencies_invalid_count = len(latencies) - len(latencies_valid)
@@ -548,7 +587,8 @@ if __name__ == "__main__":
     mode = params["mode"]
 
     if mode == "create":
-        create_networks(params["experiment"], params["simulator"], "")
+        create_networks(params["experiment"], params["simulator"], "",
+                parameter_table=params.get("parameter_table"))
     elif mode == "exec" or mode == "analyse-exec":
         if not execute_networks(params["files"], params["simulator"],
                 mode == "analyse-exec"):
@@ -569,7 +609,7 @@ if __name__ == "__main__":
 
         # Create the networks and fetch the input and output files
         input_files, output_files = create_networks(experiment, simulator, folder,
-                analyse=analyse)
+                analyse=analyse, parameter_table=params.get("parameter_table"))
 
         # Execute the networks, abort if the execution failed
         if not execute_networks(input_files, simulator, analyse=analyse):
@@ -197,3 +197,17 @@ class TestBiNAM(unittest.TestCase):
 
         np.testing.assert_equal(mat_out_recall, mat_out)
 
+    def test_pack_unpack(self):
+        mat = np.array(np.random.randint(0, 2, (5, 130)), dtype=np.uint8)
+        packed = pynam.binam.pack(mat)
+        self.assertEqual((5, 3), packed.shape)
+
+        a = pynam.binam.BinaryMatrix()
+        a.set(mat)
+        np.testing.assert_equal(a.arr, packed)
+        np.testing.assert_equal(mat, pynam.binam.unpack(packed, 130))
+
+    def test_popcount(self):
+        mat = np.array(np.random.randint(0, 2, (5, 130)), dtype=np.uint8)
+        np.testing.assert_equal(np.sum(mat, axis=1),
+                pynam.binam.popcount(pynam.binam.pack(mat)))
@@ -20,18 +20,38 @@ import unittest
 
 import numpy as np
 import numpy.testing
-from pynam.data import PermutationTrieNode, generate
+import pynam.data
+from pynam.binam import BinaryMatrix, unpack
+from pynam.data import (PermutationTrie, generate,
+        generate_naive, generate_random, generate_by_algorithm,
+        GenerationExecutor)
 
-class TestPermutationTrieNode(unittest.TestCase):
+class TestPermutationTrie(unittest.TestCase):
     def test_ctor(self):
-        node = PermutationTrieNode(32, 3)
-        self.assertEqual(node.idx, 32)
-        self.assertEqual(node.parent, None)
+        trie = PermutationTrie(32, 3)
+        self.assertEqual(1, trie.n_nodes)
         permutations = np.array([0, 0, 1, 3, 6, 10, 15, 21, 28, 36, 45, 55, 66,
                 78, 91, 105, 120, 136, 153, 171, 190, 210, 231, 253, 276, 300,
                 325, 351, 378, 406, 435, 465], dtype=np.uint64)
-        numpy.testing.assert_equal(node.permutations, permutations)
-        numpy.testing.assert_equal(node.max_permutations, permutations)
+        numpy.testing.assert_equal(trie.permutations(PermutationTrie.ROOT),
+                permutations)
+
+    def test_fetch(self):
+        trie = PermutationTrie(6, 3, capacity=1)
+        root = PermutationTrie.ROOT
+        child = trie.fetch(root, 4)
+        self.assertEqual(child, trie.fetch(root, 4))
+        self.assertEqual(2, trie.n_nodes)
+        numpy.testing.assert_equal(trie.permutations(child), [0, 1, 2, 3])
+        self.assertEqual(-1, trie.fetch(trie.fetch(child, 3), 2))
+
+    def test_decrement_permutation(self):
+        trie = PermutationTrie(3, 1)
+        root = PermutationTrie.ROOT
+        self.assertTrue(trie.decrement_permutation(root, 0))
+        self.assertTrue(trie.decrement_permutation(root, 1))
+        self.assertFalse(trie.decrement_permutation(root, 2))
+        numpy.testing.assert_equal(trie.permutations(root), [1, 1, 1])
 
 class TestGenerate(unittest.TestCase):
 
@@ -155,3 +175,98 @@ class TestGenerate(unittest.TestCase):
         self.assertFalse(np.all(res1 == res3))
         self.assertFalse(a1 == a2 or a2 == a3 or a3 == a4)
 
+    def test_seed_streams(self):
+        res1 = generate(64, 3, 50, seed=(5812, "data_in"))
+        res2 = generate_random(64, 3, 50, seed=(5812, "data_in"))
+        res3 = generate_random(64, 3, 50, seed=(5812, "data_in"))
+        res4 = generate_random(64, 3, 50, seed=(5812, "data_out"))
+        self.assertTrue(np.all(res1 == generate(64, 3, 50,
+                seed=(5812, "data_in"))))
+        self.assertTrue(np.all(res2 == res3))
+        self.assertFalse(np.all(res2 == res4))
+
+    def test_output_formats(self):
+        res = generate(70, 3, 50, seed=5812)
+        packed = generate(70, 3, 50, seed=5812, output="packed")
+        indices = generate(70, 3, 50, seed=5812, output="indices")
+
+        self.assertEqual((50, 2), packed.shape)
+        self.assertEqual(np.uint64, packed.dtype)
+        mat = BinaryMatrix()
+        mat.set_packed(packed, 70)
+        numpy.testing.assert_equal(res, mat.get())
+
+        self.assertEqual((50, 3), indices.shape)
+        for i in xrange(50):
+            numpy.testing.assert_equal(np.where(res[i])[0], indices[i])
+
+        for fun in [generate_naive, generate_random]:
+            self.assertEqual((10, 1), fun(16, 3, 10, output="packed").shape)
+            self.assertEqual((10, 3), fun(16, 3, 10, output="indices").shape)
+
+    def test_output_formats_chunked(self):
+        # Samples are converted in chunks, including a partial last chunk
+        chunk_size = pynam.data.GENERATE_CHUNK_SIZE
+        pynam.data.GENERATE_CHUNK_SIZE = 7
+        try:
+            for fun in [generate, generate_naive, generate_random]:
+                res = fun(70, 3, 50, seed=5813)
+                packed = fun(70, 3, 50, seed=5813, output="packed")
+                indices = fun(70, 3, 50, seed=5813, output="indices")
+                numpy.testing.assert_equal(res, unpack(packed, 70))
+                numpy.testing.assert_equal(np.nonzero(res)[1].reshape(
+                        (50, 3)), indices)
+            res = generate(6, 2, 40, seed=4, abort_on_restart=True,
+                    output="packed")
+            self.assertEqual((15, 1), res.shape)
+        finally:
+            pynam.data.GENERATE_CHUNK_SIZE = chunk_size
+        self.assertRaises(Exception, lambda: generate(16, 3, 10, output="foo"))
+
+class TestGenerationExecutor(unittest.TestCase):
+
+    def test_map(self):
+        jobs = [("balanced", 64, 3, 50, (5812, "data_in")),
+                ("random", 64, 3, 50, (5812, "data_out")),
+                ("unique", 32, 2, 20, 5812),
+                ("balanced", 64, 3, 50, (5812, "data_in"))]
+        expected = [generate_by_algorithm(*job) for job in jobs]
+        for processes in [1, 2]:
+            executor = GenerationExecutor(processes)
+            try:
+                res = executor.map(jobs)
+                self.assertEqual(3, len(executor.results))
+            finally:
+                executor.close()
+            self.assertEqual(len(expected), len(res))
+            for i in xrange(len(expected)):
+                numpy.testing.assert_equal(expected[i], res[i])
+        self.assertRaises(Exception,
+                lambda: generate_by_algorithm("foo", 16, 3, 10))
+
+    def test_evict(self):
+        jobs = [("balanced", 64, 3, 50, (5812, "data_in")),
+                ("random", 64, 3, 50, (5812, "data_out"))]
+        executor = GenerationExecutor(1)
+        try:
+            a, b = executor.map(jobs)
+            executor.evict(jobs[:1] + [("random", 64, 3, 50, None)])
+            self.assertEqual([jobs[1]], executor.results.keys())
+            c, d = executor.map(jobs)
+        finally:
+            executor.close()
+        numpy.testing.assert_equal(a, c)
+        numpy.testing.assert_equal(b, d)
+
+    def test_map_without_seed(self):
+        jobs = [("random", 64, 3, 50, None), ("random", 64, 3, 50, None)]
+        for processes in [1, 2]:
+            executor = GenerationExecutor(processes)
+            try:
+                a, b = executor.map(jobs)
+                c, = executor.map(jobs[:1])
+                self.assertEqual(0, len(executor.results))
+            finally:
+                executor.close()
+            self.assertFalse(np.array_equal(a, b))
+            self.assertFalse(np.array_equal(a, c))
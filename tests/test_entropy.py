@@ -16,13 +16,26 @@
 #   You should have received a copy of the GNU General Public License
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import itertools
+import math
+import os
+import tempfile
 import unittest
 
 import numpy as np
 import numpy.testing
-from pynam.entropy import ncr, entropy_hetero, entropy_hetero_uniform,\
-        expected_false_positives, calculate_errs, optimal_sample_count,\
-        optimal_sample_count_naive
+from pynam.binam import pack
+from pynam.entropy import ncr, lnncr, lnncrr, binom_table, entropy_hetero,\
+        entropy_hetero_uniform, expected_false_positives, calculate_errs,\
+        calculate_errs_array, entropy_hetero_array,\
+        optimal_sample_count, optimal_sample_count_naive, BINOM_TABLE_MAX,\
+        expected_false_positives_array, expected_entropy,\
+        expected_entropy_array, optimal_sample_count_array,\
+        optimal_parameters, resolve_data_parameters,\
+        load_optimal_parameter_table, clear_optimal_parameter_table,\
+        monte_carlo_entropy, optimal_parameters_array,\
+        optimal_parameter_table, column_fill_probability,\
+        false_positive_distribution
 
 class TestUtils(unittest.TestCase):
 
@@ -44,6 +57,18 @@ class TestUtils(unittest.TestCase):
         self.assertEqual([1L, 7L, 21L, 35L, 35L, 21L, 7L, 1L],
             [ncr(7, i) for i in xrange(8)])
 
+    def test_binom_table(self):
+        for r in xrange(-1, 8):
+            numpy.testing.assert_equal(binom_table(40, r),
+                    [ncr(i, r) if r >= 0 else 0 for i in xrange(40)])
+        numpy.testing.assert_equal(binom_table(100, 50)[-3:],
+                [BINOM_TABLE_MAX] * 3)
+
+    def test_lnncr(self):
+        numpy.testing.assert_almost_equal(lnncr([10, 20, 30], 3),
+                [lnncrr(10, 3), lnncrr(20, 3), lnncrr(30, 3)])
+        self.assertEqual(-np.inf, lnncr(3, 4))
+
     def test_expected_false_positives(self):
         N = 10
         c = 2
@@ -79,6 +104,21 @@ class TestUtils(unittest.TestCase):
         self.assertAlmostEqual(v1, 22.06592095594754)
         self.assertAlmostEqual(v2, 22.06592095594754)
 
+    def test_entropy_hetero_array(self):
+        fn = np.array([[0, 0, 0], [1, 0, 2]])
+        fp = np.array([[1, 0, 2], [0, 3, 1]])
+        res = entropy_hetero_array(fn, fp, 16, 3)
+        self.assertEqual((2,), res.shape)
+        self.assertAlmostEqual(res[0], 22.06592095594754)
+        for i in xrange(2):
+            errs = [{"fn": fn[i, j], "fp": fp[i, j]} for j in xrange(3)]
+            self.assertAlmostEqual(res[i], entropy_hetero(errs, 16, 3))
+            self.assertAlmostEqual(res[i],
+                    entropy_hetero_array(fn[i], fp[i], 16, 3))
+
+        res = entropy_hetero_array(fn, fp, [16, 32], [3, 4])
+        self.assertAlmostEqual(res[1], entropy_hetero_array(fn[1], fp[1], 32, 4))
+
     def test_entropy_hetero_uniform(self):
         n_samples = 10
         n_out_ones = 3
@@ -108,9 +148,205 @@ class TestUtils(unittest.TestCase):
         self.assertAlmostEqual([{'fp': 0.25, 'fn': 0.8},
                 {'fp': 1.25, 'fn': 0}, {'fp': 0.1, 'fn': 0}], errs)
 
+    def test_calculate_errs_array(self):
+        mat_out_expected = np.array([
+            [1, 0, 1, 0],
+            [1, 0, 0, 1],
+            [0, 1, 0, 1],
+        ])
+        mat_out = np.array([
+            [1, 0, 0, 0],
+            [2, 1, 1, 1],
+            [0, 1, 0, 1],
+        ])
+        fn, fp = calculate_errs_array(mat_out, mat_out_expected)
+        numpy.testing.assert_equal([1, 0, 0], fn)
+        numpy.testing.assert_equal([0, 2, 0], fp)
+        self.assertTrue(np.issubdtype(fn.dtype, np.integer))
+
+        fn_packed, fp_packed = calculate_errs_array(pack(mat_out),
+                pack(mat_out_expected), packed=True)
+        numpy.testing.assert_equal(fn, fn_packed)
+        numpy.testing.assert_equal(fp, fp_packed)
+
+        errs = {"fn": fn, "fp": fp}
+        self.assertAlmostEqual(entropy_hetero(errs, 4, 2),
+                entropy_hetero(calculate_errs(mat_out, mat_out_expected), 4, 2))
+
     def test_optimal_sample_count(self):
         self.assertEqual(52, optimal_sample_count(16, 16, 2, 2))
         self.assertEqual(62, optimal_sample_count(32, 32, 4, 4))
         self.assertEqual(optimal_sample_count_naive(1000, 800, 5, 6),
                 optimal_sample_count(1000, 800, 5, 6))
 
+    def test_expected_entropy_array(self):
+        N = np.arange(0, 100, 7)
+        fps = expected_false_positives_array(N, 16, 3, 10, 2)
+        Is = expected_entropy_array(N, 16, 3, 10, 2)
+        for i in xrange(len(N)):
+            self.assertAlmostEqual(fps[i],
+                    expected_false_positives(N[i], 16, 3, 10, 2))
+            self.assertAlmostEqual(Is[i], expected_entropy(N[i], 16, 3, 10, 2))
+
+    def test_optimal_sample_count_array(self):
+        n_bits = np.array([[16], [32], [64]])
+        n_ones = np.array([[1, 2, 3, 4]])
+        res = optimal_sample_count_array(n_bits, n_bits, n_ones, n_ones)
+        self.assertEqual((3, 4), res.shape)
+        self.assertEqual(52, res[0, 1])
+        self.assertEqual(62, res[1, 3])
+        for i in xrange(3):
+            for j in xrange(4):
+                self.assertEqual(optimal_sample_count_naive(n_bits[i, 0],
+                        n_bits[i, 0], n_ones[0, j], n_ones[0, j]), res[i, j])
+
+    def test_optimal_parameters(self):
+        params = optimal_parameters(n_bits_in=64, n_bits_out=128)
+        self.assertEqual(64, params["n_bits_in"])
+        self.assertEqual(128, params["n_bits_out"])
+        self.assertEqual(optimal_sample_count(64, 128, params["n_ones_in"],
+                params["n_ones_out"]), params["n_samples"])
+
+    def test_optimal_parameters_array(self):
+        # Expected values computed with the scalar golden-section search
+        n_bits_in = np.array([16, 64, 100, 64, 32, 128, 256, 96])
+        n_bits_out = np.array([16, 128, 100, 128, 48, 128, 64, 96])
+        n_samples = np.array([-1, -1, -1, 100, -1, -1, -1, 1000])
+        n_ones, N = optimal_parameters_array(n_bits_in, n_bits_out, n_samples)
+        numpy.testing.assert_equal([2, 2, 2, 9, 2, 2, 2, 3], n_ones)
+        numpy.testing.assert_equal([52, 1465, 1803, 100, 140, 1377, 3012, 1000],
+                N)
+
+    def test_optimal_parameter_table(self):
+        clear_optimal_parameter_table()
+        table = optimal_parameter_table([16, 32], [16, 24], n_ones=4)
+        self.assertEqual(4 + 4 * 4, len(table["keys"]))
+        self.assertEqual(len(table["keys"]), len(table["values"]))
+        self.assertEqual(len(table["keys"]), len(table["info"]))
+        for key, value in zip(table["keys"].tolist(),
+                table["values"].tolist()):
+            self.assertEqual(tuple(value), resolve_data_parameters(*key))
+        table = optimal_parameter_table([16, 32], [16, 32], n_ones=2,
+                square=True)
+        self.assertEqual(2 + 2 * 2, len(table["keys"]))
+
+    def test_resolve_data_parameters(self):
+        clear_optimal_parameter_table()
+        self.assertEqual((3, 4, 10), resolve_data_parameters(16, 16, 3, 4, 10))
+        self.assertEqual((2, 2, 52), resolve_data_parameters(16, 16, 2, 2, -1))
+        params = optimal_parameters(n_bits_in=64, n_bits_out=32)
+        self.assertEqual((params["n_ones_in"], params["n_ones_out"],
+                params["n_samples"]), resolve_data_parameters(64, 32, 0, 0, -1))
+
+        fd, filename = tempfile.mkstemp(suffix=".npz")
+        os.close(fd)
+        try:
+            np.savez(filename, keys=np.array([[16, 16, 2, 2, -1]]),
+                    values=np.array([[2, 2, 51]]))
+            self.assertEqual(1, load_optimal_parameter_table(filename))
+            self.assertEqual((2, 2, 51),
+                    resolve_data_parameters(16, 16, 2, 2, -1))
+        finally:
+            os.remove(filename)
+            clear_optimal_parameter_table()
+        self.assertEqual((2, 2, 52), resolve_data_parameters(16, 16, 2, 2, -1))
+
+    def test_resolve_data_parameters_memory_size(self):
+        # Automatically chosen parameters depend on the memory size. Before,
+        # they were always chosen for 100 x 100 bits, resulting in 2 ones and
+        # 1804 samples for any memory size.
+        clear_optimal_parameter_table()
+        self.assertEqual((2, 2, 52), resolve_data_parameters(16, 16, 0, 0, -1))
+        self.assertEqual((2, 2, 1803),
+                resolve_data_parameters(100, 100, 0, 0, -1))
+        self.assertEqual((2, 2, 11548),
+                resolve_data_parameters(256, 256, 0, 0, -1))
+        self.assertEqual((2, 2, 1465),
+                resolve_data_parameters(64, 128, 0, 0, -1))
+
+    def test_column_fill_probability(self):
+        # Enumerate all combinations of two other samples for m = 4, c = 2,
+        # n = 3, d = 1 and count how often column 1 is filled for the input
+        # rows {0, 1}
+        samples = [(set(rows), col) for rows in itertools.combinations(
+                xrange(4), 2) for col in xrange(3)]
+        filled = 0
+        for other in itertools.product(samples, repeat=2):
+            rows = set()
+            for rows_in, col in other:
+                if col == 1:
+                    rows = rows | rows_in
+            filled = filled + (1 if rows >= set([0, 1]) else 0)
+        self.assertAlmostEqual(float(filled) / len(samples) ** 2,
+                column_fill_probability(3, 3, 1, 4, 2))
+
+        # Compare against values computed using exact rational arithmetic
+        numpy.testing.assert_allclose([6.484517404674386e-3,
+                0.14855749797536152, 2.7844665384444865e-05],
+                column_fill_probability(10, 128, [48, 64, 32]), rtol=1e-9)
+        numpy.testing.assert_allclose(1.5915708922909542e-9,
+                column_fill_probability(1000, 1000, 8), rtol=1e-9)
+        self.assertRaises(Exception, column_fill_probability, 10, 16, 17)
+        self.assertEqual(0.0, column_fill_probability(1, 16, 3))
+        numpy.testing.assert_equal((4,),
+                column_fill_probability(np.arange(4), 16, 3).shape)
+
+    def test_false_positive_distribution(self):
+        N = np.array([1, 10, 27, 100])
+        pmf, info = false_positive_distribution(N, 16, 3, 20, 4)
+        self.assertEqual((4, 14), pmf.shape)
+        numpy.testing.assert_almost_equal(np.ones(4), np.sum(pmf, axis=1))
+        numpy.testing.assert_almost_equal(
+                13 * column_fill_probability(N, 16, 3, 20, 4),
+                np.dot(pmf, np.arange(14)))
+        self.assertEqual(1.0, pmf[0, 0])
+        self.assertAlmostEqual(float(lnncr(16, 3)) / math.log(2.0), info[0])
+
+        pmf2, info2 = false_positive_distribution(27, 16, 3, 20, 4)
+        numpy.testing.assert_almost_equal(pmf[2], pmf2)
+        self.assertAlmostEqual(info[2], info2)
+
+    def test_false_positive_distribution_brute_force(self):
+        # Enumerate all combinations of the other samples for m = 4, c = 2,
+        # n = 3, d = 1 and count the false positives in the columns {1, 2} for
+        # the input rows {0, 1} and output column 0
+        samples = [(set(rows), col) for rows in itertools.combinations(
+                xrange(4), 2) for col in xrange(3)]
+        for N in xrange(1, 5):
+            counts = np.zeros(3)
+            for other in itertools.product(samples, repeat=N - 1):
+                rows = [set(), set(), set()]
+                for rows_in, col in other:
+                    rows[col] = rows[col] | rows_in
+                counts[sum(1 for col in [1, 2]
+                        if rows[col] >= set([0, 1]))] += 1
+            expected = counts / len(samples) ** (N - 1)
+            pmf, _ = false_positive_distribution(N, 3, 1, 4, 2)
+
+            # The mean is exact, the binomial distribution an approximation
+            self.assertAlmostEqual(np.dot(expected, np.arange(3)),
+                    np.dot(pmf, np.arange(3)))
+            numpy.testing.assert_allclose(expected, pmf, atol=0.05)
+
+    def test_monte_carlo_entropy(self):
+        res1 = monte_carlo_entropy(16, 16, 3, 3, [1, 20], seed=5,
+                min_trials=8, max_trials=16, round_size=8, batch_size=4,
+                processes=1)
+        res2 = monte_carlo_entropy(16, 16, 3, 3, [1, 20], seed=5,
+                min_trials=8, max_trials=16, round_size=8, batch_size=4,
+                processes=2)
+        for key in res1:
+            numpy.testing.assert_equal(res1[key], res2[key])
+        self.assertTrue(8 <= res1["trials"] <= 16)
+
+        # A single sample is always recalled without errors
+        self.assertEqual(0.0, res1["fp_mean"][0])
+        self.assertAlmostEqual(float(lnncr(16, 3)) / math.log(2.0),
+                res1["info_mean"][0])
+        self.assertTrue(res1["info_ci_low"][1] <= res1["info_mean"][1]
+                <= res1["info_ci_high"][1])
+
+        res = monte_carlo_entropy(16, 16, 3, 3, 20, seed=5, min_trials=4,
+                max_trials=4, processes=1)
+        self.assertEqual(4, res["trials"])
+        self.assertTrue(isinstance(res["info_mean"], float))
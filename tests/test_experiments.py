@@ -17,6 +17,9 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import collections
+import os
+import pickle
+import tempfile
 import unittest
 
 import numpy as np
@@ -24,6 +27,7 @@ import numpy.testing
 
 from pynam.experiment import (ExperimentException, Experiment,
         ExperimentDescriptor, ExperimentSweep)
+from pynam.entropy import clear_optimal_parameter_table
 
 class TestExperimentDescriptor(unittest.TestCase):
 
@@ -65,6 +69,43 @@ class TestExperimentDescriptor(unittest.TestCase):
                 [ 3.,  9.,  6.],
                 [ 4.,  9.,  6.],])
 
+        # Consecutive empty sweeps are ignored
+        keys, vecs = ExperimentDescriptor.build_combinatorial_sweep_vectors(
+                collections.OrderedDict([("a", [1, 2]), ("b", []), ("c", []),
+                    ("d", [3])]))
+        self.assertEqual(keys, ["a", "d"])
+        numpy.testing.assert_equal(vecs, [[1., 3.], [2., 3.]])
+
+        keys, vecs = ExperimentDescriptor.build_combinatorial_sweep_vectors({})
+        self.assertEqual([], keys)
+        self.assertEqual((0, 0), vecs.shape)
+
+    def test_iter_combinatorial_sweep_vectors(self):
+        sweeps = collections.OrderedDict([
+            ("a", [1, 2, 3, 4]),
+            ("c", [7, 8, 9]),
+            ("b", [5, 6])
+        ])
+        _, expected = ExperimentDescriptor.build_combinatorial_sweep_vectors(
+                sweeps)
+        self.assertEqual(24,
+                ExperimentDescriptor.count_combinatorial_sweep_vectors(sweeps))
+
+        keys, vecs = ExperimentDescriptor.build_combinatorial_sweep_vectors(
+                sweeps, 5, 11)
+        self.assertEqual(keys, ["a", "c", "b"])
+        numpy.testing.assert_equal(expected[5:11], vecs)
+        numpy.testing.assert_equal(expected[20:],
+                ExperimentDescriptor.build_combinatorial_sweep_vectors(
+                        sweeps, 20, 100)[1])
+
+        rows = ExperimentDescriptor.iter_combinatorial_sweep_vectors(
+                sweeps, chunk_size=5)
+        numpy.testing.assert_equal(expected, list(rows))
+        rows = ExperimentDescriptor.iter_combinatorial_sweep_vectors(
+                sweeps, 3, 17, chunk_size=4)
+        numpy.testing.assert_equal(expected[3:17], list(rows))
+
     def test_validate_keys(self):
         Experiment.validate_keys(["input.sigma_t", "input.p0"])
         Experiment.validate_keys(["topology.w"])
@@ -159,3 +200,112 @@ class TestExperimentDescriptor(unittest.TestCase):
         self.assertEqual(topology_params[4]["data"]["n_ones_in"], 2)
         self.assertEqual(topology_params[5]["data"]["n_ones_in"], 2)
 
+
+class TestExperiment(unittest.TestCase):
+
+    SIMULATOR_INFO = {
+        "max_neuron_count": 64,
+        "concurrency": 1,
+        "sources_are_neurons": False,
+        "shared_parameters": []
+    }
+
+    def build(self, **simulator_info):
+        experiment = Experiment({
+            "data": {"n_bits_in": 8, "n_bits_out": 8, "n_ones_in": 2,
+                    "n_ones_out": 2, "n_samples": 5},
+            "experiments": [{"name": "test", "repeat": 4}]})
+        return experiment.build(dict(self.SIMULATOR_INFO, **simulator_info),
+                seed=1, processes=1)
+
+    def test_build_resource_limits(self):
+        pools = self.build()
+        self.assertEqual(1, len(pools))
+        self.assertEqual(32, pools[0].neuron_count())
+        synapses = pools[0].synapse_count() / 4
+
+        pools = self.build(max_synapse_count=2 * synapses + 1)
+        self.assertEqual([16, 16], [pool.neuron_count() for pool in pools])
+        self.assertEqual([2 * synapses] * 2,
+                [pool.synapse_count() for pool in pools])
+
+        pools = self.build(max_source_count=24)
+        self.assertEqual([24, 8], [pool.neuron_count() for pool in pools])
+
+        with self.assertRaises(ExperimentException):
+            self.build(max_fan_in=1)
+        with self.assertRaises(ExperimentException):
+            self.build(max_synapse_count=synapses - 1)
+
+    def test_build_iter(self):
+        experiment = Experiment({
+            "data": {"n_bits_in": 8, "n_bits_out": 8, "n_ones_in": 2,
+                    "n_ones_out": 2, "n_samples": 5},
+            "experiments": [{"name": "test", "repeat": 5}]})
+        simulator_info = dict(self.SIMULATOR_INFO, max_neuron_count=16)
+        pools = experiment.build_iter(simulator_info, seed=1, processes=1)
+        pool = next(pools)
+        self.assertEqual("test.0", pool["name"])
+        self.assertEqual(16, pool.neuron_count())
+
+        expected = experiment.build(simulator_info, seed=1, processes=1)
+        self.assertEqual(3, len(expected))
+        numpy.testing.assert_equal(dict(expected[0]), dict(pool))
+        for a, b in zip(expected[1:], pools):
+            numpy.testing.assert_equal(dict(a), dict(b))
+        self.assertEqual([], list(pools))
+
+    def test_build_data_sweep(self):
+        # Both pools contain a network of each sweep point, the data of each
+        # sweep point is the same in all pools
+        experiment = Experiment({
+            "data": {"n_bits_in": 8, "n_bits_out": 8, "n_ones_in": 2,
+                    "n_ones_out": 2, "n_samples": 5},
+            "experiments": [{"name": "test", "repeat": 2, "sweeps": {
+                "data.n_samples": {"min": 3, "max": 6, "count": 2}}}]})
+        simulator_info = dict(self.SIMULATOR_INFO, max_neuron_count=16)
+        pools = experiment.build(simulator_info, seed=1)
+        self.assertEqual(2, len(pools))
+        mats = {}
+        for pool in pools:
+            self.assertEqual([3, 6], sorted(d["n_samples"]
+                    for d in pool["data_params"]))
+            for d, mat_in in zip(pool["data_params"], pool["mat_in"]):
+                self.assertEqual((d["n_samples"], 8), mat_in.shape)
+                mats.setdefault(d["n_samples"], []).append(mat_in)
+        for mat_a, mat_b in mats.values():
+            numpy.testing.assert_equal(mat_a, mat_b)
+
+    def test_build_processes(self):
+        experiment = Experiment({
+            "data": {"n_bits_in": 8, "n_bits_out": 8, "n_ones_in": 2,
+                    "n_ones_out": 2, "n_samples": 5},
+            "topology": {"param_noise": {"cm": 0.01}, "sigma_w": 0.001},
+            "experiments": [{"name": "test", "repeat": 3, "sweeps": {
+                "topology.params.cm": {"min": 0.2, "max": 0.3, "count": 2}}}]})
+        simulator_info = dict(self.SIMULATOR_INFO, max_neuron_count=24)
+        expected = map(pickle.dumps,
+                experiment.build(simulator_info, seed=1, processes=1))
+        self.assertEqual(2, len(expected))
+        self.assertEqual(expected, map(pickle.dumps,
+                experiment.build(simulator_info, seed=1, processes=2)))
+
+    def test_build_parameter_table(self):
+        # The automatically chosen number of samples is looked up in the table
+        experiment = Experiment({
+            "data": {"n_bits_in": 8, "n_bits_out": 8, "n_ones_in": 2,
+                    "n_ones_out": 2, "n_samples": -1},
+            "experiments": [{"name": "test"}]})
+        fd, filename = tempfile.mkstemp(suffix=".npz")
+        os.close(fd)
+        try:
+            np.savez(filename, keys=np.array([[8, 8, 2, 2, -1]]),
+                    values=np.array([[2, 2, 7]]))
+            pools = experiment.build(self.SIMULATOR_INFO, seed=1,
+                    parameter_table=filename)
+        finally:
+            os.remove(filename)
+            clear_optimal_parameter_table()
+        self.assertEqual(7, experiment["data"]["n_samples"])
+        self.assertEqual([7], [d["n_samples"] for pool in pools
+                for d in pool["data_params"]])
@@ -18,11 +18,12 @@
 
 import unittest
 
+import pickle
 import numpy as np
 import numpy.testing
-from testfixtures import compare
+import pynnless as pynl
 
-from pynam.binam import BinaryMatrix
+from pynam.binam import BinaryMatrix, BiNAM
 from pynam.network import (
         InputParameters,
         TopologyParameters,
@@ -30,7 +31,11 @@ from pynam.network import (
         NetworkBuilder,
         NetworkInstance,
         NetworkPool,
-        NetworkAnalysis)
+        NetworkAnalysis,
+        connections_to_array,
+        connections_to_list,
+        expand_connections,
+        expand_parameters)
 
 #
 # Test utility functions
@@ -145,6 +150,83 @@ class TestInputParameters(unittest.TestCase):
         res = params.build_spike_train()
         numpy.testing.assert_equal([0.0, 4.0, 8.0], res)
 
+    def test_build_spike_trains(self):
+        params = InputParameters(burst_size=2, isi=4)
+        res = params.build_spike_trains([[1, 0], [0, 1]], offs=[10.0, 20.0])
+        numpy.testing.assert_equal([[[10.0, 14.0], [numpy.inf, numpy.inf]],
+                                    [[numpy.inf, numpy.inf], [20.0, 24.0]]],
+                                   res)
+
+        params = InputParameters(burst_size=3, p1=1.0)
+        res = params.build_spike_trains([0, 1])
+        numpy.testing.assert_equal([[0.0, 1.0, 2.0], [0.0, 1.0, 2.0]], res)
+
+        params = InputParameters(burst_size=4, sigma_t=2.0, p0=0.5)
+        res = params.build_spike_trains(numpy.ones(100),
+                                        rng=numpy.random.RandomState(1))
+        self.assertEqual((100, 4), res.shape)
+        numpy.testing.assert_equal(numpy.sort(res, axis=1), res)
+
+class TestTopologyParameters(unittest.TestCase):
+
+    def test_draw(self):
+        params = TopologyParameters(params={"cm": 0.2},
+                                    param_noise={"cm": 0.01})
+        res = params.draw(numpy.random.RandomState(1))
+        self.assertNotEqual(0.2, res["cm"])
+        self.assertFalse("key" in res)
+
+    def test_draw_population(self):
+        params = TopologyParameters(params={"cm": 0.2})
+        self.assertFalse(params.has_param_noise())
+        res = params.draw_population(3)
+        numpy.testing.assert_equal([0.2] * 3, res["cm"])
+        numpy.testing.assert_equal([20.0] * 3, res["tau_m"])
+
+        params = TopologyParameters(params={"cm": 0.2, "v_rest": -65.0},
+                param_noise={"cm": 1.0, "v_rest": 100.0})
+        self.assertTrue(params.has_param_noise())
+        res = params.draw_population(1000, numpy.random.RandomState(1))
+        self.assertEqual(1000, len(res["cm"]))
+        self.assertTrue(numpy.any(res["cm"] != 0.2))
+        numpy.testing.assert_equal([20.0] * 1000, res["tau_m"])
+
+    def test_draw_population_unclamped(self):
+        params = TopologyParameters(params={"cm": 0.2, "v_rest": -65.0},
+                param_noise={"cm": 1.0})
+        res = params.draw_population(1000, numpy.random.RandomState(1))
+        self.assertTrue(numpy.any(res["cm"] < 0.0))
+
+class TestExpandParameters(unittest.TestCase):
+
+    def test_expand_parameters(self):
+        # Clamping rule which is not separable into per-parameter bounds
+        def clamp_parameters(params):
+            res = dict(params)
+            res["cm"] = max(0.1, res["cm"])
+            res["v_thresh"] = max(res["v_rest"] + 1.0, res["v_thresh"])
+            return res
+
+        clamp_parameters_orig = pynl.PyNNLess.__dict__["clamp_parameters"]
+        pynl.PyNNLess.clamp_parameters = staticmethod(clamp_parameters)
+        try:
+            params = {"cm": numpy.array([0.2, -1.0]),
+                    "v_rest": numpy.array([-65.0, -40.0]),
+                    "v_thresh": numpy.array([-50.0, -50.0])}
+            res = expand_parameters(params)
+            self.assertEqual([
+                {"cm": 0.2, "v_rest": -65.0, "v_thresh": -50.0},
+                {"cm": 0.1, "v_rest": -40.0, "v_thresh": -39.0}], res)
+            self.assertEqual(-1.0, params["cm"][1])
+        finally:
+            pynl.PyNNLess.clamp_parameters = clamp_parameters_orig
+
+    def test_expand_parameters_unchanged(self):
+        params = {"cm": 0.2, "v_rest": -65.0}
+        self.assertIs(params, expand_parameters(params))
+        params = [{"cm": 0.2}, {"cm": 0.3}]
+        self.assertIs(params, expand_parameters(params))
+
 class TestNetworkBuilder(unittest.TestCase):
 
     def test_init_mat(self):
@@ -210,7 +292,8 @@ class TestNetworkBuilder(unittest.TestCase):
         mat_in, mat_out = test_data()
         net = NetworkBuilder(mat_in, mat_out)
         topo = net.build_topology(topology_params={"params": {"cm": 0.2}})
-        self.assertEqual(set(topo["connections"]), set([
+        self.assertEqual(
+            set(connections_to_list(expand_connections(topo))), set([
             ((0, 0), (1, 1), 0.03, 0.0),
             ((0, 0), (1, 4), 0.03, 0.0),
             ((0, 1), (1, 1), 0.03, 0.0),
@@ -223,26 +306,26 @@ class TestNetworkBuilder(unittest.TestCase):
             ((0, 3), (1, 1), 0.03, 0.0),
             ((0, 4), (1, 2), 0.03, 0.0),
             ((0, 4), (1, 3), 0.03, 0.0)]))
-        self.assertEqual(topo["populations"], [
+        numpy.testing.assert_equal(topo["populations"], [
                 {'count': 5,
                  'params': [{}] * 5,
                  'type': 'SpikeSourceArray',
                  'record': []
                 },
                 {'count': 5,
-                 'params': [{
-                    'tau_refrac': 0.1,
-                    'tau_m': 20.0,
-                    'e_rev_E': 0.0,
-                    'i_offset': 0.0,
-                    'cm': 0.2,
-                    'e_rev_I': -70.0,
-                    'v_thresh': -50.0,
-                    'tau_syn_E': 5.0,
-                    'v_rest': -65.0,
-                    'tau_syn_I': 5.0,
-                    'v_reset': -65.0
-                }] * 5,
+                 'params': {
+                    'tau_refrac': [0.1] * 5,
+                    'tau_m': [20.0] * 5,
+                    'e_rev_E': [0.0] * 5,
+                    'i_offset': [0.0] * 5,
+                    'cm': [0.2] * 5,
+                    'e_rev_I': [-70.0] * 5,
+                    'v_thresh': [-50.0] * 5,
+                    'tau_syn_E': [5.0] * 5,
+                    'v_rest': [-65.0] * 5,
+                    'tau_syn_I': [5.0] * 5,
+                    'v_reset': [-65.0] * 5
+                },
                 'record': ['spikes'],
                 'type': 'IF_cond_exp'
                 }
@@ -250,7 +333,8 @@ class TestNetworkBuilder(unittest.TestCase):
 
         net = NetworkBuilder(mat_in, mat_out)
         topo = net.build_topology(topology_params={"multiplicity": 2, "w": 0.1})
-        self.assertEqual(set(topo["connections"]), set([
+        self.assertEqual(
+            set(connections_to_list(expand_connections(topo))), set([
             ((0, 0), (1, 2), 0.1, 0.0),
             ((0, 0), (1, 3), 0.1, 0.0),
             ((0, 1), (1, 2), 0.1, 0.0),
@@ -300,6 +384,19 @@ class TestNetworkBuilder(unittest.TestCase):
             ((0, 9), (1, 6), 0.1, 0.0),
             ((0, 9), (1, 7), 0.1, 0.0)]))
 
+    def test_build_topology_weight_noise(self):
+        mat_in, mat_out = test_data()
+        net = NetworkBuilder(mat_in, mat_out)
+        topo = net.build_topology(seed=5,
+                topology_params={"multiplicity": 3, "sigma_w": 0.01})
+        self.assertEqual(0, len(topo["connections"]))
+        self.assertEqual(1, len(topo["projections"]))
+        connections = expand_connections(topo)
+        self.assertEqual(12 * 9, len(connections))
+        self.assertTrue(np.all(connections["weight"] >= 0.0))
+        self.assertTrue(np.any(connections["weight"] != 0.03))
+        np.testing.assert_equal(connections, expand_connections(topo))
+
     def test_build_input(self):
         mat_in, mat_out = test_data()
         net = NetworkBuilder(mat_in, mat_out)
@@ -361,12 +458,12 @@ class TestNetworkBuilder(unittest.TestCase):
         builder = NetworkBuilder(mat_in, mat_out)
         net = builder.build(topology_params={"params": {"cm": 0.2}})
         topo = {
-            "connections": net["connections"],
+            "connections": connections_to_list(expand_connections(net)),
             "populations": net["populations"]
         }
         times = net["input_times"]
         indices = net["input_indices"]
-        compare({'connections': [
+        numpy.testing.assert_equal({'connections': [
             ((0, 0), (1, 1), 0.03, 0.0),
             ((0, 0), (1, 4), 0.03, 0.0),
             ((0, 1), (1, 1), 0.03, 0.0),
@@ -392,11 +489,11 @@ class TestNetworkBuilder(unittest.TestCase):
                 'type': 'SpikeSourceArray'
                 },
                 {'count': 5,
-                'params': [
-                    {'tau_refrac': 0.1, 'tau_m': 20.0, 'e_rev_E': 0.0,
-                'i_offset': 0.0, 'cm': 0.2, 'e_rev_I': -70.0,
-                'v_thresh': -50.0, 'tau_syn_E': 5.0, 'v_rest': -65.0,
-                'tau_syn_I': 5.0, 'v_reset': -65.0}] * 5,
+                'params': dict((key, [value] * 5) for key, value in {
+                    'tau_refrac': 0.1, 'tau_m': 20.0, 'e_rev_E': 0.0,
+                    'i_offset': 0.0, 'cm': 0.2, 'e_rev_I': -70.0,
+                    'v_thresh': -50.0, 'tau_syn_E': 5.0, 'v_rest': -65.0,
+                    'tau_syn_I': 5.0, 'v_reset': -65.0}.items()),
                 'type': 'IF_cond_exp',
                 'record': ['spikes']}],
                 }, topo)
@@ -404,6 +501,60 @@ class TestNetworkBuilder(unittest.TestCase):
                 times)
         self.assertEqual([[1], [1], [0, 2], [2], [0]], indices)
 
+    def test_neuron_count_static(self):
+        data_params = {"n_bits_in": 6, "n_bits_out": 5, "n_ones_in": 2,
+                "n_ones_out": 2, "n_samples": 3}
+        topology_params = {"multiplicity": 3}
+        net = NetworkBuilder(data_params=data_params, seed=1).build(
+                topology_params=topology_params)
+        self.assertEqual(15, NetworkBuilder.neuron_count_static(data_params,
+                topology_params))
+        self.assertEqual(33, NetworkBuilder.neuron_count_static(data_params,
+                topology_params, True))
+        self.assertEqual(net.neuron_count(True),
+                NetworkBuilder.neuron_count_static(data_params,
+                        topology_params, True))
+
+    def test_train_binam(self):
+        builder = NetworkBuilder(data_params={"n_bits_in": 70,
+                "n_bits_out": 90, "n_ones_in": 4, "n_ones_out": 5,
+                "n_samples": 40}, seed=2)
+        mem = BiNAM().train_matrix(np.asarray(builder.mat_in),
+                np.asarray(builder.mat_out))
+        numpy.testing.assert_equal(mem.arr, builder.train_binam().arr)
+
+        mat_in, mat_out = test_data()
+        mem = BiNAM().train_matrix(mat_in.get(), mat_out.get())
+        numpy.testing.assert_equal(mem.arr,
+                NetworkBuilder(mat_in, mat_out).train_binam().arr)
+        numpy.testing.assert_equal(mem.arr,
+                NetworkBuilder(mat_in.get(), mat_out.get()).train_binam().arr)
+
+    def test_train_binam_cached(self):
+        mat_in, mat_out = test_data()
+        builder = NetworkBuilder(mat_in, mat_out)
+        mem = builder.train_binam()
+        self.assertIs(mem, builder.train_binam())
+
+        builder = NetworkBuilder(mat_in, mat_out, mem=mem)
+        self.assertIs(mem, builder.train_binam())
+        net = builder.build_topology(seed=1)
+        numpy.testing.assert_equal(mem.arr, net["projections"][0]["mask"])
+
+    def test_resource_usage(self):
+        mat_in, mat_out = test_data()
+        builder = NetworkBuilder(mat_in, mat_out)
+        for s in [1, 2]:
+            net = builder.build(topology_params={"multiplicity": s})
+            connections = expand_connections(net)
+            fan_in = np.bincount(connections["post_neuron"])
+            self.assertEqual({
+                "neurons": 5 * s,
+                "sources": 5 * s,
+                "synapses": len(connections),
+                "fan_in": np.max(fan_in)
+            }, builder.resource_usage({"multiplicity": s}))
+
 
 class TestNetworkInstance(unittest.TestCase):
 
@@ -431,6 +582,25 @@ class TestNetworkInstance(unittest.TestCase):
         self.assertEqual(15, net.neuron_count())
         self.assertEqual(30, net.neuron_count(count_sources=True))
 
+    def test_to_pynnless(self):
+        mat_in, mat_out = test_data()
+        builder = NetworkBuilder(mat_in, mat_out)
+        net = builder.build(topology_params={"multiplicity": 2})
+        self.assertEqual(0, len(net["connections"]))
+
+        res = net.to_pynnless()
+        self.assertFalse("projections" in res)
+        self.assertEqual(net.synapse_count(), len(res["connections"]))
+        self.assertEqual(((0, 0), (1, 2), 0.03, 0.0), res["connections"][0])
+        np.testing.assert_equal(expand_connections(net),
+                                connections_to_array(res["connections"]))
+        self.assertEqual(1, len(net["projections"]))
+        self.assertEqual(expand_parameters(net["populations"][1]["params"]),
+                         res["populations"][1]["params"])
+        self.assertEqual(10, len(res["populations"][1]["params"]))
+        self.assertTrue(isinstance(net["populations"][1]["params"]["cm"],
+                                   np.ndarray))
+
     def test_match_negative(self):
         input_times = [[100.0], [200.0], [300.0], [400.0]]
         input_indices = [[0], [1], [2], [3]]
@@ -450,6 +620,17 @@ class TestNetworkInstance(unittest.TestCase):
         self.assertEqual([[2.0, 3.0, 4.0], [3.0, 4.0], []], t1)
         self.assertEqual([[0, 1, 2], [1, 2], []], i1)
 
+    def test_split_all(self):
+        times = [[1.0, 2.0, 3.0, 4.0, 5.0], [3.0, 4.0, 5.0, 6.0], [7.0, 8.0, 9.0]]
+        indices = [[1, 2, 3, 4, 5], [3, 4, 5, 6], [7, 8, 9]]
+
+        parts = NetworkInstance.split_all(times, indices, [2, 5, 8])
+        self.assertEqual(3, len(parts))
+        self.assertEqual(([[1.0], [], []], [[1], [], []]), parts[0])
+        self.assertEqual(NetworkInstance.split(times, indices, 2, 5), parts[1])
+        self.assertEqual(([[5.0], [5.0, 6.0], [7.0]], [[0], [0, 1], [2]]),
+                parts[2])
+
     def test_build_analysis(self):
         mat_in, mat_out = test_data()
         builder = NetworkBuilder(mat_in, mat_out)
@@ -461,6 +642,23 @@ class TestNetworkInstance(unittest.TestCase):
 
 class TestNetworkPool(unittest.TestCase):
 
+    def test_counters(self):
+        builder = NetworkBuilder(data_params={"n_bits_in": 5, "n_bits_out": 5,
+                "n_ones_in": 2, "n_ones_out": 2, "n_samples": 3}, seed=1)
+        net1 = builder.build(topology_params={"multiplicity": 2})
+        net2 = builder.build()
+        pool = NetworkPool()
+        pool.add_network(net1)
+        pool.add_network(net2)
+        self.assertEqual(15, pool.neuron_count())
+        self.assertEqual(30, pool.neuron_count(True))
+        self.assertEqual(net1.synapse_count() + net2.synapse_count(),
+                pool.synapse_count())
+        self.assertEqual(len(pool.to_pynnless()["connections"]),
+                pool.synapse_count())
+        self.assertEqual(NetworkPool(pool).synapse_count(),
+                pool.synapse_count())
+
     def test_init_net_build_analysis(self):
         mat_in, mat_out = test_data()
         builder = NetworkBuilder(mat_in, mat_out)
@@ -485,6 +683,79 @@ class TestNetworkPool(unittest.TestCase):
         pool.add_network(builder.build(topology_params={"multiplicity": 3}))
         self.assertEqual(20, pool.neuron_count())
 
+    def test_add_net_connections(self):
+        mat_in, mat_out = test_data()
+        builder = NetworkBuilder(mat_in, mat_out)
+        pool = NetworkPool()
+        pool.add_network(builder.build())
+        pool.add_network(NetworkInstance(populations=[
+                    {"count": 2, "type": "SpikeSourceArray"},
+                    {"count": 3, "type": "IF_cond_exp"}],
+                connections=[((0, 1), (1, 2), 0.5, 1.0)]))
+        self.assertEqual(1, len(pool["connections"]))
+        self.assertEqual(1, len(pool["projections"]))
+        connections = pool.to_pynnless()["connections"]
+        self.assertEqual(13, len(connections))
+        self.assertEqual(((2, 1), (3, 2), 0.5, 1.0), connections[0])
+        self.assertEqual(((0, 0), (1, 1), 0.03, 0.0), connections[1])
+        np.testing.assert_equal(expand_connections(pool),
+                                connections_to_array(connections))
+
+    def test_finalize(self):
+        mat_in, mat_out = test_data()
+        builder = NetworkBuilder(mat_in, mat_out)
+        pool = NetworkPool()
+        for i in xrange(3):
+            net = builder.build()
+            net["connections"] = [((0, i), (1, i), 0.1, 0.0)]
+            pool.add_network(net)
+        self.assertEqual(6, len(pool["populations"]))
+        self.assertEqual([{"population": 2, "input": 5},
+                          {"population": 4, "input": 10},
+                          {"population": 6, "input": 15}],
+                         pool["spatial_split"])
+        self.assertEqual(15, pool["input_spikes"].n_neurons)
+        self.assertEqual([((0, 0), (1, 0), 0.1, 0.0),
+                          ((2, 1), (3, 1), 0.1, 0.0),
+                          ((4, 2), (5, 2), 0.1, 0.0)],
+                         connections_to_list(pool["connections"]))
+        self.assertEqual([0, 2, 4], [p["pre"] for p in pool["projections"]])
+
+        pool.add_network(builder.build())
+        self.assertEqual(20, pickle.loads(pickle.dumps(pool))[
+                "input_spikes"].n_neurons)
+
+    def test_finalize_accessors(self):
+        mat_in, mat_out = test_data()
+        builder = NetworkBuilder(mat_in, mat_out)
+
+        def build_pool():
+            pool = NetworkPool()
+            for i in xrange(2):
+                net = builder.build()
+                net["connections"] = [((0, i), (1, i), 0.1, 0.0)]
+                pool.add_network(net)
+            return pool
+
+        expected = [((0, 0), (1, 0), 0.1, 0.0), ((2, 1), (3, 1), 0.1, 0.0)]
+        self.assertEqual(expected,
+                connections_to_list(build_pool().get("connections")))
+        self.assertEqual(10, build_pool().get("input_spikes").n_neurons)
+        self.assertEqual(expected, connections_to_list(
+                dict(build_pool().items())["connections"]))
+        self.assertEqual(expected, connections_to_list(
+                dict(build_pool().iteritems())["connections"]))
+        self.assertEqual(expected, connections_to_list(
+                build_pool().copy()["connections"]))
+        self.assertEqual(expected,
+                connections_to_list(build_pool().pop("connections")))
+        self.assertTrue(any(isinstance(value, np.ndarray) and
+                len(value) == 2 for value in build_pool().values()))
+
+        # dict() bypasses the accessors, the pool must be finalised before
+        self.assertEqual(expected, connections_to_list(
+                dict(build_pool().finalize())["connections"]))
+
     def test_add_nets_build_analysis(self):
         mat_in, mat_out = test_data()
         builder = NetworkBuilder(mat_in, mat_out)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+#   PyNAM -- Python Neural Associative Memory Simulator and Evaluator
+#   Copyright (C) 2015 Andreas Stöckel
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from pynam.packing import PoolPlanner, shared_key
+
+class TestPoolPlanner(unittest.TestCase):
+
+    def test_plan(self):
+        # Placing these networks in the given order into the emptiest pool
+        # requires three pools, sorting them by decreasing size only two
+        planner = PoolPlanner(10)
+        sizes = [2, 2, 2, 2, 6, 6]
+        self.assertEqual([[0, 1, 4], [2, 3, 5]], planner.plan(sizes))
+        self.assertEqual([1.0, 1.0], planner.utilisation(sizes,
+                planner.plan(sizes)))
+
+        # The fullest pool with enough space left is chosen
+        self.assertEqual([[0, 2], [1, 3]], planner.plan([6, 5, 4, 3]))
+        self.assertEqual([], planner.plan([]))
+
+    def test_reserved_pools(self):
+        planner = PoolPlanner(10, 3)
+        self.assertEqual([[1, 3], [2], [0]], planner.plan([2, 5, 4, 2]))
+        self.assertEqual([[0], [], []], planner.plan([2]))
+        self.assertEqual([0.2], planner.utilisation([2], [[0], [], []]))
+
+    def test_oversized(self):
+        planner = PoolPlanner(8, 1)
+        self.assertEqual([[0, 2], [1]], planner.plan([4, 10, 4]))
+
+    def test_shared_keys(self):
+        planner = PoolPlanner(10)
+        self.assertEqual([[0, 2], [1, 3]],
+                planner.plan([3, 3, 3, 3], [0.2, 0.3, 0.2, 0.3]))
+        self.assertEqual((0.2, None), shared_key({"cm": 0.2}, ["cm", "tau_m"]))
+
+    def test_capacity_vector(self):
+        # Three networks fit by neurons, but only two by synapses
+        planner = PoolPlanner([10, 100])
+        sizes = [[3, 50], [3, 40], [3, 30]]
+        self.assertEqual([[0, 1], [2]], planner.plan(sizes))
+        self.assertEqual([0.9, 0.3], planner.utilisation(sizes,
+                planner.plan(sizes)))
+
+        # The dominant share determines the order and the fullest pool
+        self.assertEqual([[0, 1, 2], [3]], planner.plan(
+                [[6, 0], [0, 60], [4, 0], [0, 50]]))
+
+        # Unlimited dimensions are ignored
+        planner = PoolPlanner([10, float("inf")])
+        self.assertEqual([[0, 1, 2]], planner.plan(sizes))
+
+        # Oversized networks are placed first and get a pool of their own
+        self.assertEqual([[1], [0]], planner.plan([[4, 0], [11, 0]],
+                [0, 0]))
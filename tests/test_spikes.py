@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+#   PyNAM -- Python Neural Associative Memory Simulator and Evaluator
+#   Copyright (C) 2015 Andreas Stöckel
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+import numpy as np
+from pynam.spikes import SpikeTable
+
+times = [[1.0, 2.0], [], [3.0, 0.5, 4.0], [5.0]]
+samples = [[0, 1], [], [1, 0, 2], [2]]
+
+class TestSpikeTable(unittest.TestCase):
+
+    def test_from_ragged(self):
+        table = SpikeTable.from_ragged(times, samples)
+        self.assertEqual(4, table.n_neurons)
+        self.assertEqual(6, len(table))
+        self.assertEqual([2, 0, 3, 1], table.counts().tolist())
+        self.assertEqual([0, 0, 2, 2, 2, 3], table.neurons.tolist())
+        self.assertEqual((times, samples), table.to_ragged())
+
+        table = SpikeTable.from_ragged(times)
+        self.assertEqual([0] * 6, table.samples.tolist())
+
+        table = SpikeTable.from_ragged([[], []])
+        self.assertEqual(2, table.n_neurons)
+        self.assertEqual(([[], []], [[], []]), table.to_ragged())
+
+    def test_init(self):
+        table = SpikeTable(times=[3.0, 1.0, 0.5, 2.0, 5.0, 4.0],
+                neurons=[2, 0, 2, 0, 3, 2], samples=[1, 0, 0, 1, 2, 2])
+        self.assertEqual(SpikeTable.from_ragged(times, samples), table)
+
+        table = SpikeTable(times=[1.0], neurons=[0], n_neurons=3)
+        self.assertEqual(([[1.0], [], []], [[0], [], []]), table.to_ragged())
+
+        with self.assertRaises(Exception):
+            SpikeTable(times=[1.0, 2.0], neurons=[0])
+        with self.assertRaises(Exception):
+            SpikeTable(times=[1.0], neurons=[2], n_neurons=2)
+
+    def test_neuron_range(self):
+        table = SpikeTable.from_ragged(times, samples)
+        self.assertEqual(([[], [3.0, 0.5, 4.0]], [[], [1, 0, 2]]),
+                table.neuron_range(1, 3).to_ragged())
+        self.assertEqual(([], []), table.neuron_range(2, 2).to_ragged())
+        self.assertEqual(([[5.0]], [[2]]), table.neuron_range(3, 10).to_ragged())
+
+    def test_sample_range(self):
+        table = SpikeTable.from_ragged(times, samples)
+        self.assertEqual(([[2.0], [], [3.0], []], [[0], [], [0], []]),
+                table.sample_range(1, 2).to_ragged())
+        self.assertEqual(([[2.0], [], [3.0], []], [[1], [], [1], []]),
+                table.sample_range(1, 2, relative=False).to_ragged())
+
+    def test_split_samples(self):
+        table = SpikeTable.from_ragged(times, samples)
+        parts = table.split_samples([1, 3])
+        self.assertEqual(2, len(parts))
+        self.assertEqual(([[1.0], [], [0.5], []], [[0], [], [0], []]),
+                parts[0].to_ragged())
+        self.assertEqual(([[2.0], [], [3.0, 4.0], [5.0]],
+                [[0], [], [0, 1], [1]]), parts[1].to_ragged())
+
+    def test_flatten(self):
+        table = SpikeTable.from_ragged(times, samples)
+        t, k, n = table.flatten()
+        self.assertEqual([0.5, 1.0, 2.0, 3.0, 4.0, 5.0], t.tolist())
+        self.assertEqual([0, 0, 1, 1, 2, 2], k.tolist())
+        self.assertEqual([2, 0, 0, 2, 2, 3], n.tolist())
+
+        table = SpikeTable.from_ragged([[1.0, 2.0], [1.0]], [[1, 2], [0]])
+        t, k, n = table.flatten(sort_by_sample=True)
+        self.assertEqual([1.0, 1.0, 2.0], t.tolist())
+        self.assertEqual([0, 1, 2], k.tolist())
+        self.assertEqual([1, 0, 0], n.tolist())
+
+        table = SpikeTable.from_ragged(times).with_samples([0, 1, 2, 3, 4, 5])
+        self.assertEqual([3, 0, 1, 2, 4, 5], table.flatten()[1].tolist())
+
+    def test_concatenate(self):
+        a = SpikeTable.from_ragged(times[:2], samples[:2])
+        b = SpikeTable.from_ragged(times[2:], samples[2:])
+        self.assertEqual(SpikeTable.from_ragged(times, samples),
+                SpikeTable.concatenate([a, b]))
+        self.assertEqual(0, SpikeTable.concatenate([]).n_neurons)
+